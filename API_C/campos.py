@@ -0,0 +1,184 @@
+"""
+Campos a demanda en los ModelSerializers: ?fields=, ?omit= y ?expand=.
+
+    ?fields=id,nombre        solo esos campos
+    ?omit=calificaciones     todos menos esos
+    ?expand=software         reemplaza el id por el objeto (Meta.expandibles)
+
+Solo aplica al serializer raíz de una lectura (GET/HEAD); los serializers anidados y las
+escrituras no cambian. Con ?fields=/?omit= la vista (CamposDinamicosViewMixin) además
+reduce la consulta: only() con las columnas que leen los campos pedidos, y quita los
+select_related/prefetch_related que ningún campo pedido usa.
+
+Las columnas de cada campo se deducen de su `source`. Los campos que no se pueden deducir
+(SerializerMethodField, propiedades del modelo) se declaran en Meta.dependencias
+({'campo': ['lookup', ...]}); si falta alguno, la consulta se deja como está.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .metricas import medir_serializacion
+
+
+def _lista(valor):
+    return [nombre.strip() for nombre in (valor or '').split(',') if nombre.strip()]
+
+
+class CampoNoDeducible(Exception):
+    """Un campo pedido no permite saber qué columnas lee"""
+
+
+class CamposDinamicosMixin:
+    """
+    Mixin para ModelSerializer. Meta.expandibles = {'campo': 'ruta.al.Serializer'} o
+    {'campo': ('ruta.al.Serializer', {kwargs})}; Meta.dependencias según el módulo.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.campos_restringidos = False
+        self.campos_expandidos = []
+
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        parametros = getattr(request, 'query_params', request.GET)
+        campos = _lista(parametros.get('fields'))
+        omitir = _lista(parametros.get('omit'))
+        expandibles = getattr(self.Meta, 'expandibles', {})
+        expandir = [nombre for nombre in _lista(parametros.get('expand')) if nombre in expandibles]
+
+        for nombre in expandir:
+            ruta, opciones = expandibles[nombre], {}
+            if isinstance(ruta, tuple):
+                ruta, opciones = ruta
+            self.fields[nombre] = import_string(ruta)(read_only=True, **opciones)
+        if campos:
+            for nombre in set(self.fields) - set(campos) - set(expandir):
+                self.fields.pop(nombre)
+        for nombre in omitir:
+            self.fields.pop(nombre, None)
+
+        self.campos_restringidos = bool(campos or omitir)
+        self.campos_expandidos = expandir
+
+    def to_representation(self, instance):
+        # Tiempo de serialización de la petición para las métricas por endpoint
+        with medir_serializacion():
+            return super().to_representation(instance)
+
+
+class Requisitos:
+    """Columnas (only), select_related y prefetch_related que necesitan los campos pedidos"""
+
+    def __init__(self):
+        self.campos, self.select, self.prefetch = set(), set(), set()
+
+    def agregar(self, modelo, ruta, anotaciones, objeto_completo=False):
+        partes = ruta.split('__')
+        if partes[0] in anotaciones:
+            return
+        actual, recorrido = modelo, []
+        for indice, parte in enumerate(partes):
+            try:
+                campo = actual._meta.get_field(parte)
+            except FieldDoesNotExist:
+                if recorrido:
+                    # Método o propiedad de un objeto relacionado: se carga completo
+                    self.campos.add('__'.join(recorrido))
+                    return
+                raise CampoNoDeducible(ruta)
+            if campo.one_to_many or campo.many_to_many:
+                self.prefetch.add('__'.join(recorrido + [parte]))
+                return
+            if not campo.concrete:
+                raise CampoNoDeducible(ruta)
+            recorrido.append(parte)
+            if not campo.is_relation or indice == len(partes) - 1:
+                break
+            self.select.add('__'.join(recorrido))
+            actual = campo.related_model
+        self.campos.add('__'.join(recorrido))
+        if objeto_completo and campo.is_relation:
+            # Serializer anidado sobre una FK: el objeto relacionado en la misma consulta
+            self.select.add('__'.join(recorrido))
+
+
+def requisitos_serializer(serializer, queryset):
+    """Requisitos de los campos del serializer; lanza CampoNoDeducible si alguno no se deduce"""
+    requisitos = Requisitos()
+    dependencias = getattr(serializer.Meta, 'dependencias', {})
+    anotaciones = queryset.query.annotations
+    for nombre, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if nombre in dependencias:
+            rutas = dependencias[nombre]
+        elif campo.source == '*':
+            raise CampoNoDeducible(nombre)
+        else:
+            rutas = [campo.source.replace('.', '__')]
+        anidado = isinstance(campo, serializers.BaseSerializer)
+        for ruta in rutas:
+            requisitos.agregar(queryset.model, ruta, anotaciones, objeto_completo=anidado)
+    return requisitos
+
+
+def _raiz_prefetch(lookup):
+    ruta = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+    return ruta.split('__')[0]
+
+
+def restringir_queryset(queryset, serializer, campos_extra=()):
+    """
+    Ajusta el queryset a los campos que el serializer va a devolver. `campos_extra`: columnas
+    que la vista lee además de las del serializer (p. ej. las del cursor de paginación).
+    """
+    if not isinstance(serializer, CamposDinamicosMixin):
+        return queryset
+    if not (serializer.campos_restringidos or serializer.campos_expandidos):
+        return queryset
+    try:
+        requisitos = requisitos_serializer(serializer, queryset)
+        for ruta in campos_extra:
+            requisitos.agregar(queryset.model, ruta, queryset.query.annotations)
+    except CampoNoDeducible:
+        return queryset
+
+    if not serializer.campos_restringidos:
+        # Solo ?expand=: se agregan las relaciones de los objetos expandidos
+        if requisitos.select:
+            queryset = queryset.select_related(*requisitos.select)
+        return queryset
+
+    raices = {ruta.split('__')[0] for ruta in requisitos.prefetch}
+    prefetch = [lookup for lookup in queryset._prefetch_related_lookups if _raiz_prefetch(lookup) in raices]
+    cubiertas = {_raiz_prefetch(lookup) for lookup in prefetch}
+    prefetch += [ruta for ruta in requisitos.prefetch if ruta.split('__')[0] not in cubiertas]
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if requisitos.select:
+        queryset = queryset.select_related(*requisitos.select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(queryset.model._meta.pk.name, *requisitos.campos)
+
+
+class CamposDinamicosViewMixin:
+    """
+    Mixin para vistas genéricas: aplica restringir_queryset() en las lecturas. Se engancha en
+    filter_queryset() (lo usan list, retrieve y get_object).
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        # Columnas que la vista lee por su cuenta: el cursor y la fecha de los validadores HTTP
+        campos_vista = [campo.lstrip('-') for campo in getattr(self, 'ordering_cursor', None) or []]
+        if getattr(self, 'campo_modificacion', None):
+            campos_vista.append(self.campo_modificacion)
+        return restringir_queryset(queryset, self.get_serializer(), campos_vista)
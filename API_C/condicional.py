@@ -0,0 +1,175 @@
+"""
+Peticiones condicionales (ETag / Last-Modified) para los recursos principales.
+
+Los validadores salen de la columna de modificación de la vista (`campo_modificacion`)
+con una consulta de agregación, antes de serializar nada:
+
+    detalle  ETag fuerte "(modelo, pk, fecha, ?fields/?omit/?expand)" y Last-Modified =
+             fecha; cada representación (campos pedidos) tiene su propio ETag
+    listado  ETag débil de (URL con filtros, usuario, MAX(fecha), COUNT) sobre el
+             queryset ya filtrado; el COUNT detecta las eliminaciones, que no mueven el MAX
+
+Si el cliente ya tiene esa versión (If-None-Match / If-Modified-Since) se responde 304
+sin serializar. Sin esas cabeceras el detalle toma los validadores del objeto que ya
+cargó (la vista lee `campo_modificacion` aunque ?fields= no lo pida). Los listados no
+envían Last-Modified: una eliminación no cambia la fecha máxima y un cliente que solo
+mande If-Modified-Since recibiría 304 con datos viejos.
+
+En las escrituras sobre el detalle (PUT, PATCH, DELETE y las acciones propias que pasan
+por _escritura_condicional) If-Match / If-Unmodified-Since evitan pisar cambios ajenos:
+si el recurso cambió se responde 412. El ETag de If-Match debe ser el de la misma
+representación (mismos ?fields=, ?omit= y ?expand=) que pide la escritura.
+"""
+import hashlib
+from functools import partial
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+CABECERAS_LECTURA = ('If-None-Match', 'If-Modified-Since')
+CABECERAS_ESCRITURA = ('If-Match', 'If-Unmodified-Since')
+# Parámetros que cambian el cuerpo del detalle (CamposDinamicosMixin)
+PARAMETROS_REPRESENTACION = ('fields', 'omit', 'expand')
+
+
+def _firma(*partes):
+    return hashlib.sha1('|'.join(str(parte) for parte in partes).encode()).hexdigest()[:32]
+
+
+def marca_tiempo(fecha):
+    """Segundos desde epoch de una fecha (las naive están en la zona horaria del proyecto)"""
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return int(fecha.timestamp())
+
+
+class Validadores:
+    """ETag y fecha de modificación (opcional) de un recurso"""
+
+    def __init__(self, etag, modificado=None):
+        self.etag = etag
+        self.modificado = modificado
+
+    def condicion(self, request):
+        """Respuesta 304/412 si las cabeceras condicionales de la petición lo piden, o None"""
+        return get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=marca_tiempo(self.modificado) if self.modificado else None,
+        )
+
+    def aplicar(self, respuesta):
+        respuesta['ETag'] = self.etag
+        if self.modificado:
+            respuesta['Last-Modified'] = http_date(marca_tiempo(self.modificado))
+        return respuesta
+
+
+def precondicion_fallida():
+    return Response(
+        {'detail': 'El recurso cambió desde la versión indicada.'},
+        status=status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
+class ConsultaCondicionalMixin:
+    """
+    Mixin para vistas genéricas/viewsets. `campo_modificacion`: columna auto_now del modelo.
+    Las acciones propias con listados pueden usar validadores_listado() y responder_condicional().
+    """
+    campo_modificacion = None
+
+    # --- Validadores ---
+
+    def validadores_listado(self, queryset):
+        """Validadores de un listado a partir de su queryset filtrado (sin paginar)"""
+        datos = queryset.order_by().aggregate(ultima=Max(self.campo_modificacion), total=Count('pk'))
+        request = self.request
+        etag = _firma(
+            request.get_full_path(),
+            request.user.pk,
+            getattr(request, 'accepted_renderer', None) and request.accepted_renderer.format,
+            datos['ultima'].isoformat() if datos['ultima'] else '',
+            datos['total'],
+        )
+        return Validadores(f'W/"{etag}"')
+
+    def _validadores(self, modelo, pk, modificado):
+        if modificado is None:
+            return None
+        parametros = self.request.query_params
+        representacion = [parametros.get(parametro, '') for parametro in PARAMETROS_REPRESENTACION]
+        etag = _firma(modelo._meta.label, pk, modificado.isoformat(), *representacion)
+        return Validadores(f'"{etag}"', modificado)
+
+    def validadores_objeto(self):
+        """Validadores del objeto del detalle (una consulta), o None si no existe o no tiene fecha"""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        fila = (
+            queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .order_by().values_list('pk', self.campo_modificacion)[:1]
+        )
+        return self._validadores(queryset.model, *fila[0]) if fila else None
+
+    def get_object(self):
+        self.objeto_condicional = super().get_object()
+        return self.objeto_condicional
+
+    def _aplicar_validadores_objeto(self, respuesta):
+        """Validadores del objeto que cargó (y quizá modificó) la acción, sin consultar"""
+        objeto = getattr(self, 'objeto_condicional', None)
+        if objeto is not None and status.is_success(respuesta.status_code):
+            validadores = self._validadores(type(objeto), objeto.pk, getattr(objeto, self.campo_modificacion))
+            if validadores is not None:
+                validadores.aplicar(respuesta)
+        return respuesta
+
+    def responder_condicional(self, validadores, generar):
+        """304/412 si corresponde; si no, la respuesta de `generar()` con los validadores"""
+        condicion = validadores.condicion(self.request)
+        if condicion is not None:
+            if condicion.status_code == status.HTTP_412_PRECONDITION_FAILED:
+                return precondicion_fallida()
+            return validadores.aplicar(condicion)
+        respuesta = generar()
+        if status.is_success(respuesta.status_code):
+            validadores.aplicar(respuesta)
+        return respuesta
+
+    # --- Lecturas ---
+
+    def list(self, request, *args, **kwargs):
+        validadores = self.validadores_listado(self.filter_queryset(self.get_queryset()))
+        return self.responder_condicional(validadores, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not any(cabecera in request.headers for cabecera in CABECERAS_LECTURA):
+            return self._aplicar_validadores_objeto(super().retrieve(request, *args, **kwargs))
+        validadores = self.validadores_objeto()
+        if validadores is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.responder_condicional(validadores, partial(super().retrieve, request, *args, **kwargs))
+
+    # --- Escrituras ---
+
+    def _escritura_condicional(self, request, escribir):
+        if any(cabecera in request.headers for cabecera in CABECERAS_ESCRITURA):
+            validadores = self.validadores_objeto()
+            if validadores is not None and validadores.condicion(request) is not None:
+                return precondicion_fallida()
+        respuesta = escribir()
+        if request.method == 'DELETE':
+            return respuesta
+        # Con el ETag nuevo el cliente puede encadenar la siguiente escritura
+        return self._aplicar_validadores_objeto(respuesta)
+
+    def update(self, request, *args, **kwargs):
+        return self._escritura_condicional(request, partial(super().update, request, *args, **kwargs))
+
+    def destroy(self, request, *args, **kwargs):
+        return self._escritura_condicional(request, partial(super().destroy, request, *args, **kwargs))
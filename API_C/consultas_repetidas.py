@@ -0,0 +1,169 @@
+"""
+Detector de N+1 para desarrollo y pruebas.
+
+Durante cada petición (ConsultasRepetidasMiddleware) o bloque (vigilar()) se cuenta cada
+consulta por su huella: el SQL con los parámetros, números, cadenas y listas IN
+normalizados. Una huella que se ejecuta más de N_MAS_UNO_UMBRAL veces es un N+1; se
+informa con el origen tomado de la pila en la ejecución N+1:
+
+    campo     el campo del serializer que se estaba representando
+              (Serializer.campo) o la columna de list_display del admin
+    línea     el primer marco del proyecto (vistas, serializers, modelos, admin), con
+              archivo, número y Clase.método
+
+Modos (N_MAS_UNO_MODO): 'off' no instala nada, 'log' registra WARNING en el logger
+API_C.consultas_repetidas y 'error' lanza ConsultasRepetidas. Las pruebas corren en
+'error' (DetectorTestRunner), de modo que un N+1 nuevo hace fallar la prueba que lo
+ejecuta. Los conocidos se aceptan con N_MAS_UNO_PERMITIDOS (textos que aparecen en el
+origen o en la huella).
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+logger = logging.getLogger(__name__)
+
+
+class _Configuracion:
+    modo = getattr(settings, 'N_MAS_UNO_MODO', 'off')
+    umbral = getattr(settings, 'N_MAS_UNO_UMBRAL', 5)
+    permitidos = list(getattr(settings, 'N_MAS_UNO_PERMITIDOS', []))
+
+
+configuracion = _Configuracion()
+
+_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_MARCADORES = re.compile(r'%s|\?')
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+_CONTROL = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+_DIRECTORIO_PROYECTO = str(settings.BASE_DIR) + os.sep
+_DIRECTORIO_INFRAESTRUCTURA = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def huella(sql):
+    """SQL normalizado: misma huella para la misma consulta con otros valores"""
+    sql = _CADENAS.sub('?', sql)
+    sql = _MARCADORES.sub('?', sql)
+    sql = _NUMEROS.sub('?', sql)
+    sql = _LISTAS.sub('(?)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def _es_del_proyecto(archivo):
+    # El código de API_C (métricas, campos, este módulo) envuelve a todos: no es el origen
+    return (
+        archivo.startswith(_DIRECTORIO_PROYECTO)
+        and 'site-packages' not in archivo
+        and not archivo.startswith(_DIRECTORIO_INFRAESTRUCTURA)
+    )
+
+
+def origen(marco):
+    """'campo — línea' desde la pila de la consulta (ver el módulo)"""
+    campo = linea = None
+    while marco is not None and not (campo and linea):
+        codigo = marco.f_code
+        if campo is None and codigo.co_name == 'to_representation' and 'field' in marco.f_locals:
+            serializer_campo = marco.f_locals['field']
+            if getattr(serializer_campo, 'parent', None) is not None:
+                campo = f'{type(serializer_campo.parent).__name__}.{serializer_campo.field_name}'
+        elif campo is None and codigo.co_name == 'items_for_result' and 'field_name' in marco.f_locals:
+            modelo_admin = type(marco.f_locals['cl'].model_admin).__name__
+            campo = f"{modelo_admin}.list_display['{marco.f_locals['field_name']}']"
+        if linea is None and _es_del_proyecto(codigo.co_filename):
+            archivo = os.path.relpath(codigo.co_filename, _DIRECTORIO_PROYECTO)
+            linea = f"{archivo}:{marco.f_lineno} en {getattr(codigo, 'co_qualname', codigo.co_name)}()"
+        marco = marco.f_back
+    return ' — '.join(parte for parte in (campo, linea) if parte) or 'origen desconocido'
+
+
+class ConsultasRepetidas(AssertionError):
+    """Una o más consultas se repitieron más veces que el umbral"""
+
+    def __init__(self, contexto, repeticiones):
+        self.repeticiones = repeticiones
+        detalle = '\n'.join(
+            f'  {veces} veces: {sql[:200]}\n    desde {desde}' for sql, veces, desde in repeticiones
+        )
+        super().__init__(f'N+1 en {contexto}:\n{detalle}')
+
+
+class Detector:
+    """execute_wrapper que cuenta huellas y guarda el origen de las que pasan el umbral"""
+
+    def __init__(self, umbral):
+        self.umbral = umbral
+        self.conteo = Counter()
+        self.origenes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(_CONTROL):
+            clave = huella(sql)
+            self.conteo[clave] += 1
+            if self.conteo[clave] == self.umbral + 1:
+                self.origenes[clave] = origen(sys._getframe(1))
+        return execute(sql, params, many, context)
+
+    def repeticiones(self):
+        """[(huella, veces, origen)] de las huellas sobre el umbral que no están permitidas"""
+        return [
+            (clave, self.conteo[clave], desde)
+            for clave, desde in self.origenes.items()
+            if not any(permitido in desde or permitido in clave for permitido in configuracion.permitidos)
+        ]
+
+
+@contextmanager
+def vigilar(contexto='bloque', umbral=None, modo=None):
+    """Cuenta las consultas del bloque; informa según el modo ('log' o 'error') al salir"""
+    modo = modo or configuracion.modo
+    if modo == 'off':
+        yield None
+        return
+    detector = Detector(umbral if umbral is not None else configuracion.umbral)
+    with ExitStack() as pila:
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(detector))
+        yield detector
+    repeticiones = detector.repeticiones()
+    if not repeticiones:
+        return
+    if modo == 'error':
+        raise ConsultasRepetidas(contexto, repeticiones)
+    logger.warning(str(ConsultasRepetidas(contexto, repeticiones)))
+
+
+class ConsultasRepetidasMiddleware:
+    """Vigila cada petición con el modo configurado ('off' la deja pasar sin costo)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if configuracion.modo == 'off':
+            return self.get_response(request)
+        with vigilar(f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+
+class DetectorTestRunner(DiscoverRunner):
+    """Corre las pruebas con el detector en modo 'error' (N_MAS_UNO_MODO_PRUEBAS)"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._modo_anterior = configuracion.modo
+        configuracion.modo = getattr(settings, 'N_MAS_UNO_MODO_PRUEBAS', 'error')
+
+    def teardown_test_environment(self, **kwargs):
+        configuracion.modo = self._modo_anterior
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,201 @@
+"""
+Métricas por endpoint: consultas, tiempo en base de datos, serialización y bytes.
+
+MetricasMiddleware mide una fracción de las peticiones (METRICAS_MUESTREO); las demás
+pasan sin ningún costo. En las medidas:
+
+    consultas / db_ms     execute_wrapper en cada conexión (cuenta y cronometra cada SQL)
+    serializacion_ms      to_representation de los serializers raíz (CamposDinamicosMixin)
+                          más el render de la respuesta
+    total_ms / bytes      la petición completa y el cuerpo de la respuesta
+
+Las muestras se agrupan por "MÉTODO nombre-de-url" (las últimas METRICAS_VENTANA de cada
+una, en memoria del proceso) y MetricasView publica sus percentiles. Una petición que
+excede su presupuesto se registra en el logger API_C.metricas con WARNING; los
+presupuestos (METRICAS_PRESUPUESTOS) se buscan por "MÉTODO nombre", luego por "nombre" y
+si no hay ninguno se usa METRICAS_PRESUPUESTO_PREDETERMINADO.
+"""
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+MUESTREO = getattr(settings, 'METRICAS_MUESTREO', 0.1)
+VENTANA = getattr(settings, 'METRICAS_VENTANA', 500)
+PRESUPUESTOS = getattr(settings, 'METRICAS_PRESUPUESTOS', {})
+PRESUPUESTO_PREDETERMINADO = getattr(settings, 'METRICAS_PRESUPUESTO_PREDETERMINADO', {})
+
+METRICAS = ['consultas', 'db_ms', 'serializacion_ms', 'total_ms', 'bytes']
+PERCENTILES = [50, 90, 99]
+
+_medicion = contextvars.ContextVar('medicion_peticion', default=None)
+_muestras = defaultdict(lambda: deque(maxlen=VENTANA))
+_excedidas = defaultdict(int)
+_candado = threading.Lock()
+
+
+class Medicion:
+    """Acumuladores de una petición medida"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.db = 0.0
+        self.serializacion = 0.0
+        self.profundidad_serializacion = 0
+        self.inicio_render = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: se llama en cada consulta de la petición
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+@contextmanager
+def medir_serializacion():
+    """Suma al tiempo de serialización de la petición medida (si la hay); no anida"""
+    medicion = _medicion.get()
+    if medicion is None or medicion.profundidad_serializacion:
+        yield
+        return
+    medicion.profundidad_serializacion += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.serializacion += time.perf_counter() - inicio
+        medicion.profundidad_serializacion -= 1
+
+
+def presupuesto(clave, nombre):
+    return PRESUPUESTOS.get(clave) or PRESUPUESTOS.get(nombre) or PRESUPUESTO_PREDETERMINADO
+
+
+def registrar(clave, nombre, valores):
+    """Guarda la muestra y avisa si excede el presupuesto del endpoint"""
+    excesos = {
+        metrica: (valores[metrica], limite)
+        for metrica, limite in presupuesto(clave, nombre).items()
+        if valores.get(metrica) is not None and valores[metrica] > limite
+    }
+    with _candado:
+        _muestras[clave].append(valores)
+        if excesos:
+            _excedidas[clave] += 1
+    if excesos:
+        logger.warning(
+            'Presupuesto excedido en %s: %s', clave,
+            ', '.join(f'{metrica}={valor} (límite {limite})' for metrica, (valor, limite) in excesos.items()),
+            extra={'endpoint': clave, 'metricas': valores},
+        )
+
+
+def percentil(ordenados, p):
+    """Percentil p (rango más cercano) de una lista ordenada"""
+    indice = max(0, -(-len(ordenados) * p // 100) - 1)
+    return ordenados[indice]
+
+
+def resumen():
+    """Percentiles por endpoint de las muestras en memoria de este proceso"""
+    with _candado:
+        copia = {clave: list(muestras) for clave, muestras in _muestras.items()}
+        excedidas = dict(_excedidas)
+    endpoints = []
+    for clave, muestras in copia.items():
+        entrada = {'endpoint': clave, 'muestras': len(muestras), 'excedidas': excedidas.get(clave, 0)}
+        for metrica in METRICAS:
+            valores = sorted(muestra[metrica] for muestra in muestras if muestra[metrica] is not None)
+            entrada[metrica] = {
+                **{f'p{p}': percentil(valores, p) for p in PERCENTILES}, 'max': valores[-1]
+            } if valores else None
+        endpoints.append(entrada)
+    endpoints.sort(key=lambda entrada: entrada['total_ms']['p90'], reverse=True)
+    return endpoints
+
+
+def reiniciar():
+    with _candado:
+        _muestras.clear()
+        _excedidas.clear()
+
+
+class MetricasMiddleware:
+    """Mide una muestra de las peticiones (ver el módulo)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if MUESTREO <= 0 or random.random() >= MUESTREO:
+            return self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        total = time.perf_counter() - inicio
+
+        coincidencia = request.resolver_match
+        if coincidencia is None:
+            return response
+        nombre = coincidencia.view_name
+        registrar(f'{request.method} {nombre}', nombre, {
+            'consultas': medicion.consultas,
+            'db_ms': round(medicion.db * 1000, 2),
+            'serializacion_ms': round(medicion.serializacion * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'bytes': None if response.streaming else len(response.content),
+        })
+        return response
+
+    def process_template_response(self, request, response):
+        # Respuestas DRF: el render (JSON) cuenta como serialización
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.inicio_render = time.perf_counter()
+            response.add_post_render_callback(lambda _: self._fin_render(medicion))
+        return response
+
+    @staticmethod
+    def _fin_render(medicion):
+        medicion.serializacion += time.perf_counter() - medicion.inicio_render
+
+
+class MetricasView(APIView):
+    """Percentiles por endpoint (solo staff). DELETE reinicia las muestras del proceso."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'muestreo': MUESTREO,
+            'ventana': VENTANA,
+            'proceso': os.getpid(),
+            'endpoints': resumen(),
+        })
+
+    def delete(self, request):
+        reiniciar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
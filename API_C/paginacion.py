@@ -0,0 +1,282 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+PageNumberPagination hace COUNT(*) y OFFSET en cada página: ambos recorren todas las
+filas anteriores. Con cursor la página siguiente se pide con un filtro sobre las
+columnas de orden (fecha_accion < x OR (fecha_accion = x AND id < y)), que un índice
+compuesto sobre esas mismas columnas resuelve sin recorrer lo ya visto.
+
+La vista declara `ordering_cursor` (columnas del modelo o anotaciones no nulas; se agrega
+el id como desempate). El modo por páginas sigue disponible con ?page= o
+?paginacion=paginas, y se usa siempre que el listado no sea un queryset o venga ordenado
+de otra forma (?ordering=, relevancia de la búsqueda).
+
+El total es opcional: ?conteo=exacto agrega el COUNT(*), ?conteo=estimado la estimación
+del planificador (PostgreSQL) y ?conteo=no lo omite. Por compatibilidad con los clientes
+que leen `count`, el modo cursor lo sigue enviando (exacto) por defecto durante una
+versión (`conteo_predeterminado`); después pasará a omitirse salvo que se pida, y los
+clientes de listados grandes deberían enviar ya ?conteo=no.
+"""
+import base64
+import json
+from collections import OrderedDict
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+MODOS_CONTEO = ['estimado', 'exacto']
+
+
+def conteo_estimado(queryset):
+    """
+    Filas estimadas por el planificador (EXPLAIN) sin ejecutar la consulta. Solo
+    PostgreSQL publica la estimación; en otros motores retorna None.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def contar(queryset, modo):
+    """(total, es_estimado) según el modo pedido; el estimado cae al exacto si no hay planificador"""
+    if modo == 'estimado':
+        total = conteo_estimado(queryset)
+        if total is not None:
+            return total, True
+    return queryset.count(), False
+
+
+def _valor_cursor(valor):
+    # isoformat() completo: DjangoJSONEncoder recorta a milisegundos y el cursor debe ser exacto
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+class PaginacionNumerada(PageNumberPagination):
+    """Modo por páginas (el de siempre) con ?page_size= opcional"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class PaginacionCursor(BasePagination):
+    """
+    Paginación por cursor sobre `ordering_cursor` de la vista; si el listado no admite
+    cursor (ver módulo) pagina por números con PaginacionNumerada.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    modo_query_param = 'paginacion'
+    conteo_query_param = 'conteo'
+    # Transición: hasta la próxima versión el modo cursor envía count salvo ?conteo=no
+    conteo_predeterminado = 'exacto'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def __init__(self):
+        self.por_paginas = None
+
+    # --- Selección del modo ---
+
+    def get_ordering(self, view, queryset):
+        """[(campo, descendente)] del cursor, con el id como desempate"""
+        campos = list(getattr(view, 'ordering_cursor', None) or queryset.model._meta.ordering)
+        if not any(campo.lstrip('-') in ('id', 'pk') for campo in campos):
+            campos.append('-id' if campos and campos[0].startswith('-') else 'id')
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in campos]
+
+    def _admite_cursor(self, request, queryset, orden):
+        if not isinstance(queryset, QuerySet):
+            return False
+        if request.query_params.get(self.modo_query_param) == 'paginas':
+            return False
+        if PaginacionNumerada.page_query_param in request.query_params:
+            return False
+        # El orden ya aplicado (OrderingFilter, búsqueda) debe ser un prefijo del orden del cursor
+        aplicado = list(queryset.query.order_by)
+        esperado = [f"{'-' if descendente else ''}{campo}" for campo, descendente in orden]
+        return aplicado == esperado[:len(aplicado)]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        orden = self.get_ordering(view, queryset) if isinstance(queryset, QuerySet) else None
+        if orden is None or not self._admite_cursor(request, queryset, orden):
+            if orden is not None and not queryset.ordered:
+                # Las agregaciones (GROUP BY) pierden Meta.ordering: sin orden las páginas
+                # no son deterministas
+                self.orden = orden
+                queryset = queryset.order_by(*self._orden_sql())
+            self.por_paginas = PaginacionNumerada()
+            self.por_paginas.page_size = self.page_size
+            return self.por_paginas.paginate_queryset(queryset, request, view)
+
+        self.por_paginas = None
+        self.orden = orden
+        self.base_url = request.build_absolute_uri()
+        self.conteo = self._conteo(queryset, request, self.conteo_predeterminado)
+
+        posicion, atras = self.decode_cursor(request)
+        if atras:
+            queryset = queryset.order_by(*self._orden_sql(invertido=True))
+        else:
+            queryset = queryset.order_by(*self._orden_sql())
+        if posicion is not None:
+            try:
+                queryset = queryset.filter(self._despues_de(posicion, atras))
+            except (ValidationError, ValueError, TypeError):
+                # Valores del cursor que no corresponden al tipo de las columnas
+                raise NotFound(self.invalid_cursor_message)
+
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if atras:
+            filas.reverse()
+
+        # Volviendo atrás siempre hay página siguiente; avanzando, siempre hay anterior
+        self.siguiente = filas[-1] if filas and (hay_mas if not atras else posicion is not None) else None
+        self.anterior = filas[0] if filas and (hay_mas if atras else posicion is not None) else None
+        return filas
+
+    def posicion_flujo(self, request, view, queryset):
+        """
+        Prepara el modo cursor para un listado que no es un queryset (p. ej. la mezcla de
+        dos fuentes ya ordenadas por `ordering_cursor`) y retorna la posición del cursor o
+        None. Solo admite avanzar: un cursor hacia atrás es inválido.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.por_paginas = None
+        self.conteo = None
+        self.orden = self.get_ordering(view, queryset)
+        self.base_url = request.build_absolute_uri()
+        posicion, atras = self.decode_cursor(request)
+        if atras:
+            raise NotFound(self.invalid_cursor_message)
+        return posicion
+
+    def paginar_flujo(self, filas):
+        """Toma una página de un iterable ya ordenado; consume a lo sumo page_size + 1 filas"""
+        filas = list(islice(filas, self.page_size + 1))
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        self.siguiente = filas[-1] if filas and hay_mas else None
+        self.anterior = None
+        return filas
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(tamano, self.max_page_size) if tamano > 0 else self.page_size
+
+    # --- Cursor ---
+
+    def _orden_sql(self, invertido=False):
+        return [
+            f"{'-' if descendente != invertido else ''}{campo}" for campo, descendente in self.orden
+        ]
+
+    def _despues_de(self, posicion, atras):
+        """
+        Filas posteriores a `posicion` en el orden del cursor (anteriores si `atras`):
+        (a > x) OR (a = x AND b > y) ..., más a >= x para que el índice acote el rango.
+        """
+        condicion = Q()
+        iguales = {}
+        for (campo, descendente), valor in zip(self.orden, posicion):
+            operador = 'lt' if descendente != atras else 'gt'
+            condicion |= Q(**iguales, **{f'{campo}__{operador}': valor})
+            iguales[campo] = valor
+        primero, descendente = self.orden[0]
+        rango = Q(**{f"{primero}__{'lte' if descendente != atras else 'gte'}": posicion[0]})
+        return rango & condicion
+
+    def decode_cursor(self, request):
+        """(posición, atrás) del cursor pedido; (None, False) en la primera página"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            posicion, atras = datos['p'], bool(datos.get('a'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(posicion, list) or len(posicion) != len(self.orden) or None in posicion:
+            raise NotFound(self.invalid_cursor_message)
+        return posicion, atras
+
+    def encode_cursor(self, instancia, atras):
+        posicion = [getattr(instancia, 'pk' if campo == 'pk' else campo) for campo, _ in self.orden]
+        datos = json.dumps({'p': posicion, 'a': 1 if atras else 0}, default=_valor_cursor)
+        cursor = base64.urlsafe_b64encode(datos.encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return None if self.siguiente is None else self.encode_cursor(self.siguiente, atras=False)
+
+    def get_previous_link(self):
+        return None if self.anterior is None else self.encode_cursor(self.anterior, atras=True)
+
+    # --- Conteo opcional ---
+
+    def _conteo(self, queryset, request, predeterminado=None):
+        """(total, es_estimado) del modo pedido o el predeterminado; None con ?conteo=no"""
+        modo = request.query_params.get(self.conteo_query_param, predeterminado)
+        if modo not in MODOS_CONTEO:
+            return None
+        return contar(queryset, modo)
+
+    def contar(self, queryset, request, predeterminado='exacto'):
+        """Total para respuestas propias (p. ej. mis_matrices): el del modo activo o el pedido"""
+        if self.por_paginas is not None:
+            return self.por_paginas.page.paginator.count
+        if self.conteo is None:
+            self.conteo = self._conteo(queryset, request, predeterminado)
+        return self.conteo[0]
+
+    # --- Respuesta ---
+
+    def get_paginated_data(self, data):
+        """Metadatos de la página más los resultados (misma forma en ambos modos)"""
+        if self.por_paginas is not None:
+            return OrderedDict([
+                ('count', self.por_paginas.page.paginator.count),
+                ('next', self.por_paginas.get_next_link()),
+                ('previous', self.por_paginas.get_previous_link()),
+                ('results', data),
+            ])
+        datos = OrderedDict([('next', self.get_next_link()), ('previous', self.get_previous_link())])
+        if self.conteo is not None:
+            datos['count'], datos['count_estimado'] = self.conteo
+        datos['results'] = data
+        return datos
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return PaginacionNumerada().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': parametro, 'required': False, 'in': 'query',
+                'schema': {'type': 'integer' if parametro in ('page', 'page_size') else 'string'},
+            }
+            for parametro in [
+                self.cursor_query_param, self.page_size_query_param, PaginacionNumerada.page_query_param,
+                self.modo_query_param, self.conteo_query_param,
+            ]
+        ]
@@ -56,6 +56,8 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'API_C.metricas.MetricasMiddleware',
+    'API_C.consultas_repetidas.ConsultasRepetidasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +102,26 @@ DATABASES = {
     )
 }
 
+# Cache
+# La caché de matrices (matriz/cache.py) se invalida cambiando tokens de versión, así que
+# todos los procesos deben compartirla. Con REDIS_URL se usa Redis (requiere el paquete
+# redis). Sin él, LocMemCache es propia de cada proceso y solo es correcta con un único
+# worker (desarrollo): otro worker seguiría sirviendo agregados viejos hasta que expiren.
+# `manage.py check --deploy` lo advierte (matriz.W001).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -164,3 +186,32 @@ REST_FRAMEWORK = {
     
     
 }
+
+# Métricas por endpoint (API_C/metricas.py): fracción de peticiones medidas y presupuestos.
+# Los presupuestos se buscan por "MÉTODO nombre-de-url" o por "nombre-de-url".
+METRICAS_MUESTREO = float(os.environ.get('METRICAS_MUESTREO', '0.1'))
+METRICAS_VENTANA = 500
+METRICAS_PRESUPUESTO_PREDETERMINADO = {'consultas': 30, 'db_ms': 300, 'total_ms': 1000}
+METRICAS_PRESUPUESTOS = {
+    'GET matriz-list': {'consultas': 6, 'db_ms': 150, 'total_ms': 500},
+    'GET matriz-mis-matrices': {'consultas': 6, 'db_ms': 150, 'total_ms': 500},
+    'GET evaluacion-list': {'consultas': 8, 'db_ms': 200, 'total_ms': 600},
+    'reporte-evaluacion': {'consultas': 10, 'total_ms': 800},
+    'mis-softwares': {'consultas': 6, 'total_ms': 500},
+    'normas-plantillas': {'consultas': 4, 'total_ms': 500},
+}
+
+# Detector de N+1 (API_C/consultas_repetidas.py): 'off', 'log' o 'error'. Las pruebas
+# corren en 'error' con el runner del proyecto; los N+1 conocidos van en PERMITIDOS.
+N_MAS_UNO_MODO = os.environ.get('N_MAS_UNO_MODO', 'log' if DEBUG else 'off')
+N_MAS_UNO_UMBRAL = 5
+N_MAS_UNO_PERMITIDOS = [
+    # Conocidos, pendientes de corregir: listado y reporte de evaluaciones, mis-softwares
+    'CalificacionCaracteristicaSerializer.caracteristica_nombre',
+    'CalificacionSubCaracteristicaSerializer.subcaracteristica_nombre',
+    'MisSoftwaresView.get',
+    # Admin: __str__ de (sub)características consulta su norma; conteos por fila
+    'Caracteristica.__str__',
+    'CalificacionCaracteristicaAdmin.',
+]
+TEST_RUNNER = 'API_C.consultas_repetidas.DetectorTestRunner'
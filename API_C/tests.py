@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from matriz.tests import crear_empresa, crear_matriz
+from users.models import CustomUser
+
+from . import metricas
+
+
+@mock.patch.object(metricas, 'MUESTREO', 1)
+class MetricasTests(TestCase):
+    """Middleware de métricas: muestreo, percentiles, presupuestos y vista para staff"""
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = crear_empresa()
+        crear_matriz(empresa, 'A')
+        crear_matriz(empresa, 'B')
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=empresa
+        )
+        cls.staff = CustomUser.objects.create(
+            document='2', first_name='Luis', last_name='Gómez', email='luis@example.com', phone='2',
+            empresa=empresa, is_staff=True
+        )
+
+    def setUp(self):
+        metricas.reiniciar()
+        self.addCleanup(metricas.reiniciar)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def endpoint(self, clave):
+        return next(entrada for entrada in metricas.resumen() if entrada['endpoint'] == clave)
+
+    def test_mide_consultas_de_la_peticion(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.cliente.get('/api/matriz/matrices/')
+        self.assertEqual(respuesta.status_code, 200)
+        entrada = self.endpoint('GET matriz-list')
+        self.assertEqual(entrada['muestras'], 1)
+        self.assertEqual(entrada['consultas']['max'], len(consultas.captured_queries))
+        self.assertEqual(entrada['bytes']['max'], len(respuesta.content))
+        self.assertGreater(entrada['serializacion_ms']['max'], 0)
+
+    def test_muestreo(self):
+        with mock.patch.object(metricas, 'MUESTREO', 0):
+            self.cliente.get('/api/matriz/matrices/')
+        self.assertEqual(metricas.resumen(), [])
+        with mock.patch.object(metricas, 'MUESTREO', 0.5), \
+                mock.patch.object(metricas.random, 'random', side_effect=[0.7, 0.2]):
+            self.cliente.get('/api/matriz/matrices/')
+            self.cliente.get('/api/matriz/matrices/')
+        self.assertEqual(self.endpoint('GET matriz-list')['muestras'], 1)
+
+    def test_percentiles(self):
+        for consultas in range(1, 11):
+            metricas.registrar('GET prueba', 'prueba', {
+                'consultas': consultas, 'db_ms': 1, 'serializacion_ms': 1, 'total_ms': consultas,
+                'bytes': None,
+            })
+        entrada = self.endpoint('GET prueba')
+        self.assertEqual(entrada['consultas'], {'p50': 5, 'p90': 9, 'p99': 10, 'max': 10})
+        self.assertIsNone(entrada['bytes'])
+        self.assertEqual(metricas.percentil([7], 50), 7)
+
+    def test_presupuesto_excedido(self):
+        presupuestos = {'GET matriz-list': {'consultas': 0}}
+        with mock.patch.object(metricas, 'PRESUPUESTOS', presupuestos), \
+                self.assertLogs('API_C.metricas', 'WARNING') as registros:
+            self.cliente.get('/api/matriz/matrices/')
+        self.assertIn('Presupuesto excedido en GET matriz-list: consultas=', registros.output[0])
+        self.assertEqual(self.endpoint('GET matriz-list')['excedidas'], 1)
+
+    def test_dentro_del_presupuesto_no_avisa(self):
+        with self.assertNoLogs('API_C.metricas', 'WARNING'):
+            self.cliente.get('/api/matriz/matrices/')
+        self.assertEqual(self.endpoint('GET matriz-list')['excedidas'], 0)
+
+    def test_vista_solo_staff(self):
+        self.assertEqual(self.cliente.get('/api/metricas/').status_code, 403)
+        self.assertEqual(self.cliente.delete('/api/metricas/').status_code, 403)
+
+        staff = APIClient()
+        staff.force_authenticate(self.staff)
+        self.cliente.get('/api/matriz/matrices/')
+        respuesta = staff.get('/api/metricas/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['muestreo'], 1)
+        self.assertIn('GET matriz-list', [entrada['endpoint'] for entrada in respuesta.data['endpoints']])
+
+        self.assertEqual(staff.delete('/api/metricas/').status_code, 204)
+        # Solo queda la muestra del propio DELETE, medida después de reiniciar
+        self.assertEqual([entrada['endpoint'] for entrada in metricas.resumen()], ['DELETE metricas'])
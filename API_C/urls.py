@@ -22,6 +22,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .metricas import MetricasView
+
 schema_view = get_schema_view(
     openapi.Info(
         title="ISO 25000 API",
@@ -42,6 +44,8 @@ urlpatterns = [
     path('api/software/', include('software.urls')),
      path('api/matriz/', include('matriz.urls')),  # AGREGAR ESTA LÍNEA
     path('api/evaluaciones/', include('evaluaciones.urls')),
+    # Percentiles de consultas y tiempos por endpoint (solo staff)
+    path('api/metricas/', MetricasView.as_view(), name='metricas'),
     
     #path('api/v1/', include('preguntas.urls')),  # Reemplaza 'tu_app' con el nombre real de tu aplicación
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
@@ -1,7 +1,9 @@
 from rest_framework import serializers
+
+from API_C.campos import CamposDinamicosMixin
 from .models import Empresa
 
-class EmpresaSerializer(serializers.ModelSerializer):
+class EmpresaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Empresa
         fields = '__all__'
\ No newline at end of file
@@ -1,7 +1,9 @@
 from rest_framework import viewsets
+
+from API_C.campos import CamposDinamicosViewMixin
 from .models import Empresa
 from .serializers import EmpresaSerializer
 
-class EmpresaViewSet(viewsets.ModelViewSet):
+class EmpresaViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     queryset = Empresa.objects.all()
     serializer_class = EmpresaSerializer
\ No newline at end of file
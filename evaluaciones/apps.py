@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class EvaluacionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'evaluaciones'
+
+    def ready(self):
+        from .models import CalificacionCaracteristica, CalificacionSubCaracteristica
+        from .signals import tocar_evaluacion
+        for modelo in (CalificacionCaracteristica, CalificacionSubCaracteristica):
+            post_save.connect(tocar_evaluacion, sender=modelo, dispatch_uid=f'tocar_guardar_{modelo.__name__}')
+            post_delete.connect(tocar_evaluacion, sender=modelo, dispatch_uid=f'tocar_eliminar_{modelo.__name__}')
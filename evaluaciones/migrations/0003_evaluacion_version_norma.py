@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 01:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluaciones', '0002_calificacioncaracteristica_porcentaje_asignado'),
+        ('normas', '0011_versionnorma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluacion',
+            name='version_norma',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='evaluaciones', to='normas.versionnorma', verbose_name='Versión de la norma'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluaciones', '0003_evaluacion_version_norma'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evaluacion',
+            index=models.Index(fields=['fecha_inicio', 'id'], name='evaluacion_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evaluacion',
+            index=models.Index(fields=['empresa', 'fecha_inicio', 'id'], name='evaluacion_empresa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evaluacion',
+            index=models.Index(fields=['evaluador', 'fecha_inicio', 'id'], name='evaluacion_evaluador_fecha_idx'),
+        ),
+    ]
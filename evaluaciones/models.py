@@ -2,7 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from decimal import Decimal
-from normas.models import Norma, Caracteristica, SubCaracteristica
+from normas.models import Norma, Caracteristica, SubCaracteristica, VersionNorma
 from software.models import Software
 from API_C.utils import generar_codigo_evaluacion
 
@@ -35,6 +35,15 @@ class Evaluacion(models.Model):
         related_name='evaluaciones',
         verbose_name="Norma aplicada"
     )
+    # Versión congelada de la norma vigente al crear la evaluación (ver normas.VersionNorma)
+    version_norma = models.ForeignKey(
+        VersionNorma,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='evaluaciones',
+        verbose_name="Versión de la norma"
+    )
     evaluador = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -76,6 +85,12 @@ class Evaluacion(models.Model):
         verbose_name = "Evaluación"
         verbose_name_plural = "Evaluaciones"
         unique_together = ['software', 'norma', 'evaluador']
+        # Cursor del listado (fecha_inicio, id): todas, por empresa o por evaluador
+        indexes = [
+            models.Index(fields=['fecha_inicio', 'id'], name='evaluacion_fecha_idx'),
+            models.Index(fields=['empresa', 'fecha_inicio', 'id'], name='evaluacion_empresa_fecha_idx'),
+            models.Index(fields=['evaluador', 'fecha_inicio', 'id'], name='evaluacion_evaluador_fecha_idx'),
+        ]
         
     def save(self, *args, **kwargs):
         if not self.codigo_evaluacion:
@@ -84,6 +99,9 @@ class Evaluacion(models.Model):
                 self.empresa.codigo_empresa if self.empresa.codigo_empresa else 'SIN',
                 self.evaluador.document
             )
+        # La versión se fija al crear; una evaluación existente conserva la suya
+        if self._state.adding and self.version_norma_id is None and self.norma_id:
+            self.version_norma = VersionNorma.objects.filter(norma_id=self.norma_id).order_by('-numero').first()
         super().save(*args, **kwargs)
         
     def __str__(self):
@@ -2,10 +2,12 @@
 from rest_framework import serializers
 from decimal import Decimal
 from .models import Evaluacion, CalificacionCaracteristica, CalificacionSubCaracteristica
-from normas.models import Norma, Caracteristica, SubCaracteristica
+from normas.arbol import CAMPOS_EVALUACION, arbol_norma
+from normas.models import Norma, Caracteristica, SubCaracteristica, VersionNorma
 from software.models import Software
+from API_C.campos import CamposDinamicosMixin
 
-class CalificacionSubCaracteristicaSerializer(serializers.ModelSerializer):
+class CalificacionSubCaracteristicaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     subcaracteristica_nombre = serializers.CharField(source='subcaracteristica.nombre', read_only=True)
     porcentaje_obtenido = serializers.ReadOnlyField()
     
@@ -23,13 +25,15 @@ class CalificacionSubCaracteristicaSerializer(serializers.ModelSerializer):
             'fecha_calificacion'
         ]
         read_only_fields = ['id', 'fecha_calificacion', 'puntos_maximo']
+        expandibles = {'subcaracteristica': 'normas.serializers.SubCaracteristicaSimpleSerializer'}
+        dependencias = {'porcentaje_obtenido': ['puntos', 'puntos_maximo']}
     
     def validate_puntos(self, value):
         if value < 0 or value > 3:
             raise serializers.ValidationError("Los puntos deben estar entre 0 y 3.")
         return value
 
-class CalificacionCaracteristicaSerializer(serializers.ModelSerializer):
+class CalificacionCaracteristicaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     caracteristica_nombre = serializers.CharField(source='caracteristica.nombre', read_only=True)
     calificaciones_subcaracteristica = CalificacionSubCaracteristicaSerializer(many=True, read_only=True)
     numero_subcaracteristicas_evaluadas = serializers.SerializerMethodField()
@@ -51,6 +55,10 @@ class CalificacionCaracteristicaSerializer(serializers.ModelSerializer):
             'calificaciones_subcaracteristica'
         ]
         read_only_fields = ['id', 'fecha_calificacion', 'puntuacion_maxima']
+        dependencias = {
+            'numero_subcaracteristicas_evaluadas': ['calificaciones_subcaracteristica'],
+            'puntos_maximos_posibles': ['calificaciones_subcaracteristica'],
+        }
     
     def get_numero_subcaracteristicas_evaluadas(self, obj):
         return obj.calificaciones_subcaracteristica.count()
@@ -68,7 +76,7 @@ class CalificacionCaracteristicaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("La puntuación debe estar entre 0 y 100%.")
         return value
 
-class EvaluacionSerializer(serializers.ModelSerializer):
+class EvaluacionSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     software_nombre = serializers.CharField(source='software.nombre', read_only=True)
     norma_nombre = serializers.CharField(source='norma.nombre', read_only=True)
     evaluador_nombre = serializers.CharField(source='evaluador.get_full_name', read_only=True)
@@ -85,6 +93,7 @@ class EvaluacionSerializer(serializers.ModelSerializer):
             'software_nombre',
             'norma', 
             'norma_nombre',
+            'version_norma',
             'evaluador',
             'evaluador_nombre',
             'empresa',
@@ -101,12 +110,19 @@ class EvaluacionSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 
             'codigo_evaluacion', 
+            'version_norma',
             'evaluador', 
             'empresa',
             'fecha_inicio', 
             'fecha_actualizacion',
             'puntuacion_total'
         ]
+        expandibles = {
+            'software': 'software.serializers.SoftwareSerializer',
+            'empresa': 'empresa.serializers.EmpresaSerializer',
+            'version_norma': 'normas.serializers.VersionNormaSerializer',
+        }
+        dependencias = {'suma_porcentajes': ['calificaciones_caracteristica']}
     
     def get_suma_porcentajes(self, obj):
         """Devuelve la suma de porcentajes asignados"""
@@ -224,11 +240,25 @@ class EvaluacionCompletaFlexibleSerializer(serializers.Serializer):
         calificaciones = data.get('calificaciones', [])
         
         if norma:
+            # Estructura de la versión congelada vigente (una fila); sin versión, la estructura actual
+            version = norma.version_vigente()
+            if version is not None:
+                estructura = version.ids_estructura()
+            else:
+                estructura = {
+                    caracteristica_id: set()
+                    for caracteristica_id in norma.caracteristicas.values_list('id', flat=True)
+                }
+                for caracteristica_id, sub_id in SubCaracteristica.objects.filter(
+                    caracteristica__norma=norma
+                ).values_list('caracteristica_id', 'id'):
+                    estructura[caracteristica_id].add(sub_id)
+            data['version_norma'] = version
+            
             # Verificar que las características existen en la norma
-            caracteristicas_norma = set(norma.caracteristicas.values_list('id', flat=True))
             caracteristicas_evaluadas = set(cal['caracteristica_id'] for cal in calificaciones)
             
-            invalidas = caracteristicas_evaluadas - caracteristicas_norma
+            invalidas = caracteristicas_evaluadas - estructura.keys()
             if invalidas:
                 raise serializers.ValidationError(
                     f"Características inválidas para esta norma: {list(invalidas)}"
@@ -237,22 +267,36 @@ class EvaluacionCompletaFlexibleSerializer(serializers.Serializer):
             # Verificar subcaracterísticas
             for cal in calificaciones:
                 caracteristica_id = cal['caracteristica_id']
-                subcaracteristicas_validas = set(
-                    SubCaracteristica.objects.filter(
-                        caracteristica_id=caracteristica_id
-                    ).values_list('id', flat=True)
-                )
-                
                 subcaracteristicas_evaluadas = set(
                     sub['subcaracteristica_id'] for sub in cal['subcaracteristicas']
                 )
                 
-                invalidas_sub = subcaracteristicas_evaluadas - subcaracteristicas_validas
+                invalidas_sub = subcaracteristicas_evaluadas - estructura[caracteristica_id]
                 if invalidas_sub:
                     raise serializers.ValidationError(
                         f"Subcaracterísticas inválidas para característica {caracteristica_id}: {list(invalidas_sub)}"
                     )
         
+            if version is not None:
+                # Las calificaciones apuntan a las filas actuales: la versión puede conservar
+                # características o subcaracterísticas que ya se eliminaron (una consulta)
+                evaluadas = {
+                    sub['subcaracteristica_id']: cal['caracteristica_id']
+                    for cal in calificaciones for sub in cal['subcaracteristicas']
+                }
+                existentes = dict(
+                    SubCaracteristica.objects.filter(id__in=evaluadas)
+                    .values_list('id', 'caracteristica_id')
+                )
+                eliminadas = [
+                    sub_id for sub_id, caracteristica_id in evaluadas.items()
+                    if existentes.get(sub_id) != caracteristica_id
+                ]
+                if eliminadas:
+                    raise serializers.ValidationError(
+                        f"Subcaracterísticas eliminadas de la norma desde su aprobación: {eliminadas}"
+                    )
+        
         return data
     
     def create(self, validated_data):
@@ -308,7 +352,23 @@ class EvaluacionCompletaFlexibleSerializer(serializers.Serializer):
         return EvaluacionSerializer(instance, context=self.context).data
 
 # Serializer para obtener estructura de norma para evaluación
-class NormaParaEvaluacionSerializer(serializers.ModelSerializer):
+class VersionNormaParaEvaluacionSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """
+    Estructura de una norma para el frontend leída de su versión congelada (una sola fila)
+    """
+    id = serializers.IntegerField(source='norma_id')
+    nombre = serializers.CharField(source='contenido.nombre')
+    descripcion = serializers.CharField(source='contenido.descripcion')
+    version = serializers.CharField(source='contenido.version')
+    version_norma = serializers.IntegerField(source='numero')
+    caracteristicas = serializers.JSONField(source='contenido.caracteristicas')
+    
+    class Meta:
+        model = VersionNorma
+        fields = ['id', 'nombre', 'descripcion', 'version', 'version_norma', 'hash_contenido', 'caracteristicas']
+        dependencias = {campo: ['contenido'] for campo in ['nombre', 'descripcion', 'version', 'caracteristicas']}
+
+class NormaParaEvaluacionSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para obtener la estructura de una norma para el frontend
     """
@@ -317,29 +377,9 @@ class NormaParaEvaluacionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Norma
         fields = ['id', 'nombre', 'descripcion', 'version', 'caracteristicas']
+        dependencias = {'caracteristicas': ['caracteristicas']}
     
     def get_caracteristicas(self, obj):
         """Obtener características con sus subcaracterísticas"""
-        caracteristicas = obj.caracteristicas.all().order_by('orden')
-        resultado = []
-        
-        for car in caracteristicas:
-            subcaracteristicas = car.subcaracteristicas.all().order_by('orden')
-            resultado.append({
-                'id': car.id,
-                'nombre': car.nombre,
-                'descripcion': car.descripcion,
-                'orden': car.orden,
-                'subcaracteristicas': [
-                    {
-                        'id': sub.id,
-                        'nombre': sub.nombre,
-                        'descripcion': sub.descripcion,
-                        'criterios_evaluacion': sub.criterios_evaluacion,
-                        'orden': sub.orden
-                    }
-                    for sub in subcaracteristicas
-                ]
-            })
-        
-        return resultado
\ No newline at end of file
+        # Consume el prefetch de prefetch_arbol() si la norma lo trae
+        return arbol_norma(obj, CAMPOS_EVALUACION)
\ No newline at end of file
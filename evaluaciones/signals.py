@@ -0,0 +1,28 @@
+# evaluaciones/signals.py
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import CalificacionCaracteristica, Evaluacion
+
+
+def tocar_evaluacion(sender, instance, raw=False, origin=None, **kwargs):
+    """
+    Las calificaciones son parte de la evaluación: guardarlas o eliminarlas actualiza
+    Evaluacion.fecha_actualizacion (la usan el ETag y Last-Modified de la API).
+    """
+    if raw:
+        return
+    # En eliminaciones en cascada (evaluación o calificación padre) ya cuenta el origen
+    if isinstance(origin, QuerySet):
+        if origin.model is not sender:
+            return
+    elif origin is not None and not isinstance(origin, sender):
+        return
+
+    if isinstance(instance, CalificacionCaracteristica):
+        evaluacion = instance.evaluacion_id
+    else:
+        evaluacion = CalificacionCaracteristica.objects.filter(
+            pk=instance.calificacion_caracteristica_id
+        ).values('evaluacion_id')[:1]
+    Evaluacion.objects.filter(pk=evaluacion).update(fecha_actualizacion=timezone.now())
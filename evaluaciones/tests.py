@@ -1,3 +1,72 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from empresa.models import Empresa
+from normas import tests as pruebas_normas
+from software.models import Software
+from users.models import CustomUser
+
+from .models import Evaluacion
+
+
+class CrearEvaluacionTests(TestCase):
+    """Las calificaciones se validan contra la versión vigente y las filas actuales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = Empresa.objects.create(
+            nombre='Empresa', nit='900', direccion='d', email='e@example.com', telefono='1'
+        )
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=empresa
+        )
+        cls.software = Software.objects.create(
+            empresa=empresa, nombre='S', vesion='1', objectivo_general='o', objetivo_especifico='o'
+        )
+        cls.norma = pruebas_normas.ArbolNormaConsultasTests.crear_norma('ISO', caracteristicas=2, subcaracteristicas=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear(self, calificaciones=None):
+        if calificaciones is None:
+            calificaciones = [
+                {
+                    'caracteristica_id': caracteristica.pk,
+                    'porcentaje_asignado': 50,
+                    'subcaracteristicas': [
+                        {'subcaracteristica_id': sub.pk, 'puntos': 3}
+                        for sub in caracteristica.subcaracteristicas.all()
+                    ],
+                }
+                for caracteristica in self.norma.caracteristicas.order_by('orden')
+            ]
+        return self.client.post('/api/evaluaciones/crear-evaluacion/', {
+            'software': self.software.pk, 'norma': self.norma.pk, 'calificaciones': calificaciones,
+        }, format='json')
+
+    def test_crear_con_la_version_vigente(self):
+        respuesta = self.crear()
+        self.assertEqual(respuesta.status_code, 201)
+        evaluacion = Evaluacion.objects.get()
+        self.assertEqual(evaluacion.version_norma, self.norma.version_vigente())
+
+    def test_caracteristica_eliminada_despues_de_aprobar(self):
+        caracteristica = self.norma.caracteristicas.order_by('orden').first()
+        sub = caracteristica.subcaracteristicas.get()
+        calificaciones = [{
+            'caracteristica_id': caracteristica.pk, 'porcentaje_asignado': 100,
+            'subcaracteristicas': [{'subcaracteristica_id': sub.pk, 'puntos': 2}],
+        }]
+        self.assertEqual(self.crear(calificaciones).status_code, 201)
+
+        # La versión congelada la conserva, pero las filas ya no existen: 400, no 500
+        caracteristica_id = caracteristica.pk
+        caracteristica.delete()
+        self.assertIn(caracteristica_id, self.norma.version_vigente().ids_estructura())
+        respuesta = self.crear(calificaciones)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('eliminadas', str(respuesta.data['errors']))
+        self.assertEqual(Evaluacion.objects.count(), 1)
@@ -13,15 +13,20 @@ from .serializers import (
     CalificacionCaracteristicaSerializer,
     CalificacionSubCaracteristicaSerializer,
     EvaluacionCompletaFlexibleSerializer,  # NUEVO
-    NormaParaEvaluacionSerializer
+    NormaParaEvaluacionSerializer,
+    VersionNormaParaEvaluacionSerializer
 )
 from .permissions import EvaluacionPermission
 from software.models import Software
-from normas.models import Norma
+from normas.arbol import prefetch_arbol
+from normas.models import Norma, VersionNorma
+from API_C.campos import CamposDinamicosViewMixin
+from API_C.condicional import ConsultaCondicionalMixin
+from API_C.paginacion import PaginacionCursor
 from rest_framework import serializers
 from django.db.models import Count
 
-class EvaluacionViewSet(viewsets.ModelViewSet):
+class EvaluacionViewSet(ConsultaCondicionalMixin, CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar evaluaciones de software
     """
@@ -32,6 +37,9 @@ class EvaluacionViewSet(viewsets.ModelViewSet):
     search_fields = ['codigo_evaluacion', 'software__nombre', 'norma__nombre']
     ordering_fields = ['fecha_inicio', 'fecha_completada', 'puntuacion_total']
     ordering = ['-fecha_inicio']
+    pagination_class = PaginacionCursor
+    ordering_cursor = ['-fecha_inicio', '-id']
+    campo_modificacion = 'fecha_actualizacion'
     
     def get_queryset(self):
         """Filtrar evaluaciones según el rol del usuario"""
@@ -243,11 +251,24 @@ class NormaParaEvaluacionView(APIView):
         Obtener estructura completa de una norma para el frontend:
         - Todas las características con sus subcaracterísticas
         - Sin porcentajes predefinidos (el usuario los asigna)
+        Se lee de la versión congelada vigente (o de ?version=<número>); las normas que
+        nunca se aprobaron se arman desde sus tablas.
         """
+        versiones = VersionNorma.objects.filter(norma_id=norma_id)
+        numero = request.query_params.get('version')
+        if numero:
+            versiones = versiones.filter(numero=numero) if numero.isdigit() else versiones.none()
+        version = versiones.order_by('-numero').first()
+        if version is not None:
+            return Response(VersionNormaParaEvaluacionSerializer(version).data)
+        if numero:
+            return Response(
+                {'error': 'Versión de norma no encontrada'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
         try:
-            norma = Norma.objects.prefetch_related(
-                'caracteristicas__subcaracteristicas'
-            ).get(id=norma_id)
+            norma = Norma.objects.prefetch_related(prefetch_arbol()).get(id=norma_id)
         except Norma.DoesNotExist:
             return Response(
                 {'error': 'Norma no encontrada'},
@@ -291,7 +312,7 @@ class ValidarPorcentajesView(APIView):
             'message': 'Porcentajes válidos' if es_valido else f'Los porcentajes suman {total}%, no 100%'
         })
 
-class CalificacionCaracteristicaViewSet(viewsets.ModelViewSet):
+class CalificacionCaracteristicaViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar calificaciones de características
     """
@@ -309,7 +330,7 @@ class CalificacionCaracteristicaViewSet(viewsets.ModelViewSet):
             evaluacion__empresa=user.empresa
         )
 
-class CalificacionSubCaracteristicaViewSet(viewsets.ModelViewSet):
+class CalificacionSubCaracteristicaViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar calificaciones de subcaracterísticas
     """
@@ -376,6 +397,24 @@ class MisSoftwaresView(APIView):
             'softwares': software_data
         })
 
+def normas_disponibles():
+    """Normas aprobadas disponibles para evaluación (también se sirven en el bootstrap)"""
+    normas = Norma.objects.filter(estado='aprobada').annotate(
+        numero_caracteristicas=Count('caracteristicas')
+    )
+    
+    return [
+        {
+            'id': norma.id,
+            'nombre': norma.nombre,
+            'descripcion': norma.descripcion,
+            'version': norma.version,
+            'numero_caracteristicas': norma.numero_caracteristicas,
+            'fecha_creacion': norma.fecha_creacion
+        }
+        for norma in normas
+    ]
+
 class NormasDisponiblesView(APIView):
     """
     Vista para obtener las normas disponibles para evaluación
@@ -384,20 +423,7 @@ class NormasDisponiblesView(APIView):
     
     def get(self, request):
         """Obtener normas aprobadas disponibles"""
-        normas = Norma.objects.filter(estado='aprobada').annotate(
-            numero_caracteristicas=Count('caracteristicas')
-        )
-        
-        normas_data = []
-        for norma in normas:
-            normas_data.append({
-                'id': norma.id,
-                'nombre': norma.nombre,
-                'descripcion': norma.descripcion,
-                'version': norma.version,
-                'numero_caracteristicas': norma.numero_caracteristicas,
-                'fecha_creacion': norma.fecha_creacion
-            })
+        normas_data = normas_disponibles()
         
         return Response({
             'normas_disponibles': normas_data,
@@ -1,8 +1,13 @@
 # matriz/admin.py
 from django.contrib import admin
 from django.utils.html import format_html
+from django.db import transaction
 from django.db.models import Count
-from .models import MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz
+from .models import (
+    MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz,
+    ConfiguracionZonasRiesgo, NIVELES_ZONA, reclasificar_riesgos
+)
+from .cache import invalidar_matrices
 
 class CausaRiesgoInline(admin.TabularInline):
     model = CausaRiesgo
@@ -29,7 +34,7 @@ class RiesgoMatrizInline(admin.StackedInline):
     
     def zona_riesgo_display(self, obj):
         if obj.id:
-            zona = obj.calcular_zona_riesgo()
+            zona = obj.zona_riesgo
             color_map = {
                 'EXTREMA': '#dc2626',
                 'ALTA': '#ea580c', 
@@ -146,7 +151,7 @@ class MatrizRiesgoAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'empresa', 'creado_por'
-        ).prefetch_related('riesgos')
+        ).con_resumen_riesgos()
 
 @admin.register(RiesgoMatriz)
 class RiesgoMatrizAdmin(admin.ModelAdmin):
@@ -224,7 +229,7 @@ class RiesgoMatrizAdmin(admin.ModelAdmin):
     inlines = [CausaRiesgoInline]
     
     def zona_riesgo_display(self, obj):
-        zona = obj.calcular_zona_riesgo()
+        zona = obj.zona_riesgo
         color_map = {
             'EXTREMA': '#dc2626',
             'ALTA': '#ea580c',
@@ -241,7 +246,7 @@ class RiesgoMatrizAdmin(admin.ModelAdmin):
     zona_riesgo_display.short_description = 'Zona de Riesgo'
     
     def valor_riesgo_display(self, obj):
-        zona = obj.calcular_zona_riesgo()
+        zona = obj.zona_riesgo
         return f"{zona['valor']} (P:{obj.probabilidad} × I:{obj.impacto})"
     valor_riesgo_display.short_description = 'Valor de Riesgo'
     
@@ -334,6 +339,22 @@ class ParametroMatrizAdmin(admin.ModelAdmin):
         return obj.descripcion[:100] + '...' if len(obj.descripcion) > 100 else obj.descripcion
     descripcion_truncada.short_description = 'Descripción'
 
+@admin.register(ConfiguracionZonasRiesgo)
+class ConfiguracionZonasRiesgoAdmin(admin.ModelAdmin):
+    """Al guardar, los riesgos de la empresa se reclasifican en bloque (ver signals.py)"""
+    list_display = [
+        'empresa',
+        'minimo_extrema',
+        'minimo_alta',
+        'minimo_moderada',
+        'minimo_baja',
+        'fecha_modificacion'
+    ]
+    
+    search_fields = ['empresa__nombre']
+    
+    fields = ['empresa', 'minimo_extrema', 'minimo_alta', 'minimo_moderada', 'minimo_baja']
+
 @admin.register(AuditoriaMatriz)
 class AuditoriaMatrizAdmin(admin.ModelAdmin):
     list_display = [
@@ -414,12 +435,11 @@ class AuditoriaMatrizAdmin(admin.ModelAdmin):
 
 @admin.action(description='Recalcular zonas de riesgo seleccionados')
 def recalcular_zonas_riesgo(modeladmin, request, queryset):
-    """Acción para recalcular las zonas de riesgo"""
-    actualizados = 0
-    for riesgo in queryset:
-        # Forzar recálculo guardando el objeto
-        riesgo.save()
-        actualizados += 1
+    """Acción para recalcular las zonas de riesgo (UPDATE en bloque por empresa)"""
+    empresas = queryset.order_by().values_list('matriz__empresa_id', flat=True).distinct()
+    actualizados = sum(
+        reclasificar_riesgos(empresa_id, queryset) for empresa_id in list(empresas)
+    )
     
     modeladmin.message_user(
         request,
@@ -427,10 +447,26 @@ def recalcular_zonas_riesgo(modeladmin, request, queryset):
         level='SUCCESS'
     )
 
+def _marcar_aceptacion(queryset, aceptado):
+    """
+    Actualiza 'aceptado' en bloque manteniendo conteo_aceptados de cada matriz.
+    queryset.update() no dispara señales, así que el delta se calcula aparte.
+    """
+    with transaction.atomic():
+        cambios = queryset.exclude(aceptado=aceptado).order_by().values('matriz_id').annotate(
+            total=Count('id')
+        )
+        signo = 1 if aceptado else -1
+        deltas = {c['matriz_id']: {'conteo_aceptados': signo * c['total']} for c in cambios}
+        updated = queryset.update(aceptado=aceptado)
+        MatrizRiesgo.aplicar_deltas_contadores(deltas)
+    invalidar_matrices(deltas.keys())
+    return updated
+
 @admin.action(description='Marcar riesgos como aceptados')
 def marcar_aceptados(modeladmin, request, queryset):
     """Acción para marcar riesgos como aceptados"""
-    updated = queryset.update(aceptado=True)
+    updated = _marcar_aceptacion(queryset, True)
     modeladmin.message_user(
         request,
         f'Se marcaron {updated} riesgos como aceptados.',
@@ -440,7 +476,7 @@ def marcar_aceptados(modeladmin, request, queryset):
 @admin.action(description='Marcar riesgos como no aceptados')
 def marcar_no_aceptados(modeladmin, request, queryset):
     """Acción para marcar riesgos como no aceptados"""
-    updated = queryset.update(aceptado=False)
+    updated = _marcar_aceptacion(queryset, False)
     modeladmin.message_user(
         request,
         f'Se marcaron {updated} riesgos como no aceptados.',
@@ -471,40 +507,10 @@ class ZonaRiesgoFilter(admin.SimpleListFilter):
         )
     
     def queryset(self, request, queryset):
-        if self.value() == 'extrema':
-            return queryset.filter(probabilidad__gte=3, impacto__gte=5)
-        elif self.value() == 'alta':
-            # Lógica para alta (valor >= 10 pero < 15)
-            riesgos_alta = []
-            for riesgo in queryset:
-                valor = riesgo.probabilidad * riesgo.impacto
-                if 10 <= valor < 15:
-                    riesgos_alta.append(riesgo.id)
-            return queryset.filter(id__in=riesgos_alta)
-        elif self.value() == 'moderada':
-            # Lógica para moderada (valor >= 6 pero < 10)
-            riesgos_moderada = []
-            for riesgo in queryset:
-                valor = riesgo.probabilidad * riesgo.impacto
-                if 6 <= valor < 10:
-                    riesgos_moderada.append(riesgo.id)
-            return queryset.filter(id__in=riesgos_moderada)
-        elif self.value() == 'baja':
-            # Lógica para baja (valor >= 3 pero < 6)
-            riesgos_baja = []
-            for riesgo in queryset:
-                valor = riesgo.probabilidad * riesgo.impacto
-                if 3 <= valor < 6:
-                    riesgos_baja.append(riesgo.id)
-            return queryset.filter(id__in=riesgos_baja)
-        elif self.value() == 'muy_baja':
-            # Lógica para muy baja (valor < 3)
-            riesgos_muy_baja = []
-            for riesgo in queryset:
-                valor = riesgo.probabilidad * riesgo.impacto
-                if valor < 3:
-                    riesgos_muy_baja.append(riesgo.id)
-            return queryset.filter(id__in=riesgos_muy_baja)
+        # Zona guardada en el riesgo: usa los umbrales de la empresa de cada matriz
+        niveles = {nivel.replace(' ', '_').lower(): nivel for nivel in NIVELES_ZONA}
+        if self.value() in niveles:
+            return queryset.filter(nivel_zona=niveles[self.value()])
         return queryset
 
 class EfectividadControlFilter(admin.SimpleListFilter):
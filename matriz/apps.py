@@ -1,5 +1,36 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.models.signals import pre_save, post_save, post_delete, pre_migrate, post_migrate
 
 class MatrizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'matriz'
\ No newline at end of file
+    name = 'matriz'
+
+    def ready(self):
+        from .auditoria import volcar_si_vencido
+        from .busqueda import restaurar_indice, suspender_indice
+        from normas.models import Caracteristica, Norma
+        from users.models import DocumentType, PersonType
+        from .models import ConfiguracionZonasRiesgo, MatrizRiesgo, ParametroMatriz, RiesgoMatriz
+        from .signals import (
+            capturar_aporte_anterior,
+            actualizar_contadores_al_guardar,
+            actualizar_contadores_al_eliminar,
+            invalidar_cache_matriz,
+            invalidar_bootstrap,
+            reclasificar_al_cambiar_umbrales
+        )
+        pre_save.connect(capturar_aporte_anterior, sender=RiesgoMatriz)
+        post_save.connect(actualizar_contadores_al_guardar, sender=RiesgoMatriz)
+        post_delete.connect(actualizar_contadores_al_eliminar, sender=RiesgoMatriz)
+        post_save.connect(invalidar_cache_matriz, sender=MatrizRiesgo)
+        post_delete.connect(invalidar_cache_matriz, sender=MatrizRiesgo)
+        post_save.connect(reclasificar_al_cambiar_umbrales, sender=ConfiguracionZonasRiesgo)
+        post_delete.connect(reclasificar_al_cambiar_umbrales, sender=ConfiguracionZonasRiesgo)
+        # Catálogos servidos en el bootstrap (Caracteristica cambia el conteo de las normas)
+        for modelo in (ParametroMatriz, DocumentType, PersonType, Norma, Caracteristica):
+            post_save.connect(invalidar_bootstrap, sender=modelo, dispatch_uid=f'bootstrap_guardar_{modelo.__name__}')
+            post_delete.connect(invalidar_bootstrap, sender=modelo, dispatch_uid=f'bootstrap_eliminar_{modelo.__name__}')
+        request_finished.connect(volcar_si_vencido, dispatch_uid='matriz_auditoria_volcado')
+        pre_migrate.connect(suspender_indice, sender=self, dispatch_uid='matriz_busqueda_suspender')
+        post_migrate.connect(restaurar_indice, sender=self, dispatch_uid='matriz_busqueda_restaurar')
@@ -0,0 +1,220 @@
+# matriz/archivo_auditoria.py
+"""
+Archivo en frío de la auditoría de matrices.
+
+Los registros antiguos se mueven a segmentos JSONL comprimidos con gzip, uno por mes
+de fecha_accion y por ejecución del archivado, dentro de MATRIZ_AUDITORIA_ARCHIVO.
+El archivo manifest.json lista los segmentos con su rango de fechas, número de
+registros y empresas, de modo que una consulta solo abre los segmentos que le sirven.
+"""
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+DIRECTORIO = getattr(settings, 'MATRIZ_AUDITORIA_ARCHIVO', os.path.join(settings.BASE_DIR, 'auditoria_archivo'))
+MANIFIESTO = 'manifest.json'
+
+CAMPOS_ARCHIVADOS = [
+    'id', 'matriz', 'matriz_nombre', 'usuario', 'usuario_nombre', 'accion',
+    'descripcion', 'fecha_accion', 'datos_anteriores', 'datos_nuevos',
+]
+
+
+def _ruta_manifiesto(directorio):
+    return os.path.join(directorio, MANIFIESTO)
+
+
+def cargar_manifiesto(directorio=None):
+    """Retorna el manifiesto del archivo ({'segmentos': [...]}); vacío si aún no existe"""
+    ruta = _ruta_manifiesto(directorio or DIRECTORIO)
+    if not os.path.exists(ruta):
+        return {'version': 1, 'segmentos': []}
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def _escribir_atomico(ruta, contenido):
+    """Escribe en un temporal y lo renombra: el manifiesto nunca queda a medio escribir"""
+    directorio = os.path.dirname(ruta)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+        archivo.write(contenido)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def guardar_manifiesto(manifiesto, directorio=None):
+    directorio = directorio or DIRECTORIO
+    _escribir_atomico(_ruta_manifiesto(directorio), json.dumps(manifiesto, indent=2, ensure_ascii=False))
+
+
+def limite_archivo(directorio=None):
+    """Fecha del registro archivado más reciente (None si no hay nada archivado)"""
+    segmentos = cargar_manifiesto(directorio)['segmentos']
+    if not segmentos:
+        return None
+    return max(datetime.fromisoformat(segmento['hasta']) for segmento in segmentos)
+
+
+def registro_archivable(registro):
+    """Convierte una instancia de AuditoriaMatriz (con matriz y usuario cargados) en fila del archivo"""
+    return {
+        'id': registro.pk,
+        'matriz': registro.matriz_id,
+        'matriz_nombre': registro.matriz.nombre,
+        'empresa': registro.matriz.empresa_id,
+        'usuario': registro.usuario_id,
+        'usuario_nombre': registro.usuario.get_full_name() if registro.usuario else None,
+        'accion': registro.accion,
+        'descripcion': registro.descripcion,
+        'fecha_accion': registro.fecha_accion,
+        'datos_anteriores': registro.datos_anteriores,
+        'datos_nuevos': registro.datos_nuevos,
+    }
+
+
+class EscritorSegmento:
+    """Escribe un segmento gzip en un archivo temporal y lo publica al cerrarlo"""
+
+    def __init__(self, directorio, nombre):
+        self.directorio = directorio
+        self.nombre = nombre
+        self.temporal = os.path.join(directorio, nombre + '.tmp')
+        self.archivo = gzip.open(self.temporal, 'wt', encoding='utf-8')
+        self.encoder = DjangoJSONEncoder(ensure_ascii=False)
+        self.registros = 0
+        self.desde = None
+        self.hasta = None
+        self.empresas = set()
+
+    def escribir(self, fila):
+        self.archivo.write(self.encoder.encode(fila))
+        self.archivo.write('\n')
+        self.registros += 1
+        self.desde = min(self.desde or fila['fecha_accion'], fila['fecha_accion'])
+        self.hasta = max(self.hasta or fila['fecha_accion'], fila['fecha_accion'])
+        if fila['empresa']:
+            self.empresas.add(fila['empresa'])
+
+    def cerrar(self):
+        """Cierra y publica el segmento; retorna su entrada para el manifiesto"""
+        self.archivo.close()
+        with open(self.temporal, 'rb') as archivo:
+            os.fsync(archivo.fileno())
+        os.replace(self.temporal, os.path.join(self.directorio, self.nombre))
+        return {
+            'archivo': self.nombre,
+            'desde': self.desde.isoformat(),
+            'hasta': self.hasta.isoformat(),
+            'registros': self.registros,
+            'empresas': sorted(self.empresas),
+        }
+
+    def descartar(self):
+        self.archivo.close()
+        if os.path.exists(self.temporal):
+            os.remove(self.temporal)
+
+
+def _coincide(fila, filtros):
+    return all(str(fila.get(campo)) == str(valor) for campo, valor in filtros.items())
+
+
+def _segmentos_candidatos(manifiesto, desde, hasta, empresa_id):
+    for segmento in manifiesto['segmentos']:
+        if desde and datetime.fromisoformat(segmento['hasta']) < desde:
+            continue
+        if hasta and datetime.fromisoformat(segmento['desde']) >= hasta:
+            continue
+        if empresa_id is not None and empresa_id not in segmento['empresas']:
+            continue
+        yield segmento
+
+
+def _filas_segmento(directorio, segmento, desde, hasta, empresa_id, filtros):
+    with gzip.open(os.path.join(directorio, segmento['archivo']), 'rt', encoding='utf-8') as archivo:
+        for linea in archivo:
+            fila = json.loads(linea)
+            fecha = datetime.fromisoformat(fila['fecha_accion'])
+            if desde and fecha < desde:
+                continue
+            if hasta and fecha >= hasta:
+                continue
+            if empresa_id is not None and fila['empresa'] != empresa_id:
+                continue
+            if _coincide(fila, filtros):
+                yield fila
+
+
+def leer_archivados(desde=None, hasta=None, empresa_id=None, filtros=None, directorio=None):
+    """
+    Itera los registros archivados con fecha_accion en [desde, hasta) que cumplan los
+    filtros de igualdad (p. ej. {'matriz': 'MR-...', 'accion': 'UPDATE'}).
+    Solo se abren los segmentos cuyo rango y empresas pueden contener resultados.
+    """
+    directorio = directorio or DIRECTORIO
+    filtros = filtros or {}
+    for segmento in _segmentos_candidatos(cargar_manifiesto(directorio), desde, hasta, empresa_id):
+        yield from _filas_segmento(directorio, segmento, desde, hasta, empresa_id, filtros)
+
+
+def clave_orden(fila):
+    """(fecha_accion, id) de una fila archivada: el orden del listado de auditoría"""
+    return datetime.fromisoformat(fila['fecha_accion']), fila['id']
+
+
+def leer_archivados_recientes(desde=None, hasta=None, empresa_id=None, filtros=None, antes_de=None,
+                              directorio=None):
+    """
+    Como leer_archivados(), pero del más reciente al más antiguo por (fecha_accion, id) y
+    sin abrir un segmento hasta que pueda aportar la fila siguiente: quien consuma solo
+    una página abre solo los segmentos de esa página. Cada segmento abierto se ordena en
+    memoria (un segmento es un mes de una ejecución del archivado).
+    `antes_de` = (fecha, id): solo las filas anteriores a esa posición (cursor).
+    """
+    directorio = directorio or DIRECTORIO
+    filtros = filtros or {}
+    pendientes = sorted(
+        (
+            segmento for segmento in _segmentos_candidatos(cargar_manifiesto(directorio), desde, hasta, empresa_id)
+            if antes_de is None or datetime.fromisoformat(segmento['desde']) <= antes_de[0]
+        ),
+        key=lambda segmento: segmento['hasta'],
+        reverse=True,
+    )
+    abiertos = []  # [clave, fila, iterador] de cada segmento abierto con filas por entregar
+
+    def abrir(segmento):
+        filas = sorted(
+            (
+                (clave_orden(fila), fila)
+                for fila in _filas_segmento(directorio, segmento, desde, hasta, empresa_id, filtros)
+            ),
+            key=lambda par: par[0],
+            reverse=True,
+        )
+        iterador = ((clave, fila) for clave, fila in filas if antes_de is None or clave < antes_de)
+        siguiente = next(iterador, None)
+        if siguiente is not None:
+            abiertos.append([*siguiente, iterador])
+
+    while True:
+        mejor = max(abiertos, key=lambda abierto: abierto[0], default=None)
+        # Un segmento con filas más recientes que la mejor pendiente debe abrirse antes de entregarla
+        while pendientes and (mejor is None or datetime.fromisoformat(pendientes[0]['hasta']) >= mejor[0][0]):
+            abrir(pendientes.pop(0))
+            mejor = max(abiertos, key=lambda abierto: abierto[0], default=None)
+        if mejor is None:
+            return
+        yield mejor[1]
+        siguiente = next(mejor[2], None)
+        if siguiente is None:
+            abiertos.remove(mejor)
+        else:
+            mejor[0], mejor[1] = siguiente
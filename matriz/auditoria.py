@@ -0,0 +1,193 @@
+# matriz/auditoria.py
+"""
+Registro de auditoría de matrices.
+
+Cada registro guarda solo los campos que cambiaron (datos_anteriores / datos_nuevos).
+Los registros se escriben cuando la transacción que los origina hace commit (si se
+revierte, se descartan), así que se ven en la API apenas termina la escritura.
+
+Con MATRIZ_AUDITORIA_DIFERIDA = True (opcional) se acumulan en memoria y se escriben
+con bulk_create al alcanzar el tamaño de lote o el intervalo máximo de espera; un hilo
+temporizador vuelca lo vencido aunque no haya más tráfico. En ese modo un proceso que
+muere sin salir limpiamente (SIGKILL) pierde lo que tenga pendiente.
+
+Si la escritura falla (p. ej. la base de datos no está disponible) el lote vuelve a la
+cola y el temporizador lo reintenta.
+"""
+import atexit
+import datetime
+import decimal
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DIFERIDA = getattr(settings, 'MATRIZ_AUDITORIA_DIFERIDA', False)
+TAMANO_LOTE = getattr(settings, 'MATRIZ_AUDITORIA_LOTE', 100)
+INTERVALO_VOLCADO = getattr(settings, 'MATRIZ_AUDITORIA_INTERVALO', 5)
+
+_pendientes = []
+_ultimo_volcado = time.monotonic()
+_candado = threading.Lock()
+_temporizador = None
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, (decimal.Decimal, uuid.UUID)):
+        return str(valor)
+    return valor
+
+
+def instantanea(instancia):
+    """
+    Valores actuales de los campos auditables, sin consultas. Se omiten la pk, los
+    campos auto_now y los no editables (p. ej. los contadores desnormalizados).
+    """
+    return {
+        campo.attname: _valor_json(getattr(instancia, campo.attname))
+        for campo in instancia._meta.concrete_fields
+        if campo.editable and not campo.primary_key and not getattr(campo, 'auto_now', False)
+    }
+
+
+def diferencia(anteriores, nuevos):
+    """Retorna (anteriores, nuevos) limitados a los campos cuyo valor cambió"""
+    campos = [
+        campo for campo in nuevos.keys() | anteriores.keys()
+        if anteriores.get(campo) != nuevos.get(campo)
+    ]
+    return (
+        {campo: anteriores.get(campo) for campo in campos},
+        {campo: nuevos.get(campo) for campo in campos},
+    )
+
+
+def registrar(matriz_id, usuario, accion, descripcion, datos_anteriores=None, datos_nuevos=None):
+    """Encola un registro de auditoría; se escribe cuando la transacción actual hace commit"""
+    from .models import AuditoriaMatriz
+
+    registro = AuditoriaMatriz(
+        matriz_id=matriz_id,
+        usuario_id=getattr(usuario, 'pk', None),
+        accion=accion,
+        descripcion=descripcion,
+        fecha_accion=timezone.now(),
+        datos_anteriores=datos_anteriores,
+        datos_nuevos=datos_nuevos,
+    )
+    transaction.on_commit(lambda: _encolar(registro))
+
+
+def descartar(matriz_id):
+    """
+    Descarta los registros pendientes de una matriz eliminada (el borrado en cascada
+    ya elimina los que están en la base de datos).
+    """
+    def _descartar():
+        with _candado:
+            _pendientes[:] = [registro for registro in _pendientes if registro.matriz_id != matriz_id]
+
+    transaction.on_commit(_descartar)
+
+
+def _encolar(registro):
+    with _candado:
+        _pendientes.append(registro)
+        lleno = len(_pendientes) >= TAMANO_LOTE
+    volcar_si_vencido(forzar=not DIFERIDA or lleno)
+    if _pendientes:
+        _iniciar_temporizador()
+
+
+def volcar_si_vencido(forzar=False, **kwargs):
+    """
+    Vuelca el buffer si pasó el intervalo máximo desde el último volcado (sin diferir,
+    siempre). Se llama después del commit, al final de cada petición y desde el
+    temporizador: un error se registra y el lote queda en cola para el próximo intento.
+    """
+    if not _pendientes:
+        return
+    if forzar or not DIFERIDA or time.monotonic() - _ultimo_volcado >= INTERVALO_VOLCADO:
+        try:
+            volcar()
+        except Exception:
+            logger.exception('No se pudo escribir la auditoría de matrices; se reintentará')
+
+
+def _temporizar():
+    while True:
+        time.sleep(INTERVALO_VOLCADO)
+        try:
+            volcar_si_vencido()
+        finally:
+            # El hilo no pasa por request_finished: cierra su propia conexión
+            connection.close()
+
+
+def _iniciar_temporizador():
+    """Hilo (daemon, uno por proceso) que vuelca lo vencido sin esperar más tráfico"""
+    global _temporizador
+    with _candado:
+        if _temporizador is None:
+            _temporizador = threading.Thread(target=_temporizar, name='auditoria-matriz', daemon=True)
+            _temporizador.start()
+
+
+def volcar(**kwargs):
+    """
+    Escribe los registros pendientes con bulk_create; retorna cuántos se escribieron.
+    Si la escritura falla los registros vuelven a la cola y el error se propaga.
+    """
+    global _ultimo_volcado
+    with _candado:
+        registros = _pendientes[:]
+        _pendientes.clear()
+        _ultimo_volcado = time.monotonic()
+    if not registros:
+        return 0
+
+    try:
+        return _escribir(registros)
+    except Exception:
+        with _candado:
+            _pendientes[:0] = registros
+        raise
+
+
+def _escribir(registros):
+    from .models import AuditoriaMatriz, MatrizRiesgo
+
+    try:
+        with transaction.atomic():
+            AuditoriaMatriz.objects.bulk_create(registros, batch_size=TAMANO_LOTE)
+    except IntegrityError:
+        # Alguna matriz se eliminó por otra vía antes del volcado: se omiten sus registros
+        for registro in registros:
+            registro.pk = None
+        existentes = set(
+            MatrizRiesgo.objects
+            .filter(pk__in={registro.matriz_id for registro in registros})
+            .values_list('pk', flat=True)
+        )
+        registros = [registro for registro in registros if registro.matriz_id in existentes]
+        with transaction.atomic():
+            AuditoriaMatriz.objects.bulk_create(registros, batch_size=TAMANO_LOTE)
+    return len(registros)
+
+
+def _volcar_al_salir():
+    try:
+        volcar()
+    except Exception:
+        pass
+
+
+atexit.register(_volcar_al_salir)
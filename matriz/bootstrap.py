@@ -0,0 +1,91 @@
+# matriz/bootstrap.py
+"""
+Bootstrap del frontend: los catálogos que la aplicación pide al arrancar (parámetros de
+configuración, parámetros de matriz, tipos de documento y de persona, normas disponibles)
+en una sola respuesta.
+
+El JSON se codifica una vez por versión de los catálogos y se guarda ya en bytes; las
+peticiones siguientes solo leen la caché. La versión publicada es el hash del contenido,
+así que es la misma en todos los procesos aunque la caché sea local. Con ?v=<versión>
+la respuesta se puede cachear indefinidamente en el cliente; sin ella el cliente debe
+revalidar con If-None-Match y recibe 304 mientras nada cambie.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+
+from .cache import CACHE_TIMEOUT, version_catalogos
+
+CACHE_CONTROL_VERSIONADO = 'max-age=31536000, immutable'
+CACHE_CONTROL_REVALIDAR = 'no-cache'
+
+
+def datos_bootstrap(autenticado):
+    """Catálogos del bootstrap; las normas disponibles solo para usuarios autenticados"""
+    from evaluaciones.views import normas_disponibles
+    from users.models import DocumentType, PersonType
+    from users.serializers import DocumentTypeSerializer, PersonTypeSerializer
+
+    from .models import ParametroMatriz
+    from .serializers import ParametroMatrizSerializer
+    from .views import PARAMETROS_CONFIGURACION
+
+    datos = {
+        'parametros_configuracion': PARAMETROS_CONFIGURACION,
+        'parametros_matriz': ParametroMatrizSerializer(
+            ParametroMatriz.objects.filter(activo=True), many=True
+        ).data,
+        'tipos_documento': DocumentTypeSerializer(DocumentType.objects.all(), many=True).data,
+        'tipos_persona': PersonTypeSerializer(PersonType.objects.all(), many=True).data,
+    }
+    if autenticado:
+        datos['normas_disponibles'] = normas_disponibles()
+    return datos
+
+
+def codificar_bootstrap(autenticado):
+    """(versión, contenido JSON en bytes); la versión es el hash del contenido"""
+    datos = JSONRenderer().render(datos_bootstrap(autenticado))
+    version = hashlib.sha256(datos).hexdigest()[:32]
+    # La versión va dentro del mismo objeto sin volver a serializar los datos
+    contenido = b'{"version":"' + version.encode() + b'",' + datos[1:]
+    return version, contenido
+
+
+def obtener_bootstrap(autenticado):
+    """(versión, contenido) de la versión vigente de los catálogos, desde la caché"""
+    variante = 'autenticado' if autenticado else 'publico'
+    clave = f'matriz:bootstrap:{variante}:{version_catalogos()}'
+    return cache.get_or_set(clave, lambda: codificar_bootstrap(autenticado), CACHE_TIMEOUT)
+
+
+class BootstrapView(APIView):
+    """
+    Catálogos iniciales del frontend en una sola petición, con ETag fuerte y 304.
+    Usar ?v=<versión> (campo "version" o cabecera X-Bootstrap-Version) para cachear sin revalidar.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        autenticado = request.user.is_authenticated
+        version, contenido = obtener_bootstrap(autenticado)
+        etag = f'"{version}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(contenido, content_type='application/json')
+
+        alcance = 'private' if autenticado else 'public'
+        if request.query_params.get('v') == version:
+            response['Cache-Control'] = f'{alcance}, {CACHE_CONTROL_VERSIONADO}'
+        else:
+            response['Cache-Control'] = f'{alcance}, {CACHE_CONTROL_REVALIDAR}'
+        response['ETag'] = etag
+        response['X-Bootstrap-Version'] = version
+        patch_vary_headers(response, ['Authorization', 'Cookie'])
+        return response
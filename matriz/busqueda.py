@@ -0,0 +1,575 @@
+# matriz/busqueda.py
+"""
+Búsqueda de texto completo sobre riesgos (nombre, código, descripción, efectos,
+tratamiento y causas) y matrices (nombre, descripción, responsable).
+
+El índice depende del motor de base de datos:
+- SQLite: tablas virtuales FTS5, clasificación con bm25().
+- PostgreSQL: tablas con una columna tsvector e índice GIN, clasificación con ts_rank_cd().
+- Otros motores (o MATRIZ_BUSQUEDA_BACKEND = 'like'): icontains sin clasificación.
+
+En ambos índices cada fila guarda la empresa de la matriz para filtrar por tenant
+dentro de la propia búsqueda. Los índices se mantienen con triggers en la base de
+datos, así que también reflejan bulk_create, update() y las cargas masivas; la
+migración 0006 los instala y el comando reconstruir_indice_busqueda los regenera.
+"""
+import re
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection as conexion_por_defecto, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Case, F, FloatField, Func, Q, Value, When
+from rest_framework import filters
+
+from .models import CausaRiesgo, Coincide, IndiceBusquedaRiesgo, MatrizRiesgo, RiesgoMatriz
+
+MIGRACION_INDICE = ('matriz', '0006_busqueda_texto_completo')
+
+TABLA_RIESGOS = IndiceBusquedaRiesgo._meta.db_table
+TABLA_MATRICES = 'matriz_matriz_busqueda'
+
+# Límite de matrices clasificadas por búsqueda (las matrices de una empresa son pocas)
+LIMITE_MATRICES = getattr(settings, 'MATRIZ_BUSQUEDA_LIMITE_MATRICES', 500)
+
+MAXIMO_TERMINOS = 10
+
+
+def terminos(texto):
+    """Palabras de la búsqueda, sin operadores ni signos (nunca llegan sin escapar al motor)"""
+    return re.findall(r'\w+', (texto or '').lower())[:MAXIMO_TERMINOS]
+
+
+class PuntajeBusqueda(Func):
+    """
+    Relevancia de la fila del índice unida al riesgo (mayor es mejor): -bm25() con
+    pesos por columna en FTS5, ts_rank_cd() en PostgreSQL (los pesos van en el tsvector).
+    """
+
+    output_field = FloatField()
+
+    def __init__(self, documento, consulta, pesos=''):
+        super().__init__(documento, Value(consulta))
+        self.pesos = pesos
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        columna = self.source_expressions[0]
+        tabla = compiler.quote_name_unless_alias(columna.alias)
+        oculta = connection.ops.quote_name(columna.target.model._meta.db_table)
+        pesos = f', {self.pesos}' if self.pesos else ''
+        return f'-bm25({tabla}.{oculta}{pesos})', []
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        documento, parametros_documento = compiler.compile(self.source_expressions[0])
+        consulta, parametros_consulta = compiler.compile(self.source_expressions[1])
+        return (
+            f"ts_rank_cd({documento}, to_tsquery('{Coincide.configuracion_postgres}', {consulta}))",
+            [*parametros_documento, *parametros_consulta]
+        )
+
+
+class BusquedaLike:
+    """Búsqueda sin índice: cada término debe aparecer (icontains) en algún campo"""
+
+    nombre = 'like'
+    clasifica = False
+    # Los triggers de SQLite se rompen cuando una migración recrea una tabla (ver suspender_indice)
+    triggers_en_migraciones = False
+
+    CAMPOS_RIESGO = ['nombre', 'codigo', 'descripcion', 'efectos', 'tratamiento']
+    CAMPOS_MATRIZ = ['nombre', 'descripcion', 'responsable']
+
+    def _condicion_riesgo(self, termino, prefijo=''):
+        condicion = Q(**{
+            f'{prefijo}pk__in': CausaRiesgo.objects.filter(causa__icontains=termino).values('riesgo_id')
+        })
+        for campo in self.CAMPOS_RIESGO:
+            condicion |= Q(**{f'{prefijo}{campo}__icontains': termino})
+        return condicion
+
+    def filtrar_riesgos(self, queryset, texto, empresa_id=None):
+        for termino in terminos(texto):
+            queryset = queryset.filter(self._condicion_riesgo(termino))
+        return queryset
+
+    def filtrar_matrices(self, queryset, texto, empresa_id=None):
+        for termino in terminos(texto):
+            condicion = Q(pk__in=RiesgoMatriz.objects.filter(
+                self._condicion_riesgo(termino)
+            ).values('matriz_id'))
+            for campo in self.CAMPOS_MATRIZ:
+                condicion |= Q(**{f'{campo}__icontains': termino})
+            queryset = queryset.filter(condicion)
+        return queryset
+
+    def instalar(self, cursor):
+        pass
+
+    def desinstalar(self, cursor):
+        pass
+
+    def reconstruir(self, cursor):
+        pass
+
+    def instalado(self, cursor):
+        return True
+
+    def suspender(self, cursor):
+        pass
+
+
+class BusquedaIndexada(BusquedaLike, ABC):
+    """
+    Base abstracta de los motores con índice: cada uno define consulta() y su SQL. Los
+    riesgos se unen a su fila del índice (IndiceBusquedaRiesgo), así que el motor recorre
+    solo las coincidencias y calcula la relevancia una vez por fila; las matrices se
+    clasifican con una sola consulta agrupada (puntaje máximo entre sus propios campos y
+    sus riesgos).
+    """
+
+    clasifica = True
+
+    # SQL de cada motor
+    SQL_INSTALAR = []
+    SQL_DESINSTALAR = []
+    SQL_RECONSTRUIR = []
+    SQL_PUNTAJES_MATRICES = ''
+    PESOS_RIESGO = ''
+    FILTRO_EMPRESA = ' AND empresa_id = %s'
+
+    @abstractmethod
+    def consulta(self, palabras):
+        """Expresión de búsqueda del motor para los términos (todos deben coincidir, por prefijo)"""
+
+    def _filtro_empresa(self, empresa_id):
+        """Condición (y parámetros) que limita la búsqueda en el índice a una empresa"""
+        if empresa_id is None:
+            return '', []
+        return self.FILTRO_EMPRESA, [empresa_id]
+
+    def filtrar_riesgos(self, queryset, texto, empresa_id=None):
+        palabras = terminos(texto)
+        if not palabras:
+            return queryset
+        consulta = self.consulta(palabras)
+        filtros = {'indice_busqueda__documento__coincide': consulta}
+        if empresa_id is not None:
+            filtros['indice_busqueda__empresa_id'] = empresa_id
+        return queryset.filter(**filtros).annotate(
+            rango_busqueda=PuntajeBusqueda(F('indice_busqueda__documento'), consulta, self.PESOS_RIESGO)
+        )
+
+    def filtrar_matrices(self, queryset, texto, empresa_id=None):
+        palabras = terminos(texto)
+        if not palabras:
+            return queryset
+        consulta = self.consulta(palabras)
+        filtro, parametros = self._filtro_empresa(empresa_id)
+        sql = self.SQL_PUNTAJES_MATRICES.format(empresa_matrices=filtro, empresa_riesgos=filtro)
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, [consulta, *parametros, consulta, *parametros, LIMITE_MATRICES])
+            puntajes = dict(cursor.fetchall())
+        if not puntajes:
+            return queryset.none()
+        return queryset.filter(pk__in=list(puntajes)).annotate(
+            rango_busqueda=Case(
+                *[When(pk=matriz_id, then=Value(puntaje)) for matriz_id, puntaje in puntajes.items()],
+                default=Value(0.0),
+                output_field=FloatField()
+            )
+        )
+
+    def instalar(self, cursor):
+        for sql in self.SQL_INSTALAR:
+            cursor.execute(sql)
+        self.reconstruir(cursor)
+
+    def desinstalar(self, cursor):
+        for sql in self.SQL_DESINSTALAR:
+            cursor.execute(sql)
+
+    def reconstruir(self, cursor):
+        for sql in self.SQL_RECONSTRUIR:
+            cursor.execute(sql)
+
+
+# Documento de un riesgo: campos propios, causas concatenadas y empresa de la matriz
+_SELECT_RIESGO_SQLITE = """
+    SELECT r.id, r.nombre, r.codigo, r.descripcion, r.efectos, r.tratamiento,
+           (SELECT group_concat(c.causa, ' ') FROM matriz_causariesgo c WHERE c.riesgo_id = r.id),
+           r.id, r.matriz_id, m.empresa_id
+    FROM matriz_riesgomatriz r JOIN matriz_matrizriesgo m ON m.id = r.matriz_id
+"""
+
+_INSERT_RIESGO_SQLITE = f"""
+    INSERT INTO {TABLA_RIESGOS}
+        (rowid, nombre, codigo, descripcion, efectos, tratamiento, causas, riesgo_id, matriz_id, empresa_id)
+"""
+
+_INSERT_MATRIZ_SQLITE = f"""
+    INSERT INTO {TABLA_MATRICES} (nombre, descripcion, responsable, matriz_id, empresa_id)
+"""
+
+_CAUSAS_SQLITE = "(SELECT group_concat(causa, ' ') FROM matriz_causariesgo WHERE riesgo_id = {riesgo})"
+
+TRIGGERS_SQLITE = {
+    'matriz_riesgo_busqueda_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_riesgo_busqueda_ai AFTER INSERT ON matriz_riesgomatriz BEGIN
+            {_INSERT_RIESGO_SQLITE} {_SELECT_RIESGO_SQLITE} WHERE r.id = NEW.id;
+        END
+    """,
+    'matriz_riesgo_busqueda_au': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_riesgo_busqueda_au
+        AFTER UPDATE OF nombre, codigo, descripcion, efectos, tratamiento, matriz_id ON matriz_riesgomatriz BEGIN
+            DELETE FROM {TABLA_RIESGOS} WHERE rowid = OLD.id;
+            {_INSERT_RIESGO_SQLITE} {_SELECT_RIESGO_SQLITE} WHERE r.id = NEW.id;
+        END
+    """,
+    'matriz_riesgo_busqueda_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_riesgo_busqueda_ad AFTER DELETE ON matriz_riesgomatriz BEGIN
+            DELETE FROM {TABLA_RIESGOS} WHERE rowid = OLD.id;
+        END
+    """,
+    'matriz_causa_busqueda_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_causa_busqueda_ai AFTER INSERT ON matriz_causariesgo BEGIN
+            UPDATE {TABLA_RIESGOS} SET causas = {_CAUSAS_SQLITE.format(riesgo='NEW.riesgo_id')}
+            WHERE rowid = NEW.riesgo_id;
+        END
+    """,
+    'matriz_causa_busqueda_au': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_causa_busqueda_au
+        AFTER UPDATE OF causa, riesgo_id ON matriz_causariesgo BEGIN
+            UPDATE {TABLA_RIESGOS} SET causas = {_CAUSAS_SQLITE.format(riesgo='OLD.riesgo_id')}
+            WHERE rowid = OLD.riesgo_id;
+            UPDATE {TABLA_RIESGOS} SET causas = {_CAUSAS_SQLITE.format(riesgo='NEW.riesgo_id')}
+            WHERE rowid = NEW.riesgo_id AND NEW.riesgo_id <> OLD.riesgo_id;
+        END
+    """,
+    'matriz_causa_busqueda_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_causa_busqueda_ad AFTER DELETE ON matriz_causariesgo BEGIN
+            UPDATE {TABLA_RIESGOS} SET causas = {_CAUSAS_SQLITE.format(riesgo='OLD.riesgo_id')}
+            WHERE rowid = OLD.riesgo_id;
+        END
+    """,
+    'matriz_matriz_busqueda_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_matriz_busqueda_ai AFTER INSERT ON matriz_matrizriesgo BEGIN
+            {_INSERT_MATRIZ_SQLITE}
+            VALUES (NEW.nombre, NEW.descripcion, NEW.responsable, NEW.id, NEW.empresa_id);
+        END
+    """,
+    'matriz_matriz_busqueda_au': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_matriz_busqueda_au
+        AFTER UPDATE OF nombre, descripcion, responsable, empresa_id ON matriz_matrizriesgo BEGIN
+            DELETE FROM {TABLA_MATRICES} WHERE matriz_id = OLD.id;
+            {_INSERT_MATRIZ_SQLITE}
+            VALUES (NEW.nombre, NEW.descripcion, NEW.responsable, NEW.id, NEW.empresa_id);
+        END
+    """,
+    'matriz_matriz_busqueda_empresa': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_matriz_busqueda_empresa
+        AFTER UPDATE OF empresa_id ON matriz_matrizriesgo WHEN NEW.empresa_id IS NOT OLD.empresa_id BEGIN
+            UPDATE {TABLA_RIESGOS} SET empresa_id = NEW.empresa_id WHERE matriz_id = NEW.id;
+        END
+    """,
+    'matriz_matriz_busqueda_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS matriz_matriz_busqueda_ad AFTER DELETE ON matriz_matrizriesgo BEGIN
+            DELETE FROM {TABLA_MATRICES} WHERE matriz_id = OLD.id;
+        END
+    """,
+}
+
+
+class BusquedaFTS5(BusquedaIndexada):
+    """SQLite: tablas virtuales FTS5 (sin acentos, por prefijo) mantenidas con triggers"""
+
+    nombre = 'fts5'
+    triggers_en_migraciones = True
+
+    # Pesos bm25 por columna: nombre, código, descripción, efectos, tratamiento, causas
+    # (las columnas UNINDEXED no puntúan)
+    PESOS_RIESGO = '10.0, 10.0, 4.0, 2.0, 2.0, 1.0'
+    PESOS_MATRIZ = '10.0, 4.0, 2.0'
+
+    SQL_INSTALAR = [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_RIESGOS} USING fts5(
+            nombre, codigo, descripcion, efectos, tratamiento, causas,
+            riesgo_id UNINDEXED, matriz_id UNINDEXED, empresa_id UNINDEXED,
+            tokenize = "unicode61 remove_diacritics 2"
+        )
+        """,
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_MATRICES} USING fts5(
+            nombre, descripcion, responsable, matriz_id UNINDEXED, empresa_id UNINDEXED,
+            tokenize = "unicode61 remove_diacritics 2"
+        )
+        """,
+        *TRIGGERS_SQLITE.values(),
+    ]
+    SQL_DESINSTALAR = [
+        *[f'DROP TRIGGER IF EXISTS {trigger}' for trigger in TRIGGERS_SQLITE],
+        f'DROP TABLE IF EXISTS {TABLA_RIESGOS}',
+        f'DROP TABLE IF EXISTS {TABLA_MATRICES}',
+    ]
+    SQL_RECONSTRUIR = [
+        f'DELETE FROM {TABLA_RIESGOS}',
+        f'{_INSERT_RIESGO_SQLITE} {_SELECT_RIESGO_SQLITE}',
+        f'DELETE FROM {TABLA_MATRICES}',
+        f'{_INSERT_MATRIZ_SQLITE} SELECT nombre, descripcion, responsable, id, empresa_id FROM matriz_matrizriesgo',
+    ]
+    SQL_PUNTAJES_MATRICES = f"""
+        SELECT matriz_id, MAX(puntaje) FROM (
+            SELECT matriz_id, -bm25({TABLA_MATRICES}, {PESOS_MATRIZ}) AS puntaje
+            FROM {TABLA_MATRICES} WHERE {TABLA_MATRICES} MATCH %s{{empresa_matrices}}
+            UNION ALL
+            SELECT matriz_id, -bm25({TABLA_RIESGOS}, {PESOS_RIESGO}) AS puntaje
+            FROM {TABLA_RIESGOS} WHERE {TABLA_RIESGOS} MATCH %s{{empresa_riesgos}}
+        ) GROUP BY matriz_id ORDER BY 2 DESC LIMIT %s
+    """
+
+    def consulta(self, palabras):
+        # Cada término entre comillas (literal) y por prefijo; los términos se combinan con AND
+        return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+    def instalado(self, cursor):
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ', '.join(['%s'] * (len(TRIGGERS_SQLITE) + 2)),
+            [TABLA_RIESGOS, TABLA_MATRICES, *TRIGGERS_SQLITE]
+        )
+        return len(cursor.fetchall()) == len(TRIGGERS_SQLITE) + 2
+
+    def suspender(self, cursor):
+        for trigger in TRIGGERS_SQLITE:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+# Configuración de texto de PostgreSQL (stemming en español)
+CONFIGURACION_POSTGRES = Coincide.configuracion_postgres
+
+_DOCUMENTO_RIESGO_POSTGRES = f"""
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(r.nombre, '') || ' ' || coalesce(r.codigo, '')), 'A') ||
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(r.descripcion, '')), 'B') ||
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(r.efectos, '') || ' ' || coalesce(r.tratamiento, '')), 'C') ||
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(
+        (SELECT string_agg(c.causa, ' ') FROM matriz_causariesgo c WHERE c.riesgo_id = r.id), ''
+    )), 'D')
+"""
+
+_DOCUMENTO_MATRIZ_POSTGRES = f"""
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(m.nombre, '')), 'A') ||
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(m.descripcion, '')), 'B') ||
+    setweight(to_tsvector('{CONFIGURACION_POSTGRES}', coalesce(m.responsable, '')), 'C')
+"""
+
+
+class BusquedaPostgres(BusquedaIndexada):
+    """PostgreSQL: columnas tsvector con índice GIN mantenidas con triggers"""
+
+    nombre = 'postgres'
+
+    SQL_INSTALAR = [
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_RIESGOS} (
+            riesgo_id bigint PRIMARY KEY REFERENCES matriz_riesgomatriz (id) ON DELETE CASCADE,
+            matriz_id varchar(20) NOT NULL,
+            empresa_id varchar(14) NOT NULL,
+            documento tsvector NOT NULL
+        )
+        """,
+        f'CREATE INDEX IF NOT EXISTS {TABLA_RIESGOS}_documento ON {TABLA_RIESGOS} USING GIN (documento)',
+        f'CREATE INDEX IF NOT EXISTS {TABLA_RIESGOS}_empresa ON {TABLA_RIESGOS} (empresa_id)',
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_MATRICES} (
+            matriz_id varchar(20) PRIMARY KEY REFERENCES matriz_matrizriesgo (id) ON DELETE CASCADE,
+            empresa_id varchar(14) NOT NULL,
+            documento tsvector NOT NULL
+        )
+        """,
+        f'CREATE INDEX IF NOT EXISTS {TABLA_MATRICES}_documento ON {TABLA_MATRICES} USING GIN (documento)',
+        f"""
+        CREATE OR REPLACE FUNCTION matriz_riesgo_busqueda_actualizar(riesgo bigint) RETURNS void AS $$
+            INSERT INTO {TABLA_RIESGOS} (riesgo_id, matriz_id, empresa_id, documento)
+            SELECT r.id, r.matriz_id, m.empresa_id, {_DOCUMENTO_RIESGO_POSTGRES}
+            FROM matriz_riesgomatriz r JOIN matriz_matrizriesgo m ON m.id = r.matriz_id
+            WHERE r.id = riesgo
+            ON CONFLICT (riesgo_id) DO UPDATE SET
+                matriz_id = EXCLUDED.matriz_id,
+                empresa_id = EXCLUDED.empresa_id,
+                documento = EXCLUDED.documento;
+        $$ LANGUAGE sql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION matriz_riesgo_busqueda_trigger() RETURNS trigger AS $$
+        BEGIN
+            PERFORM matriz_riesgo_busqueda_actualizar(NEW.id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION matriz_causa_busqueda_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM matriz_riesgo_busqueda_actualizar(OLD.riesgo_id);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM matriz_riesgo_busqueda_actualizar(NEW.riesgo_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION matriz_matriz_busqueda_trigger() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {TABLA_MATRICES} (matriz_id, empresa_id, documento)
+            SELECT m.id, m.empresa_id, {_DOCUMENTO_MATRIZ_POSTGRES}
+            FROM matriz_matrizriesgo m WHERE m.id = NEW.id
+            ON CONFLICT (matriz_id) DO UPDATE SET
+                empresa_id = EXCLUDED.empresa_id,
+                documento = EXCLUDED.documento;
+            IF TG_OP = 'UPDATE' AND NEW.empresa_id IS DISTINCT FROM OLD.empresa_id THEN
+                UPDATE {TABLA_RIESGOS} SET empresa_id = NEW.empresa_id WHERE matriz_id = NEW.id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        'DROP TRIGGER IF EXISTS matriz_riesgo_busqueda ON matriz_riesgomatriz',
+        """
+        CREATE TRIGGER matriz_riesgo_busqueda
+        AFTER INSERT OR UPDATE OF nombre, codigo, descripcion, efectos, tratamiento, matriz_id
+        ON matriz_riesgomatriz FOR EACH ROW EXECUTE FUNCTION matriz_riesgo_busqueda_trigger()
+        """,
+        'DROP TRIGGER IF EXISTS matriz_causa_busqueda ON matriz_causariesgo',
+        """
+        CREATE TRIGGER matriz_causa_busqueda
+        AFTER INSERT OR UPDATE OF causa, riesgo_id OR DELETE
+        ON matriz_causariesgo FOR EACH ROW EXECUTE FUNCTION matriz_causa_busqueda_trigger()
+        """,
+        'DROP TRIGGER IF EXISTS matriz_matriz_busqueda ON matriz_matrizriesgo',
+        """
+        CREATE TRIGGER matriz_matriz_busqueda
+        AFTER INSERT OR UPDATE OF nombre, descripcion, responsable, empresa_id
+        ON matriz_matrizriesgo FOR EACH ROW EXECUTE FUNCTION matriz_matriz_busqueda_trigger()
+        """,
+    ]
+    SQL_DESINSTALAR = [
+        'DROP TRIGGER IF EXISTS matriz_riesgo_busqueda ON matriz_riesgomatriz',
+        'DROP TRIGGER IF EXISTS matriz_causa_busqueda ON matriz_causariesgo',
+        'DROP TRIGGER IF EXISTS matriz_matriz_busqueda ON matriz_matrizriesgo',
+        'DROP FUNCTION IF EXISTS matriz_riesgo_busqueda_trigger()',
+        'DROP FUNCTION IF EXISTS matriz_causa_busqueda_trigger()',
+        'DROP FUNCTION IF EXISTS matriz_matriz_busqueda_trigger()',
+        'DROP FUNCTION IF EXISTS matriz_riesgo_busqueda_actualizar(bigint)',
+        f'DROP TABLE IF EXISTS {TABLA_RIESGOS}',
+        f'DROP TABLE IF EXISTS {TABLA_MATRICES}',
+    ]
+    SQL_RECONSTRUIR = [
+        f'TRUNCATE {TABLA_RIESGOS}, {TABLA_MATRICES}',
+        f"""
+        INSERT INTO {TABLA_RIESGOS} (riesgo_id, matriz_id, empresa_id, documento)
+        SELECT r.id, r.matriz_id, m.empresa_id, {_DOCUMENTO_RIESGO_POSTGRES}
+        FROM matriz_riesgomatriz r JOIN matriz_matrizriesgo m ON m.id = r.matriz_id
+        """,
+        f"""
+        INSERT INTO {TABLA_MATRICES} (matriz_id, empresa_id, documento)
+        SELECT m.id, m.empresa_id, {_DOCUMENTO_MATRIZ_POSTGRES} FROM matriz_matrizriesgo m
+        """,
+    ]
+    SQL_PUNTAJES_MATRICES = f"""
+        SELECT matriz_id, MAX(puntaje) FROM (
+            SELECT matriz_id, ts_rank_cd(documento, consulta) AS puntaje
+            FROM {TABLA_MATRICES}, to_tsquery('{CONFIGURACION_POSTGRES}', %s) consulta
+            WHERE documento @@ consulta{{empresa_matrices}}
+            UNION ALL
+            SELECT matriz_id, ts_rank_cd(documento, consulta) AS puntaje
+            FROM {TABLA_RIESGOS}, to_tsquery('{CONFIGURACION_POSTGRES}', %s) consulta
+            WHERE documento @@ consulta{{empresa_riesgos}}
+        ) puntajes GROUP BY matriz_id ORDER BY 2 DESC LIMIT %s
+    """
+
+    def consulta(self, palabras):
+        # Términos por prefijo combinados con AND (las palabras solo contienen \w)
+        return ' & '.join(f'{palabra}:*' for palabra in palabras)
+
+    def instalado(self, cursor):
+        cursor.execute('SELECT to_regclass(%s), to_regclass(%s)', [TABLA_RIESGOS, TABLA_MATRICES])
+        return all(cursor.fetchone())
+
+
+BACKENDS = {
+    'sqlite': BusquedaFTS5,
+    'postgresql': BusquedaPostgres,
+}
+
+
+def backend_busqueda(conexion=None):
+    """Motor de búsqueda de la conexión (MATRIZ_BUSQUEDA_BACKEND = 'like' fuerza la búsqueda sin índice)"""
+    conexion = conexion or conexion_por_defecto
+    if getattr(settings, 'MATRIZ_BUSQUEDA_BACKEND', None) == 'like':
+        return BusquedaLike()
+    return BACKENDS.get(conexion.vendor, BusquedaLike)()
+
+
+def suspender_indice(using, plan=None, **kwargs):
+    """
+    pre_migrate: en SQLite las migraciones recrean tablas (CREATE new__, DROP, RENAME) y
+    el RENAME falla si un trigger referencia una tabla que en ese momento no existe;
+    los triggers se eliminan antes de migrar y restaurar_indice los vuelve a crear.
+    """
+    conexion = connections[using]
+    backend = backend_busqueda(conexion)
+    if backend.triggers_en_migraciones and any(
+        migracion.app_label == 'matriz' for migracion, _ in (plan or [])
+    ):
+        with conexion.cursor() as cursor:
+            backend.suspender(cursor)
+
+
+def restaurar_indice(using, **kwargs):
+    """post_migrate: reinstala y reconstruye el índice si la migración que lo crea está aplicada y falta algo"""
+    conexion = connections[using]
+    backend = backend_busqueda(conexion)
+    if MIGRACION_INDICE not in MigrationRecorder(conexion).applied_migrations():
+        return
+    with conexion.cursor() as cursor:
+        if not backend.instalado(cursor):
+            backend.instalar(cursor)
+
+
+class BusquedaTextoCompletoFilter(filters.SearchFilter):
+    """
+    Reemplazo de SearchFilter (mismo parámetro ?search=) que usa el índice de texto
+    completo. Los campos buscados los define el índice (search_fields no se usa). Sin
+    ?ordering=, los resultados se ordenan por relevancia (rango_busqueda); debe ir
+    después de OrderingFilter en filter_backends.
+    """
+
+    FILTROS_POR_MODELO = {
+        RiesgoMatriz: 'filtrar_riesgos',
+        MatrizRiesgo: 'filtrar_matrices',
+    }
+
+    def empresa_busqueda(self, request):
+        """Empresa a la que se limita la búsqueda en el índice (None para administradores)"""
+        user = request.user
+        empresa_id = getattr(user, 'empresa_id', None)
+        if empresa_id and not user.groups.filter(name='Administradores').exists():
+            return empresa_id
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, '')
+        if not terminos(texto):
+            return queryset
+
+        backend = backend_busqueda()
+        filtrar = getattr(backend, self.FILTROS_POR_MODELO[queryset.model])
+        queryset = filtrar(queryset, texto, self.empresa_busqueda(request))
+
+        if backend.clasifica and not request.query_params.get(filters.OrderingFilter.ordering_param):
+            desempate = queryset.query.order_by or queryset.model._meta.ordering
+            queryset = queryset.order_by('-rango_busqueda', *desempate)
+        return queryset
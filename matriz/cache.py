@@ -0,0 +1,107 @@
+# matriz/cache.py
+"""
+Caché de resultados agregados de matrices de riesgo.
+
+Cada empresa y cada matriz tienen un token de versión; las entradas se guardan
+bajo claves que incluyen ese token, de modo que invalidar consiste en cambiar
+el token (las entradas anteriores quedan huérfanas y expiran solas).
+
+Los tokens solo sirven si todos los procesos ven la misma caché: en producción con
+varios workers CACHES debe apuntar a un backend compartido (REDIS_URL en settings).
+Con la LocMemCache por defecto cada worker guarda sus propios tokens y no ve las
+invalidaciones de los demás.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_TIMEOUT = getattr(settings, 'MATRIZ_CACHE_TIMEOUT', 300)
+
+BACKENDS_POR_PROCESO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def verificar_cache_compartida(app_configs, **kwargs):
+    """check --deploy: la caché por proceso no ve las invalidaciones de otros workers"""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in BACKENDS_POR_PROCESO:
+        return []
+    return [checks.Warning(
+        f'La caché por defecto ({backend}) no se comparte entre procesos: con varios '
+        'workers las invalidaciones de matrices no llegan a los demás.',
+        hint='Configure REDIS_URL (o un backend compartido en CACHES) en producción.',
+        id='matriz.W001',
+    )]
+
+
+def _clave_version(ambito, identificador):
+    return f'matriz:version:{ambito}:{identificador}'
+
+
+def _version(ambito, identificador):
+    clave = _clave_version(ambito, identificador)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, uuid.uuid4().hex, None)
+        version = cache.get(clave)
+    return version
+
+
+def obtener_o_calcular(ambito, identificador, nombre, calcular, timeout=CACHE_TIMEOUT):
+    """
+    Retorna el valor cacheado de `nombre` para la empresa o matriz indicada,
+    calculándolo con `calcular()` si no existe en la versión vigente.
+    """
+    clave = f'matriz:{nombre}:{ambito}:{identificador}:{_version(ambito, identificador)}'
+    return cache.get_or_set(clave, calcular, timeout)
+
+
+def invalidar(empresa_ids=(), matriz_ids=()):
+    """Invalida los resultados cacheados de las empresas y matrices indicadas"""
+    nuevas_versiones = {}
+    for empresa_id in set(empresa_ids):
+        if empresa_id:
+            nuevas_versiones[_clave_version('empresa', empresa_id)] = uuid.uuid4().hex
+    for matriz_id in set(matriz_ids):
+        if matriz_id:
+            nuevas_versiones[_clave_version('matriz', matriz_id)] = uuid.uuid4().hex
+    if nuevas_versiones:
+        cache.set_many(nuevas_versiones, None)
+
+
+def invalidar_matrices(matriz_ids, empresa_ids=None):
+    """
+    Invalida las matrices indicadas y las empresas a las que pertenecen al confirmar la
+    transacción, como invalidar_bootstrap: antes, una lectura concurrente podría guardar
+    los datos anteriores bajo la versión nueva. Con `empresa_ids` (las que el llamador
+    ya conoce) no se consulta la empresa de cada matriz.
+    """
+    matriz_ids = {matriz_id for matriz_id in matriz_ids if matriz_id}
+    if not matriz_ids:
+        return
+
+    def aplicar():
+        from .models import MatrizRiesgo
+
+        empresas = empresa_ids
+        if empresas is None:
+            empresas = MatrizRiesgo.objects.filter(pk__in=matriz_ids).values_list('empresa_id', flat=True)
+        invalidar(empresa_ids=list(empresas), matriz_ids=matriz_ids)
+
+    transaction.on_commit(aplicar)
+
+
+def version_catalogos():
+    """Token de versión de los catálogos compartidos (parámetros, tipos, normas)"""
+    return _version('catalogos', 'global')
+
+
+def invalidar_catalogos():
+    """Invalida los catálogos compartidos; el bootstrap se vuelve a generar con otra versión"""
+    cache.set(_clave_version('catalogos', 'global'), uuid.uuid4().hex, None)
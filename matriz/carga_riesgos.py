@@ -0,0 +1,350 @@
+# matriz/carga_riesgos.py
+"""
+Validación e inserción masiva de riesgos y causas.
+
+La validación se hace en memoria, en una sola pasada y sin consultas, usando las
+reglas de los campos del modelo (rangos, choices, longitudes). La inserción usa
+bulk_create por lotes; como bulk_create no dispara señales, los contadores de
+la matriz y la caché se actualizan aquí de una sola vez.
+"""
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .cache import invalidar_matrices
+from .models import MatrizRiesgo, RiesgoMatriz, CausaRiesgo, tabla_zonas_empresa
+
+TAMANO_LOTE = 500
+
+# Campos del frontend (camelCase) -> (campo del modelo, valor por defecto)
+# Un valor por defecto None indica que el campo es obligatorio.
+CAMPOS_RIESGO_FRONTEND = {
+    'numero': ('numero', None),
+    'fecha': ('fecha', None),
+    'codigo': ('codigo', ''),
+    'nombre': ('nombre', None),
+    'descripcion': ('descripcion', ''),
+    'efectos': ('efectos', ''),
+    'tipoRiesgo': ('tipo_riesgo', ''),
+    'probabilidad': ('probabilidad', 1),
+    'impacto': ('impacto', 1),
+    'controlesExistentes': ('controles_existentes', ''),
+    'tipoControl': ('tipo_control', 'Preventivo'),
+    'efectividadControl': ('efectividad_control', 0),
+    'controlesEvaluacion': ('controles_evaluacion', {}),
+    'tratamiento': ('tratamiento', ''),
+    'responsableControl': ('responsable_control', ''),
+    'aceptado': ('aceptado', False),
+}
+
+CAMPOS_CAUSA = {
+    'causa': ('causa', ''),
+    'factor': ('factor', ''),
+    'controles': ('controles', ''),
+}
+
+
+def _limpiar_campos(modelo, datos, campos, errores):
+    """Aplica Field.clean() (tipos, rangos, choices, longitudes) a cada campo mapeado"""
+    limpios = {}
+    for clave, (nombre_campo, por_defecto) in campos.items():
+        valor = datos.get(clave, por_defecto)
+        if valor is None:
+            errores[clave] = ['Este campo es obligatorio.']
+            continue
+        try:
+            limpios[nombre_campo] = modelo._meta.get_field(nombre_campo).clean(valor, None)
+        except ValidationError as e:
+            errores[clave] = e.messages
+    return limpios
+
+
+def _identificador(datos):
+    """Id enviado por el cliente para emparejar con una fila existente (None si no es válido)"""
+    identificador = datos.get('id')
+    if isinstance(identificador, int) and not isinstance(identificador, bool):
+        return identificador
+    return None
+
+
+def _sin_id(datos):
+    return {campo: valor for campo, valor in datos.items() if campo != 'id'}
+
+
+def validar_riesgo(datos, campos=CAMPOS_RIESGO_FRONTEND):
+    """
+    Valida un riesgo (con sus causas) sin consultar la base de datos.
+    Retorna (riesgo, causas, errores) con los datos ya convertidos a campos del modelo;
+    el 'id' enviado por el cliente se conserva para emparejar filas al sincronizar.
+    causas es None si el riesgo no incluye la clave 'causas'.
+    """
+    errores = {}
+    if not isinstance(datos, dict):
+        return None, [], {'non_field_errors': ['Se esperaba un objeto.']}
+
+    riesgo = _limpiar_campos(RiesgoMatriz, datos, campos, errores)
+    if _identificador(datos):
+        riesgo['id'] = _identificador(datos)
+    if 'nombre' in riesgo and not riesgo['nombre'].strip():
+        errores['nombre'] = ['El nombre del riesgo es obligatorio.']
+    if not riesgo.get('controles_evaluacion'):
+        riesgo['controles_evaluacion'] = RiesgoMatriz.controles_evaluacion_inicial()
+
+    causas = [] if 'causas' in datos else None
+    causas_data = datos.get('causas') or []
+    if not isinstance(causas_data, list):
+        errores['causas'] = ['Se esperaba una lista de causas.']
+        causas_data = []
+    for indice, causa_data in enumerate(causas_data):
+        errores_causa = {}
+        if not isinstance(causa_data, dict):
+            errores_causa['non_field_errors'] = ['Se esperaba un objeto.']
+        else:
+            causa = _limpiar_campos(CausaRiesgo, causa_data, CAMPOS_CAUSA, errores_causa)
+            if _identificador(causa_data):
+                causa['id'] = _identificador(causa_data)
+            causas.append(causa)
+        if errores_causa:
+            errores.setdefault('causas', {})[indice] = errores_causa
+
+    return riesgo, causas, errores
+
+
+def validar_riesgos(riesgos_data, campos=CAMPOS_RIESGO_FRONTEND):
+    """
+    Valida una lista de riesgos en una sola pasada, incluyendo números repetidos.
+    Retorna (riesgos, errores): riesgos es una lista de (riesgo, causas) y
+    errores un diccionario {índice: errores} vacío si todo es válido.
+    """
+    validos = []
+    errores = {}
+    numeros = set()
+    for indice, datos in enumerate(riesgos_data):
+        riesgo, causas, errores_riesgo = validar_riesgo(datos, campos)
+        numero = riesgo.get('numero') if riesgo else None
+        if numero is not None:
+            if numero in numeros:
+                errores_riesgo['numero'] = ['Número de riesgo repetido en la matriz.']
+            numeros.add(numero)
+        if errores_riesgo:
+            errores[indice] = errores_riesgo
+        else:
+            validos.append((riesgo, causas))
+    return validos, errores
+
+
+def insertar_riesgos(matriz, riesgos, tamano_lote=TAMANO_LOTE):
+    """
+    Inserta riesgos validados [(riesgo, causas), ...] en la matriz con bulk_create
+    por lotes, enlaza las causas sin consultas por fila y actualiza los contadores.
+    Retorna los riesgos creados.
+    """
+    creados = []
+    aportes = Counter()
+    tabla = tabla_zonas_empresa(matriz.empresa_id)
+    for inicio in range(0, len(riesgos), tamano_lote):
+        lote = riesgos[inicio:inicio + tamano_lote]
+        objetos = RiesgoMatriz.objects.bulk_create([
+            RiesgoMatriz(
+                matriz=matriz,
+                nivel_zona=tabla.nivel(riesgo['probabilidad'], riesgo['impacto']),
+                **_sin_id(riesgo)
+            )
+            for riesgo, _ in lote
+        ])
+
+        # Backends sin RETURNING: recuperar los ids del lote en una sola consulta
+        if any(objeto.pk is None for objeto in objetos):
+            ids = dict(
+                RiesgoMatriz.objects.filter(
+                    matriz=matriz, numero__in=[objeto.numero for objeto in objetos]
+                ).values_list('numero', 'id')
+            )
+            for objeto in objetos:
+                objeto.pk = ids[objeto.numero]
+
+        CausaRiesgo.objects.bulk_create([
+            CausaRiesgo(riesgo_id=objeto.pk, orden=orden, **_sin_id(causa))
+            for objeto, (_, causas) in zip(objetos, lote)
+            for orden, causa in enumerate(causas or [], 1)
+        ], batch_size=tamano_lote)
+
+        for objeto in objetos:
+            aportes.update(objeto.aporte_contadores())
+        creados.extend(objetos)
+
+    MatrizRiesgo.aplicar_deltas_contadores({matriz.pk: aportes})
+    invalidar_matrices([matriz.pk], [matriz.empresa_id])
+    return creados
+
+
+def _asignar_cambios(instancia, datos):
+    """Asigna solo los valores distintos; retorna el conjunto de campos modificados"""
+    modificados = set()
+    for campo, valor in datos.items():
+        if getattr(instancia, campo) != valor:
+            setattr(instancia, campo, valor)
+            modificados.add(campo)
+    return modificados
+
+
+def _emparejar(entrantes, existentes, clave_secundaria):
+    """
+    Empareja cada elemento entrante con una fila existente: primero por 'id' y
+    luego, entre las filas libres, por clave_secundaria(entrante) -> fila.
+    Retorna {índice entrante: fila existente}.
+    """
+    por_id = {fila.pk: fila for fila in existentes}
+    emparejados = {}
+    usados = set()
+    for indice, datos in enumerate(entrantes):
+        fila = por_id.get(datos.get('id'))
+        if fila is not None and fila.pk not in usados:
+            emparejados[indice] = fila
+            usados.add(fila.pk)
+    for indice, datos in enumerate(entrantes):
+        if indice in emparejados or datos.get('id') in por_id:
+            continue
+        fila = clave_secundaria(datos)
+        if fila is not None and fila.pk not in usados:
+            emparejados[indice] = fila
+            usados.add(fila.pk)
+    return emparejados
+
+
+def sincronizar_causas(causas_por_riesgo):
+    """
+    Sincroniza las causas de varios riesgos {riesgo_id: [causa, ...]} emparejando por
+    id o por posición (orden). Aplica un bulk_create, un bulk_update y un DELETE ... IN
+    y solo escribe las filas que cambiaron. Retorna el resumen de cambios.
+    """
+    existentes = defaultdict(list)
+    for causa in CausaRiesgo.objects.filter(riesgo_id__in=list(causas_por_riesgo)):
+        existentes[causa.riesgo_id].append(causa)
+
+    nuevas, modificadas, campos, eliminadas = [], [], set(), []
+    for riesgo_id, causas in causas_por_riesgo.items():
+        actuales = existentes.get(riesgo_id, [])
+        por_orden = {causa.orden: causa for causa in actuales}
+        entrantes = [dict(causa, orden=orden) for orden, causa in enumerate(causas, 1)]
+        emparejados = _emparejar(entrantes, actuales, lambda datos: por_orden.get(datos['orden']))
+
+        for indice, datos in enumerate(entrantes):
+            actual = emparejados.get(indice)
+            if actual is None:
+                nuevas.append(CausaRiesgo(riesgo_id=riesgo_id, **_sin_id(datos)))
+                continue
+            cambios = _asignar_cambios(actual, _sin_id(datos))
+            if cambios:
+                modificadas.append(actual)
+                campos |= cambios
+        usadas = {causa.pk for causa in emparejados.values()}
+        eliminadas.extend(causa.pk for causa in actuales if causa.pk not in usadas)
+
+    if eliminadas:
+        CausaRiesgo.objects.filter(pk__in=eliminadas).delete()
+    if modificadas:
+        CausaRiesgo.objects.bulk_update(modificadas, sorted(campos), batch_size=TAMANO_LOTE)
+    if nuevas:
+        CausaRiesgo.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE)
+
+    return {'creadas': len(nuevas), 'actualizadas': len(modificadas), 'eliminadas': len(eliminadas)}
+
+
+def _eliminar_en_bloque(modelo, columna, ids, tamano_lote=TAMANO_LOTE):
+    """DELETE FROM tabla WHERE columna IN (...) por lotes"""
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    columna = connection.ops.quote_name(columna)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(ids), tamano_lote):
+            lote = ids[inicio:inicio + tamano_lote]
+            cursor.execute(
+                f'DELETE FROM {tabla} WHERE {columna} IN ({", ".join(["%s"] * len(lote))})', lote
+            )
+
+
+def sincronizar_riesgos(matriz, riesgos, tamano_lote=TAMANO_LOTE):
+    """
+    Reconcilia los riesgos de la matriz con la lista validada [(riesgo, causas), ...].
+    Empareja por id o por número, y calcula inserciones, actualizaciones y eliminaciones:
+    los riesgos ausentes se eliminan con un solo DELETE ... IN, los modificados se
+    escriben con bulk_update y los nuevos con bulk_create. Retorna el resumen de cambios.
+    """
+    existentes = list(matriz.riesgos.all())
+    por_numero = {riesgo.numero: riesgo for riesgo in existentes}
+    numero_maximo = max(por_numero, default=0)
+    emparejados = _emparejar(
+        [riesgo for riesgo, _ in riesgos], existentes,
+        lambda datos: por_numero.get(datos['numero'])
+    )
+
+    tabla = tabla_zonas_empresa(matriz.empresa_id)
+    deltas = Counter()
+    modificados, campos = [], set()
+    numeros_anteriores = {}
+    causas_por_riesgo = {}
+    nuevos = []
+    for indice, (riesgo, causas) in enumerate(riesgos):
+        existente = emparejados.get(indice)
+        if existente is None:
+            nuevos.append((riesgo, causas))
+            continue
+        aporte_anterior = existente.aporte_contadores()
+        numero_anterior = existente.numero
+        cambios = _asignar_cambios(existente, _sin_id(riesgo))
+        if {'probabilidad', 'impacto'} & cambios:
+            cambios |= _asignar_cambios(
+                existente, {'nivel_zona': tabla.nivel(existente.probabilidad, existente.impacto)}
+            )
+        if cambios:
+            modificados.append(existente)
+            campos |= cambios
+            deltas.subtract(aporte_anterior)
+            deltas.update(existente.aporte_contadores())
+            if 'numero' in cambios:
+                numeros_anteriores[existente.pk] = numero_anterior
+        if causas is not None:
+            causas_por_riesgo[existente.pk] = causas
+
+    usados = {riesgo.pk for riesgo in emparejados.values()}
+    eliminados = [riesgo for riesgo in existentes if riesgo.pk not in usados]
+    for riesgo in eliminados:
+        deltas.subtract(riesgo.aporte_contadores())
+
+    with transaction.atomic():
+        if eliminados:
+            # DELETE ... IN directo, sin el Collector ni las señales por fila: los
+            # contadores se ajustan abajo con los deltas
+            ids = [riesgo.pk for riesgo in eliminados]
+            _eliminar_en_bloque(CausaRiesgo, 'riesgo_id', ids)
+            _eliminar_en_bloque(RiesgoMatriz, 'id', ids)
+
+        if modificados:
+            renumerados = [riesgo for riesgo in modificados if riesgo.pk in numeros_anteriores]
+            # Los números del payload son únicos: solo pueden chocar con el número
+            # anterior de otro riesgo renumerado (p. ej. al intercambiar 1 y 2)
+            ocupados = set(numeros_anteriores.values())
+            if any(riesgo.numero in ocupados for riesgo in renumerados):
+                desplazamiento = max([numero_maximo] + [riesgo.numero for riesgo in renumerados]) + 1
+                definitivos = {riesgo.pk: riesgo.numero for riesgo in renumerados}
+                for posicion, riesgo in enumerate(renumerados):
+                    riesgo.numero = desplazamiento + posicion
+                RiesgoMatriz.objects.bulk_update(renumerados, ['numero'], batch_size=tamano_lote)
+                for riesgo in renumerados:
+                    riesgo.numero = definitivos[riesgo.pk]
+            RiesgoMatriz.objects.bulk_update(modificados, sorted(campos), batch_size=tamano_lote)
+            for riesgo in modificados:
+                riesgo._aporte_guardado = (riesgo.matriz_id, riesgo.aporte_contadores())
+
+        resumen_causas = sincronizar_causas(causas_por_riesgo)
+        creados = insertar_riesgos(matriz, nuevos, tamano_lote) if nuevos else []
+        MatrizRiesgo.aplicar_deltas_contadores({matriz.pk: deltas})
+
+    invalidar_matrices([matriz.pk], [matriz.empresa_id])
+    return {
+        'riesgos_creados': len(creados),
+        'riesgos_actualizados': len(modificados),
+        'riesgos_eliminados': len(eliminados),
+        'causas': resumen_causas,
+    }
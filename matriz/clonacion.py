@@ -0,0 +1,92 @@
+# matriz/clonacion.py
+"""
+Clonación de matrices en el servidor.
+
+La matriz nueva se crea con save() (el id MR-... se genera una sola vez). Los riesgos
+y las causas se copian con dos sentencias INSERT ... SELECT dentro de la misma
+transacción, sin traer filas a Python: las causas se enlazan con su riesgo nuevo por
+(matriz, numero), que es único. La original queda bloqueada (select_for_update)
+mientras se copia, para que un cambio concurrente no deje la copia a medias.
+
+Los INSERT no disparan señales: los contadores de la copia se calculan al final con
+recalcular_contadores() sobre lo que realmente se copió (no se copian los de la
+original, que podrían estar desviados) y los índices de búsqueda se mantienen con
+triggers.
+"""
+from datetime import date
+
+from django.db import connections, router, transaction
+
+from .cache import invalidar_matrices
+from .models import CAMPOS_CONTADORES, CausaRiesgo, MatrizRiesgo, RiesgoMatriz
+
+
+def _columnas(modelo, excluir):
+    """Columnas concretas del modelo, sin la pk ni los campos de `excluir`"""
+    return [
+        campo.column for campo in modelo._meta.concrete_fields
+        if not campo.primary_key and campo.name not in excluir
+    ]
+
+
+def _copiar_riesgos(cursor, quote, origen_id, destino_id):
+    columnas = [quote(columna) for columna in _columnas(RiesgoMatriz, {'matriz'})]
+    cursor.execute(
+        f'INSERT INTO {quote(RiesgoMatriz._meta.db_table)} ({quote("matriz_id")}, {", ".join(columnas)}) '
+        f'SELECT %s, {", ".join(columnas)} FROM {quote(RiesgoMatriz._meta.db_table)} '
+        f'WHERE {quote("matriz_id")} = %s',
+        [destino_id, origen_id]
+    )
+    return cursor.rowcount
+
+
+def _copiar_causas(cursor, quote, origen_id, destino_id):
+    tabla_riesgos = quote(RiesgoMatriz._meta.db_table)
+    columnas = [quote(columna) for columna in _columnas(CausaRiesgo, {'riesgo'})]
+    cursor.execute(
+        f'INSERT INTO {quote(CausaRiesgo._meta.db_table)} ({quote("riesgo_id")}, {", ".join(columnas)}) '
+        f'SELECT nuevo.{quote("id")}, {", ".join(f"causa.{columna}" for columna in columnas)} '
+        f'FROM {quote(CausaRiesgo._meta.db_table)} causa '
+        f'INNER JOIN {tabla_riesgos} original ON original.{quote("id")} = causa.{quote("riesgo_id")} '
+        f'INNER JOIN {tabla_riesgos} nuevo ON nuevo.{quote("matriz_id")} = %s '
+        f'AND nuevo.{quote("numero")} = original.{quote("numero")} '
+        f'WHERE original.{quote("matriz_id")} = %s',
+        [destino_id, origen_id]
+    )
+    return cursor.rowcount
+
+
+def clonar_matriz(origen, usuario, **datos):
+    """
+    Copia la matriz `origen` con todos sus riesgos y causas en la misma empresa.
+    `datos` reemplaza nombre, descripción, responsable o fecha de creación de la copia.
+    Retorna (matriz nueva, riesgos copiados, causas copiadas).
+    """
+    alias = router.db_for_write(MatrizRiesgo)
+    conexion = connections[alias]
+    quote = conexion.ops.quote_name
+
+    with transaction.atomic(using=alias):
+        list(MatrizRiesgo.objects.using(alias).select_for_update().filter(pk=origen.pk).values_list('pk'))
+        matriz = MatrizRiesgo(
+            nombre=datos.get('nombre') or f'{origen.nombre} (copia)',
+            descripcion=datos.get('descripcion', origen.descripcion),
+            responsable=datos.get('responsable', origen.responsable),
+            fecha_creacion=datos.get('fecha_creacion') or date.today(),
+            creado_por=usuario,
+            empresa_id=origen.empresa_id,
+        )
+        # La empresa ya está cargada en la original; evita una consulta al generar el id
+        if MatrizRiesgo.empresa.is_cached(origen):
+            matriz.empresa = origen.empresa
+        matriz.save(using=alias)
+
+        with conexion.cursor() as cursor:
+            riesgos = _copiar_riesgos(cursor, quote, origen.pk, matriz.pk)
+            causas = _copiar_causas(cursor, quote, origen.pk, matriz.pk)
+
+        # Misma empresa y mismos umbrales: los riesgos conservan su zona guardada
+        MatrizRiesgo.objects.using(alias).filter(pk=matriz.pk).recalcular_contadores()
+        matriz.refresh_from_db(using=alias, fields=[*CAMPOS_CONTADORES, 'fecha_modificacion'])
+    invalidar_matrices([matriz.pk], [matriz.empresa_id])
+    return matriz, riesgos, causas
@@ -0,0 +1,48 @@
+# matriz/estadisticas.py
+"""
+Cálculos agregados sobre riesgos que no dependen de cargar los riesgos uno a uno.
+"""
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import ESCALA_RIESGO, TABLA_ZONAS_POR_DEFECTO
+
+def mapa_calor(riesgos, incluir_ids=False, tabla=TABLA_ZONAS_POR_DEFECTO):
+    """
+    Mapa de calor probabilidad × impacto (5×5) de un queryset de RiesgoMatriz, en una
+    sola consulta: un GROUP BY con los conteos o, con incluir_ids, las columnas
+    (probabilidad, impacto, id) sin instanciar modelos. La zona de cada celda sale de
+    la tabla de zonas indicada (la de la empresa).
+    """
+    ids = defaultdict(list)
+    if incluir_ids:
+        for probabilidad, impacto, riesgo_id in (
+            riesgos.order_by('id').values_list('probabilidad', 'impacto', 'id')
+        ):
+            ids[probabilidad, impacto].append(riesgo_id)
+        conteos = {celda: len(ids_celda) for celda, ids_celda in ids.items()}
+    else:
+        conteos = {
+            (fila['probabilidad'], fila['impacto']): fila['total']
+            for fila in (
+                riesgos.order_by()
+                .values('probabilidad', 'impacto')
+                .annotate(total=Count('id'))
+            )
+        }
+
+    celdas = []
+    for probabilidad in ESCALA_RIESGO:
+        for impacto in ESCALA_RIESGO:
+            celda = {
+                'probabilidad': probabilidad,
+                'impacto': impacto,
+                'total': conteos.get((probabilidad, impacto), 0),
+                'zona': tabla.zona(probabilidad, impacto),
+            }
+            if incluir_ids:
+                celda['ids'] = ids[probabilidad, impacto]
+            celdas.append(celda)
+
+    return {'total_riesgos': sum(conteos.values()), 'celdas': celdas}
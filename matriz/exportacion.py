@@ -0,0 +1,120 @@
+# matriz/exportacion.py
+"""
+Exportación de matrices de riesgo en CSV o NDJSON, por fragmentos.
+
+Los riesgos y sus causas se recorren con iterar_riesgos_con_causas (dos consultas,
+cursores por lotes), así que la memoria no depende del tamaño del registro exportado.
+- CSV: una fila por causa, repitiendo los datos del riesgo; un riesgo sin causas
+  ocupa una fila con las columnas de causa vacías. La evaluación de controles va
+  aplanada en columnas evaluacion_<criterio>.
+- NDJSON: un objeto JSON por riesgo con sus causas anidadas.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import RiesgoMatriz
+from .serializacion import agrupar_fragmentos, iterar_riesgos_con_causas
+
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+CAMPOS_RIESGO_EXPORTACION = [
+    'matriz_id', 'matriz__nombre', 'numero', 'fecha', 'codigo', 'nombre', 'descripcion',
+    'efectos', 'tipo_riesgo', 'probabilidad', 'impacto', 'controles_existentes',
+    'tipo_control', 'efectividad_control', 'controles_evaluacion', 'tratamiento',
+    'responsable_control', 'aceptado', 'nivel_zona',
+]
+
+CAMPOS_CAUSA_EXPORTACION = ['orden', 'causa', 'factor', 'controles']
+
+CRITERIOS_EVALUACION = list(RiesgoMatriz.controles_evaluacion_inicial())
+
+COLUMNAS_CSV = [
+    'matriz_id', 'matriz_nombre', 'numero', 'fecha', 'codigo', 'nombre', 'descripcion',
+    'efectos', 'tipo_riesgo', 'probabilidad', 'impacto', 'valor_riesgo', 'zona_riesgo',
+    'controles_existentes', 'tipo_control', 'efectividad_control',
+    *[f'evaluacion_{criterio}' for criterio in CRITERIOS_EVALUACION],
+    'tratamiento', 'responsable_control', 'aceptado',
+    'causa_orden', 'causa', 'causa_factor', 'causa_controles',
+]
+
+
+def riesgo_exportable(riesgo, causas):
+    """Fila values() de riesgo + causas -> registro de exportación con valor y zona"""
+    registro = {
+        campo: valor for campo, valor in riesgo.items()
+        if campo not in ('id', 'matriz__nombre', 'nivel_zona')
+    }
+    registro['matriz_nombre'] = riesgo['matriz__nombre']
+    registro['valor_riesgo'] = riesgo['probabilidad'] * riesgo['impacto']
+    registro['zona_riesgo'] = riesgo['nivel_zona']
+    registro['causas'] = causas
+    return registro
+
+
+def iterar_registros(matriz_ids):
+    """Itera los riesgos exportables de las matrices (lista de ids o queryset de pks)"""
+    for riesgo, causas in iterar_riesgos_con_causas(
+        matriz_ids, CAMPOS_RIESGO_EXPORTACION, campos_causa=CAMPOS_CAUSA_EXPORTACION
+    ):
+        yield riesgo_exportable(riesgo, causas)
+
+
+def filas_csv(registro):
+    """Aplana un riesgo exportable en una fila CSV por causa"""
+    evaluacion = registro['controles_evaluacion'] or {}
+    base = [
+        registro['matriz_id'], registro['matriz_nombre'], registro['numero'], registro['fecha'],
+        registro['codigo'], registro['nombre'], registro['descripcion'], registro['efectos'],
+        registro['tipo_riesgo'], registro['probabilidad'], registro['impacto'],
+        registro['valor_riesgo'], registro['zona_riesgo'], registro['controles_existentes'],
+        registro['tipo_control'], registro['efectividad_control'],
+        *[evaluacion.get(criterio, False) for criterio in CRITERIOS_EVALUACION],
+        registro['tratamiento'], registro['responsable_control'], registro['aceptado'],
+    ]
+    if not registro['causas']:
+        yield base + ['', '', '', '']
+    for causa in registro['causas']:
+        yield base + [causa['orden'], causa['causa'], causa['factor'], causa['controles']]
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: retorna lo escrito en lugar de guardarlo"""
+
+    def write(self, valor):
+        return valor
+
+
+def exportar_csv(matriz_ids):
+    """Genera el CSV por fragmentos (con BOM para que Excel detecte UTF-8)"""
+    escritor = csv.writer(_Eco())
+
+    def piezas():
+        yield '\ufeff'
+        yield escritor.writerow(COLUMNAS_CSV)
+        for registro in iterar_registros(matriz_ids):
+            for fila in filas_csv(registro):
+                yield escritor.writerow(fila)
+
+    return agrupar_fragmentos(piezas())
+
+
+def exportar_ndjson(matriz_ids):
+    """Genera NDJSON por fragmentos: un riesgo (con sus causas) por línea"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def piezas():
+        for registro in iterar_registros(matriz_ids):
+            yield encoder.encode(registro)
+            yield '\n'
+
+    return agrupar_fragmentos(piezas())
+
+
+GENERADORES_EXPORTACION = {
+    'csv': exportar_csv,
+    'ndjson': exportar_ndjson,
+}
@@ -0,0 +1,184 @@
+# matriz/importacion.py
+"""
+Importación masiva de riesgos desde CSV o NDJSON.
+
+El archivo se lee de forma incremental; cada riesgo se valida en memoria con las reglas
+de los campos del modelo (validar_riesgo) y los válidos se insertan por lotes con
+insertar_riesgos, cada lote en su propia transacción. Las filas con errores se omiten
+y se reportan con su número de línea.
+
+La importación no es atómica: si la inserción de un lote falla, los lotes anteriores
+quedan confirmados, la lectura se detiene y el reporte lo indica en 'interrumpido'
+({'fila': primera línea del lote fallido, 'error'}); 'riesgos_creados' cuenta solo lo
+confirmado. Reintentar con el mismo archivo es seguro: los números ya importados se
+reportan como repetidos.
+
+Formatos (mismas columnas que la exportación, ver exportacion.py):
+- CSV: una fila por causa; las filas consecutivas con el mismo número forman un riesgo.
+  La evaluación de controles se lee de las columnas evaluacion_<criterio>.
+- NDJSON: un objeto por línea con los campos del modelo y una lista 'causas'.
+"""
+import csv
+import io
+import json
+
+from django.db import DatabaseError, transaction
+
+from .carga_riesgos import CAMPOS_RIESGO_FRONTEND, TAMANO_LOTE, insertar_riesgos, validar_riesgo
+from .exportacion import CRITERIOS_EVALUACION
+from .models import RiesgoMatriz
+
+FORMATOS_IMPORTACION = ['csv', 'ndjson']
+
+# Campo del modelo -> (campo del modelo, valor por defecto)
+CAMPOS_RIESGO_IMPORTACION = {campo: (campo, defecto) for campo, defecto in CAMPOS_RIESGO_FRONTEND.values()}
+
+CAMPOS_BOOLEANOS = {'aceptado'}
+
+VALORES_VERDADEROS = {'true', 't', '1', 'si', 'sí', 's', 'x', 'yes', 'verdadero'}
+
+MAXIMO_ERRORES_REPORTADOS = 1000
+
+
+def _booleano(valor):
+    if isinstance(valor, str):
+        return valor.strip().lower() in VALORES_VERDADEROS
+    return bool(valor)
+
+
+def _riesgo_desde_csv(fila):
+    """Fila CSV -> datos del riesgo (sin causas); las celdas vacías toman el valor por defecto"""
+    datos = {
+        campo: (_booleano(fila[campo]) if campo in CAMPOS_BOOLEANOS else fila[campo])
+        for campo in CAMPOS_RIESGO_IMPORTACION
+        if fila.get(campo) not in (None, '')
+    }
+    if any(f'evaluacion_{criterio}' in fila for criterio in CRITERIOS_EVALUACION):
+        datos['controles_evaluacion'] = {
+            criterio: _booleano(fila.get(f'evaluacion_{criterio}') or '')
+            for criterio in CRITERIOS_EVALUACION
+        }
+    datos['causas'] = []
+    return datos
+
+
+def _causa_desde_csv(fila):
+    if not (fila.get('causa') or '').strip():
+        return None
+    return {
+        'causa': fila['causa'],
+        'factor': fila.get('causa_factor') or '',
+        'controles': fila.get('causa_controles') or '',
+    }
+
+
+def leer_csv(archivo):
+    """Itera (línea, datos, error) agrupando en un riesgo las filas consecutivas del mismo número"""
+    # Los archivos subidos de Django envuelven el archivo real en .file
+    texto = io.TextIOWrapper(getattr(archivo, 'file', archivo), encoding='utf-8-sig', newline='')
+    lector = csv.DictReader(texto)
+    actual, linea_actual = None, None
+    try:
+        for fila in lector:
+            linea = lector.line_num
+            numero = (fila.get('numero') or '').strip()
+            if actual is not None and numero and numero == str(actual.get('numero', '')).strip():
+                causa = _causa_desde_csv(fila)
+                if causa:
+                    actual['causas'].append(causa)
+                continue
+            if actual is not None:
+                yield linea_actual, actual, None
+            actual, linea_actual = _riesgo_desde_csv(fila), linea
+            causa = _causa_desde_csv(fila)
+            if causa:
+                actual['causas'].append(causa)
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield lector.line_num, None, {'non_field_errors': [f'Archivo CSV inválido: {e}']}
+        return
+    finally:
+        texto.detach()
+    if actual is not None:
+        yield linea_actual, actual, None
+
+
+def leer_ndjson(archivo):
+    """Itera (línea, datos, error) con un riesgo por línea"""
+    for linea, contenido in enumerate(archivo, 1):
+        try:
+            contenido = contenido.decode('utf-8-sig').strip()
+        except UnicodeDecodeError:
+            yield linea, None, {'non_field_errors': ['La línea no está codificada en UTF-8.']}
+            continue
+        if not contenido:
+            continue
+        try:
+            yield linea, json.loads(contenido), None
+        except json.JSONDecodeError as e:
+            yield linea, None, {'non_field_errors': [f'JSON inválido: {e.msg}']}
+
+
+LECTORES_IMPORTACION = {
+    'csv': leer_csv,
+    'ndjson': leer_ndjson,
+}
+
+
+def importar_riesgos(matriz, archivo, formato, simular=False, tamano_lote=TAMANO_LOTE):
+    """
+    Importa los riesgos del archivo en la matriz. Los números ya usados en la matriz
+    se consultan una sola vez al inicio. Retorna el reporte:
+    {'riesgos_leidos', 'riesgos_creados', 'total_errores', 'errores': [{'fila', 'numero', 'errores'}],
+     'interrumpido': None o {'fila', 'error'} (ver el módulo)}
+    """
+    numeros = set(RiesgoMatriz.objects.filter(matriz=matriz).values_list('numero', flat=True))
+    reporte = {
+        'riesgos_leidos': 0, 'riesgos_creados': 0, 'total_errores': 0, 'errores': [], 'interrumpido': None
+    }
+    lote, primera_linea = [], None
+
+    def registrar_error(linea, numero, errores):
+        reporte['total_errores'] += 1
+        if len(reporte['errores']) < MAXIMO_ERRORES_REPORTADOS:
+            reporte['errores'].append({'fila': linea, 'numero': numero, 'errores': errores})
+
+    def insertar(lote, linea):
+        """Inserta el lote; retorna False (y lo reporta) si falló"""
+        if lote and not simular:
+            try:
+                with transaction.atomic():
+                    insertar_riesgos(matriz, lote, tamano_lote)
+            except DatabaseError as e:
+                reporte['interrumpido'] = {'fila': linea, 'error': str(e)}
+                return False
+        reporte['riesgos_creados'] += len(lote)
+        return True
+
+    for linea, datos, error in LECTORES_IMPORTACION[formato](archivo):
+        if error:
+            registrar_error(linea, None, error)
+            continue
+        reporte['riesgos_leidos'] += 1
+
+        riesgo, causas, errores = validar_riesgo(datos, CAMPOS_RIESGO_IMPORTACION)
+        numero = riesgo.get('numero') if riesgo else None
+        if numero is not None and numero in numeros:
+            errores['numero'] = ['Ya existe un riesgo con este número en la matriz.']
+        if errores:
+            if numero is None and isinstance(datos, dict):
+                numero = datos.get('numero')
+            registrar_error(linea, numero, errores)
+            continue
+
+        riesgo.pop('id', None)
+        numeros.add(numero)
+        if not lote:
+            primera_linea = linea
+        lote.append((riesgo, causas))
+        if len(lote) >= tamano_lote:
+            if not insertar(lote, primera_linea):
+                return reporte
+            lote = []
+
+    insertar(lote, primera_linea)
+    return reporte
@@ -0,0 +1,109 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from matriz.archivo_auditoria import (
+    DIRECTORIO, EscritorSegmento, cargar_manifiesto, guardar_manifiesto, registro_archivable
+)
+from matriz.models import AuditoriaMatriz
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los registros de auditoría de matrices anteriores a N días a segmentos '
+        'JSONL comprimidos (uno por mes) y actualiza el manifiesto del archivo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=365,
+            help='Archivar registros con más de N días de antigüedad (por defecto 365)'
+        )
+        parser.add_argument(
+            '--directorio', default=DIRECTORIO,
+            help='Directorio del archivo (por defecto MATRIZ_AUDITORIA_ARCHIVO)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Registros leídos y eliminados por lote (por defecto 2000)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo reportar cuántos registros se archivarían'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor o igual a 1')
+
+        directorio = options['directorio']
+        chunk_size = options['chunk_size']
+        corte = timezone.now() - timedelta(days=options['dias'])
+        antiguos = AuditoriaMatriz.objects.filter(fecha_accion__lt=corte)
+
+        if options['dry_run']:
+            self.stdout.write(f'Se archivarían {antiguos.count()} registros anteriores a {corte:%Y-%m-%d %H:%M}')
+            return
+
+        os.makedirs(directorio, exist_ok=True)
+        sello = timezone.now().strftime('%Y%m%d%H%M%S')
+        segmentos = []
+        archivados = []
+        escritor = None
+        ultimo = (None, 0)
+
+        try:
+            while True:
+                # Paginación por clave (fecha, id): los segmentos quedan en orden cronológico
+                lote = antiguos.select_related('matriz', 'usuario').order_by('fecha_accion', 'pk')
+                fecha, pk = ultimo
+                if fecha is not None:
+                    lote = lote.filter(fecha_accion__gte=fecha).exclude(fecha_accion=fecha, pk__lte=pk)
+                lote = list(lote[:chunk_size])
+                if not lote:
+                    break
+
+                for registro in lote:
+                    mes = registro.fecha_accion.strftime('%Y-%m')
+                    nombre = f'auditoria-{mes}-{sello}.jsonl.gz'
+                    if escritor is None or escritor.nombre != nombre:
+                        if escritor is not None:
+                            segmentos.append(escritor.cerrar())
+                        escritor = EscritorSegmento(directorio, nombre)
+                    escritor.escribir(registro_archivable(registro))
+                    archivados.append(registro.pk)
+
+                ultimo = (lote[-1].fecha_accion, lote[-1].pk)
+
+            if escritor is not None:
+                segmentos.append(escritor.cerrar())
+                escritor = None
+        except Exception:
+            if escritor is not None:
+                escritor.descartar()
+            raise
+
+        if not segmentos:
+            self.stdout.write('No hay registros para archivar.')
+            return
+
+        # Primero se publica el manifiesto y luego se eliminan las filas: ante una falla
+        # intermedia puede haber duplicados (la lectura los descarta), nunca pérdidas.
+        manifiesto = cargar_manifiesto(directorio)
+        manifiesto['segmentos'].extend(segmentos)
+        guardar_manifiesto(manifiesto, directorio)
+
+        for inicio in range(0, len(archivados), chunk_size):
+            AuditoriaMatriz.objects.filter(pk__in=archivados[inicio:inicio + chunk_size]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(archivados)} registros archivados en {len(segmentos)} segmentos ({directorio})'
+        ))
+        if options['verbosity'] >= 2:
+            for segmento in segmentos:
+                self.stdout.write(
+                    f"  {segmento['archivo']}: {segmento['registros']} registros, "
+                    f"{segmento['desde']} - {segmento['hasta']}"
+                )
@@ -0,0 +1,97 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from empresa.models import Empresa
+from users.models import CustomUser
+from matriz.serializers import MatrizRiesgoFrontendSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el tiempo y el número de consultas de la creación de matrices desde '
+        'el frontend (create-frontend). Todo se ejecuta en una transacción que se revierte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos', type=int, nargs='+', default=[10, 100, 1000],
+            help='Número de riesgos de cada matriz medida (por defecto 10 100 1000)'
+        )
+        parser.add_argument(
+            '--causas', type=int, default=3, help='Causas por riesgo (por defecto 3)'
+        )
+        parser.add_argument(
+            '--repeticiones', type=int, default=3, help='Repeticiones por tamaño (por defecto 3)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                request = APIRequestFactory().post('/api/matriz/matrices/create-frontend/')
+                request.user = self._usuario_temporal()
+                for tamano in options['tamanos']:
+                    self._medir(request, tamano, options['causas'], options['repeticiones'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _usuario_temporal(self):
+        empresa = Empresa.objects.create(
+            nombre='Benchmark', nit='BENCH-0001', direccion='N/A',
+            email='benchmark@example.com', telefono='0000000000'
+        )
+        return CustomUser.objects.create(
+            document='BENCH0001', first_name='Bench', last_name='Mark',
+            email='benchmark-user@example.com', phone='0000000000', empresa=empresa
+        )
+
+    def _payload(self, tamano, causas):
+        return {
+            'nombre': f'Benchmark {tamano} riesgos',
+            'fechaCreacion': date.today().isoformat(),
+            'riesgos': [
+                {
+                    'numero': numero,
+                    'fecha': date.today().isoformat(),
+                    'nombre': f'Riesgo {numero}',
+                    'tipoRiesgo': 'Operativo',
+                    'probabilidad': numero % 5 + 1,
+                    'impacto': (numero * 3) % 5 + 1,
+                    'efectividadControl': numero % 101,
+                    'causas': [
+                        {'causa': f'Causa {orden} del riesgo {numero}', 'factor': 'Personas'}
+                        for orden in range(1, causas + 1)
+                    ],
+                }
+                for numero in range(1, tamano + 1)
+            ],
+        }
+
+    def _medir(self, request, tamano, causas, repeticiones):
+        tiempos = []
+        consultas = 0
+        for _ in range(repeticiones):
+            payload = self._payload(tamano, causas)
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                serializer = MatrizRiesgoFrontendSerializer(data=payload, context={'request': request})
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                tiempos.append(time.perf_counter() - inicio)
+            consultas = len(capturadas)
+
+        self.stdout.write(
+            f'{tamano:>6} riesgos x {causas} causas: '
+            f'mejor {min(tiempos) * 1000:8.1f} ms, '
+            f'promedio {sum(tiempos) / len(tiempos) * 1000:8.1f} ms, '
+            f'{consultas} consultas'
+        )
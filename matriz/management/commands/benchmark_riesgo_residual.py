@@ -0,0 +1,115 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from empresa.models import Empresa
+from matriz.models import TABLA_ZONAS_POR_DEFECTO, MatrizRiesgo, RiesgoMatriz
+from matriz.riesgo_residual import (
+    CRITERIOS_CONTROL, criterios_cumplidos, residual, resumen_residual
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el cálculo del riesgo residual por columnas (values_list) con el cálculo '
+        'instancia por instancia sobre riesgos sintéticos. Todo se ejecuta en una '
+        'transacción que se revierte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--riesgos', type=int, default=100000, help='Número de riesgos sintéticos (por defecto 100000)'
+        )
+        parser.add_argument(
+            '--matrices', type=int, default=10, help='Matrices entre las que se reparten (por defecto 10)'
+        )
+        parser.add_argument(
+            '--repeticiones', type=int, default=3, help='Repeticiones por método (por defecto 3)'
+        )
+        parser.add_argument('--semilla', type=int, default=0, help='Semilla de los datos aleatorios')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                inicio = time.perf_counter()
+                empresa = self._poblar(options['riesgos'], options['matrices'], options['semilla'])
+                self.stdout.write(
+                    f'{options["riesgos"]} riesgos generados en {time.perf_counter() - inicio:.1f} s'
+                )
+                riesgos = RiesgoMatriz.objects.filter(matriz__empresa=empresa)
+                por_instancia = self._medir(
+                    'Instancia por instancia', lambda: self._por_instancia(riesgos), options['repeticiones']
+                )
+                por_columnas = self._medir(
+                    'Por columnas', lambda: resumen_residual(riesgos), options['repeticiones']
+                )
+                if por_instancia != por_columnas['riesgos_por_nivel_residual']:
+                    self.stderr.write(self.style.ERROR('Los dos métodos no coinciden'))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _poblar(self, total, numero_matrices, semilla):
+        aleatorio = random.Random(semilla)
+        empresa = Empresa.objects.create(
+            nombre='Benchmark', nit='BENCH-RESIDUAL', direccion='N/A',
+            email='benchmark@example.com', telefono='0000000000'
+        )
+        matrices = [
+            MatrizRiesgo.objects.create(nombre=f'Benchmark {indice}', fecha_creacion=date.today(), empresa=empresa)
+            for indice in range(numero_matrices)
+        ]
+        tipos = [tipo for tipo, _ in RiesgoMatriz.TIPOS_CONTROL]
+        riesgos = []
+        for numero in range(total):
+            probabilidad, impacto = aleatorio.randint(1, 5), aleatorio.randint(1, 5)
+            riesgos.append(RiesgoMatriz(
+                matriz=matrices[numero % numero_matrices],
+                numero=numero // numero_matrices + 1,
+                fecha=date.today(),
+                nombre=f'Riesgo {numero}',
+                probabilidad=probabilidad,
+                impacto=impacto,
+                nivel_zona=TABLA_ZONAS_POR_DEFECTO.nivel(probabilidad, impacto),
+                tipo_control=aleatorio.choice(tipos),
+                efectividad_control=aleatorio.randint(0, 100),
+                controles_evaluacion={criterio: aleatorio.random() < 0.5 for criterio in CRITERIOS_CONTROL},
+            ))
+        RiesgoMatriz.objects.bulk_create(riesgos, batch_size=2000)
+        return empresa
+
+    def _por_instancia(self, riesgos):
+        """Referencia: modelos completos y una llamada por riesgo"""
+        conteos = {}
+        for riesgo in riesgos.order_by().iterator(chunk_size=2000):
+            probabilidad, impacto = residual(
+                riesgo.probabilidad, riesgo.impacto, riesgo.tipo_control,
+                riesgo.efectividad_control, criterios_cumplidos(riesgo.controles_evaluacion)
+            )
+            nivel = TABLA_ZONAS_POR_DEFECTO.nivel(probabilidad, impacto).replace(' ', '_')
+            conteos[nivel] = conteos.get(nivel, 0) + 1
+        return {nivel: conteos.get(nivel, 0) for nivel in
+                (nivel.replace(' ', '_') for nivel in TABLA_ZONAS_POR_DEFECTO.umbrales)}
+
+    def _medir(self, nombre, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resultado = funcion()
+                tiempos.append(time.perf_counter() - inicio)
+            consultas = len(capturadas)
+
+        self.stdout.write(
+            f'{nombre:>24}: mejor {min(tiempos) * 1000:8.1f} ms, '
+            f'promedio {sum(tiempos) / len(tiempos) * 1000:8.1f} ms, {consultas} consultas'
+        )
+        return resultado
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from matriz.models import MatrizRiesgo, olvidar_umbrales, reclasificar_riesgos
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la zona guardada de los riesgos con los umbrales vigentes de cada '
+        'empresa (UPDATE en bloque por empresa) y corrige los contadores de las matrices'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa', help='Limitar la reclasificación a una empresa (id)'
+        )
+
+    def handle(self, *args, **options):
+        if options['empresa']:
+            empresas = [options['empresa']]
+        else:
+            empresas = list(
+                MatrizRiesgo.objects.order_by().values_list('empresa_id', flat=True).distinct()
+            )
+
+        total = 0
+        for empresa_id in empresas:
+            # Releer los umbrales de la base de datos, no de la caché
+            olvidar_umbrales(empresa_id)
+            reclasificados = reclasificar_riesgos(empresa_id)
+            total += reclasificados
+            if options['verbosity'] >= 2 and reclasificados:
+                self.stdout.write(f'  {empresa_id}: {reclasificados} riesgos reclasificados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} riesgos reclasificados en {len(empresas)} empresas'
+        ))
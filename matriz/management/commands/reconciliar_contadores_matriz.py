@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from matriz.models import MatrizRiesgo
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica los contadores desnormalizados de las matrices de riesgo contra '
+        'sus riesgos, por lotes, y corrige las desviaciones encontradas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Número de matrices verificadas por lote (por defecto 500)'
+        )
+        parser.add_argument(
+            '--empresa', help='Limitar la verificación a las matrices de una empresa (id)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo reportar las desviaciones, sin corregirlas'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        matrices = MatrizRiesgo.objects.all()
+        if options['empresa']:
+            matrices = matrices.filter(empresa_id=options['empresa'])
+
+        verificadas = 0
+        desviadas = 0
+        ultimo_id = ''
+
+        while True:
+            # Paginación por clave para no usar OFFSET sobre tablas grandes
+            ids = list(
+                matrices.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            lote = MatrizRiesgo.objects.filter(pk__in=ids)
+
+            if dry_run:
+                desviaciones = {
+                    matriz.pk: matriz.diferencias_contadores()
+                    for matriz in lote.order_by().con_contadores_reales()
+                }
+                desviaciones = {pk: dif for pk, dif in desviaciones.items() if dif}
+            else:
+                with transaction.atomic():
+                    # Bloquear las matrices del lote frente a deltas concurrentes
+                    list(lote.select_for_update().values_list('pk', flat=True))
+                    desviaciones = lote.recalcular_contadores()
+
+            verificadas += len(ids)
+            desviadas += len(desviaciones)
+            if options['verbosity'] >= 2:
+                for matriz_id, diferencias in desviaciones.items():
+                    detalle = ', '.join(
+                        f'{campo}: {guardado} -> {real}'
+                        for campo, (guardado, real) in diferencias.items()
+                    )
+                    self.stdout.write(f'  {matriz_id}: {detalle}')
+
+        accion = 'con desviaciones' if dry_run else 'corregidas'
+        self.stdout.write(self.style.SUCCESS(
+            f'Matrices verificadas: {verificadas}. Matrices {accion}: {desviadas}.'
+        ))
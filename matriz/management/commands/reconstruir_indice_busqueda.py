@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from matriz.busqueda import backend_busqueda
+
+
+class Command(BaseCommand):
+    help = (
+        'Reinstala (si falta) y reconstruye el índice de texto completo de riesgos y '
+        'matrices (FTS5 en SQLite, tsvector + GIN en PostgreSQL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        backend = backend_busqueda(conexion)
+        if not backend.clasifica:
+            self.stdout.write(f'El motor {conexion.vendor} usa búsqueda sin índice; no hay nada que reconstruir')
+            return
+
+        with transaction.atomic(using=options['database']), conexion.cursor() as cursor:
+            backend.instalar(cursor)
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda ({backend.nombre}) reconstruido'))
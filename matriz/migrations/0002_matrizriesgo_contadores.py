@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-19 01:07
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def poblar_contadores(apps, schema_editor):
+    """Inicializa los contadores de las matrices existentes desde sus riesgos"""
+    MatrizRiesgo = apps.get_model('matriz', 'MatrizRiesgo')
+    RiesgoMatriz = apps.get_model('matriz', 'RiesgoMatriz')
+
+    umbrales = [(15, 'conteo_extrema'), (10, 'conteo_alta'), (6, 'conteo_moderada'), (3, 'conteo_baja'), (0, 'conteo_muy_baja')]
+    contadores = defaultdict(Counter)
+    filas = RiesgoMatriz.objects.order_by().values(
+        'matriz_id', 'probabilidad', 'impacto', 'aceptado'
+    ).annotate(total=Count('id'), efectividad=Sum('efectividad_control'))
+
+    for fila in filas:
+        valor = fila['probabilidad'] * fila['impacto']
+        campo_nivel = next(campo for minimo, campo in umbrales if valor >= minimo)
+        contador = contadores[fila['matriz_id']]
+        contador['conteo_riesgos'] += fila['total']
+        contador[campo_nivel] += fila['total']
+        if fila['aceptado']:
+            contador['conteo_aceptados'] += fila['total']
+        contador['suma_efectividad_control'] += fila['efectividad'] or 0
+
+    for matriz_id, contador in contadores.items():
+        MatrizRiesgo.objects.filter(pk=matriz_id).update(**contador)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matriz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_aceptados',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos aceptados'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_alta',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos en zona alta'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_baja',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos en zona baja'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_extrema',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos en zona extrema'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_moderada',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos en zona moderada'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_muy_baja',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Riesgos en zona muy baja'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='conteo_riesgos',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total de riesgos'),
+        ),
+        migrations.AddField(
+            model_name='matrizriesgo',
+            name='suma_efectividad_control',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Suma de efectividad de controles'),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
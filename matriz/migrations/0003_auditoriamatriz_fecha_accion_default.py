@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 01:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matriz', '0002_matrizriesgo_contadores'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditoriamatriz',
+            name='fecha_accion',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
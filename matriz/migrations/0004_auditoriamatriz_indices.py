@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 01:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matriz', '0003_auditoriamatriz_fecha_accion_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditoriamatriz',
+            index=models.Index(fields=['matriz', 'fecha_accion'], name='auditoria_matriz_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoriamatriz',
+            index=models.Index(fields=['fecha_accion'], name='auditoria_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-19 01:23
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+
+
+def poblar_nivel_zona(apps, schema_editor):
+    """Clasifica los riesgos existentes con los umbrales por defecto en una sola UPDATE"""
+    RiesgoMatriz = apps.get_model('matriz', 'RiesgoMatriz')
+    valor = F('probabilidad') * F('impacto')
+    RiesgoMatriz.objects.update(nivel_zona=Case(
+        When(GreaterThanOrEqual(valor, 15), then=Value('EXTREMA')),
+        When(GreaterThanOrEqual(valor, 10), then=Value('ALTA')),
+        When(GreaterThanOrEqual(valor, 6), then=Value('MODERADA')),
+        When(GreaterThanOrEqual(valor, 3), then=Value('BAJA')),
+        default=Value('MUY BAJA'),
+        output_field=models.CharField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0004_empresa_tamaño_empresa_url'),
+        ('matriz', '0004_auditoriamatriz_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='riesgomatriz',
+            name='nivel_zona',
+            field=models.CharField(choices=[('EXTREMA', 'Extrema'), ('ALTA', 'Alta'), ('MODERADA', 'Moderada'), ('BAJA', 'Baja'), ('MUY BAJA', 'Muy Baja')], db_index=True, default='MUY BAJA', editable=False, max_length=10, verbose_name='Zona de Riesgo'),
+        ),
+        migrations.CreateModel(
+            name='ConfiguracionZonasRiesgo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minimo_extrema', models.PositiveSmallIntegerField(default=15, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(25)], verbose_name='Mínimo zona extrema')),
+                ('minimo_alta', models.PositiveSmallIntegerField(default=10, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(25)], verbose_name='Mínimo zona alta')),
+                ('minimo_moderada', models.PositiveSmallIntegerField(default=6, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(25)], verbose_name='Mínimo zona moderada')),
+                ('minimo_baja', models.PositiveSmallIntegerField(default=3, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(25)], verbose_name='Mínimo zona baja')),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True)),
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='configuracion_zonas_riesgo', to='empresa.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Configuración de Zonas de Riesgo',
+                'verbose_name_plural': 'Configuraciones de Zonas de Riesgo',
+            },
+        ),
+        migrations.RunPython(poblar_nivel_zona, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+import django.db.models.deletion
+import matriz.models
+from django.db import migrations, models
+
+
+def instalar_indice(apps, schema_editor):
+    """Crea las tablas del índice de texto completo y sus triggers según el motor, y lo llena"""
+    from matriz.busqueda import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend:
+        with schema_editor.connection.cursor() as cursor:
+            backend().instalar(cursor)
+
+
+def desinstalar_indice(apps, schema_editor):
+    from matriz.busqueda import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend:
+        with schema_editor.connection.cursor() as cursor:
+            backend().desinstalar(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matriz', '0005_zonas_riesgo_configurables'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar_indice, desinstalar_indice),
+        migrations.CreateModel(
+            name='IndiceBusquedaRiesgo',
+            fields=[
+                ('riesgo', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='indice_busqueda', serialize=False, to='matriz.riesgomatriz')),
+                ('empresa_id', models.CharField(max_length=14)),
+                ('documento', matriz.models.DocumentoBusquedaField()),
+            ],
+            options={
+                'db_table': 'matriz_riesgo_busqueda',
+                'managed': False,
+            },
+        ),
+    ]
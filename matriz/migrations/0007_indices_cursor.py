@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 02:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0004_empresa_tamaño_empresa_url'),
+        ('matriz', '0006_busqueda_texto_completo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='auditoriamatriz',
+            name='auditoria_matriz_fecha_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='auditoriamatriz',
+            name='auditoria_fecha_idx',
+        ),
+        migrations.AddIndex(
+            model_name='auditoriamatriz',
+            index=models.Index(fields=['matriz', 'fecha_accion', 'id'], name='auditoria_matriz_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoriamatriz',
+            index=models.Index(fields=['fecha_accion', 'id'], name='auditoria_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matrizriesgo',
+            index=models.Index(fields=['empresa', 'fecha_modificacion', 'id'], name='matriz_empresa_fecha_idx'),
+        ),
+    ]
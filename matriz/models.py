@@ -1,10 +1,187 @@
 # matriz/models.py
+from functools import lru_cache
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models import Lookup
+from django.db.models.lookups import GreaterThanOrEqual
 from API_C.utils import generate_unique_id
 import json
 
+from .cache import CACHE_TIMEOUT, invalidar_matrices
+
+# Zonas de riesgo por defecto: (nivel, valor mínimo de probabilidad × impacto, color).
+# Cada empresa puede ajustar los mínimos con ConfiguracionZonasRiesgo.
+ZONAS_RIESGO = [
+    ('EXTREMA', 15, 'bg-red-600'),
+    ('ALTA', 10, 'bg-red-400'),
+    ('MODERADA', 6, 'bg-yellow-400'),
+    ('BAJA', 3, 'bg-green-400'),
+    ('MUY BAJA', 0, 'bg-green-600'),
+]
+
+NIVELES_ZONA = [nivel for nivel, _, _ in ZONAS_RIESGO]
+COLORES_ZONA = {nivel: color for nivel, _, color in ZONAS_RIESGO}
+UMBRALES_POR_DEFECTO = {nivel: minimo for nivel, minimo, _ in ZONAS_RIESGO}
+
+ESCALA_RIESGO = range(1, 6)
+
+
+def campo_resumen_nivel(nivel):
+    """Nombre de la anotación con el conteo de riesgos de un nivel ('MUY BAJA' -> 'riesgos_muy_baja')"""
+    return 'riesgos_' + nivel.replace(' ', '_').lower()
+
+
+def campo_contador_nivel(nivel):
+    """Nombre del contador desnormalizado de un nivel ('MUY BAJA' -> 'conteo_muy_baja')"""
+    return 'conteo_' + nivel.replace(' ', '_').lower()
+
+
+def zona_por_nivel(nivel, valor):
+    """Representación de una zona de riesgo: {'nivel', 'color', 'valor'}"""
+    return {'nivel': nivel, 'color': COLORES_ZONA[nivel], 'valor': valor}
+
+
+class TablaZonas:
+    """
+    Clasificación de probabilidad × impacto según umbrales {nivel: valor mínimo}.
+    En Python se consulta una tabla precalculada de las 25 celdas; en SQL,
+    expresion_nivel() genera el CASE equivalente.
+    """
+    
+    def __init__(self, umbrales=None):
+        self.umbrales = {**UMBRALES_POR_DEFECTO, **(umbrales or {})}
+        # De mayor a menor mínimo: el primer rango que se cumple define el nivel
+        self.rangos = sorted(((minimo, nivel) for nivel, minimo in self.umbrales.items()), reverse=True)
+        self.celdas = {
+            (probabilidad, impacto): self.nivel_por_valor(probabilidad * impacto)
+            for probabilidad in ESCALA_RIESGO
+            for impacto in ESCALA_RIESGO
+        }
+    
+    def nivel_por_valor(self, valor):
+        for minimo, nivel in self.rangos:
+            if valor >= minimo:
+                return nivel
+        return self.rangos[-1][1]
+    
+    def nivel(self, probabilidad, impacto):
+        nivel = self.celdas.get((probabilidad, impacto))
+        return nivel if nivel is not None else self.nivel_por_valor(probabilidad * impacto)
+    
+    def zona(self, probabilidad, impacto):
+        return zona_por_nivel(self.nivel(probabilidad, impacto), probabilidad * impacto)
+    
+    def expresion_nivel(self, prefijo=''):
+        """CASE WHEN probabilidad * impacto >= mínimo THEN nivel ... ELSE nivel más bajo END"""
+        valor = F(f'{prefijo}probabilidad') * F(f'{prefijo}impacto')
+        *rangos, (_, nivel_minimo) = self.rangos
+        return Case(
+            *[When(GreaterThanOrEqual(valor, minimo), then=Value(nivel)) for minimo, nivel in rangos],
+            default=Value(nivel_minimo),
+            output_field=models.CharField()
+        )
+
+
+@lru_cache(maxsize=None)
+def _tabla_zonas(umbrales):
+    return TablaZonas(dict(umbrales))
+
+
+TABLA_ZONAS_POR_DEFECTO = _tabla_zonas(tuple(sorted(UMBRALES_POR_DEFECTO.items())))
+
+
+def _clave_umbrales(empresa_id):
+    return f'matriz:umbrales_zonas:{empresa_id}'
+
+
+def tabla_zonas_empresa(empresa_id):
+    """Tabla de zonas de la empresa (umbrales cacheados; por defecto si no tiene configuración)"""
+    if empresa_id is None:
+        return TABLA_ZONAS_POR_DEFECTO
+    clave = _clave_umbrales(empresa_id)
+    umbrales = cache.get(clave)
+    if umbrales is None:
+        configuracion = ConfiguracionZonasRiesgo.objects.filter(empresa_id=empresa_id).first()
+        umbrales = configuracion.umbrales() if configuracion else UMBRALES_POR_DEFECTO
+        cache.set(clave, umbrales, CACHE_TIMEOUT)
+    return _tabla_zonas(tuple(sorted(umbrales.items())))
+
+
+def tabla_zonas_matriz(matriz_id):
+    """Tabla de zonas de la empresa dueña de la matriz (la empresa de cada matriz se cachea)"""
+    empresa_id = cache.get_or_set(
+        f'matriz:empresa:{matriz_id}',
+        lambda: MatrizRiesgo.objects.filter(pk=matriz_id).values_list('empresa_id', flat=True).first(),
+        CACHE_TIMEOUT
+    )
+    return tabla_zonas_empresa(empresa_id)
+
+
+def olvidar_umbrales(empresa_id):
+    cache.delete(_clave_umbrales(empresa_id))
+
+
+# Contadores desnormalizados de MatrizRiesgo mantenidos desde RiesgoMatriz (ver matriz/signals.py)
+CAMPOS_CONTADORES = (
+    ['conteo_riesgos']
+    + [campo_contador_nivel(nivel) for nivel in NIVELES_ZONA]
+    + ['conteo_aceptados', 'suma_efectividad_control']
+)
+
+
+def conteos_por_nivel(relacion=None):
+    """
+    Expresiones Count(filter=...) por nivel sobre la zona guardada de cada riesgo.
+    Con relacion='riesgos' se usan desde MatrizRiesgo; sin ella, sobre RiesgoMatriz.
+    """
+    prefijo = f'{relacion}__' if relacion else ''
+    return {
+        campo_resumen_nivel(nivel): Count(relacion or 'pk', filter=Q(**{f'{prefijo}nivel_zona': nivel}))
+        for nivel in NIVELES_ZONA
+    }
+
+
+class MatrizRiesgoQuerySet(models.QuerySet):
+    """QuerySet de matrices con agregados de riesgos calculados en la base de datos"""
+
+    def con_resumen_riesgos(self):
+        """Anota el total de riesgos y el conteo por nivel en un solo GROUP BY"""
+        return self.annotate(numero_riesgos=Count('riesgos'), **conteos_por_nivel('riesgos'))
+
+    def con_contadores_reales(self):
+        """Anota los valores reales de todos los contadores calculados desde los riesgos"""
+        return self.con_resumen_riesgos().annotate(
+            numero_aceptados=Count('riesgos', filter=Q(riesgos__aceptado=True)),
+            suma_efectividad=Coalesce(Sum('riesgos__efectividad_control'), 0),
+        )
+
+    def recalcular_contadores(self):
+        """
+        Corrige los contadores que no coinciden con los riesgos.
+        Retorna {matriz_id: {campo: (guardado, real)}} de las matrices corregidas.
+        """
+        corregidas = []
+        desviaciones = {}
+        for matriz in self.order_by().con_contadores_reales():
+            diferencias = matriz.diferencias_contadores()
+            if diferencias:
+                for campo, (_, real) in diferencias.items():
+                    setattr(matriz, campo, real)
+                matriz.fecha_modificacion = timezone.now()
+                corregidas.append(matriz)
+                desviaciones[matriz.pk] = diferencias
+        if corregidas:
+            MatrizRiesgo.objects.bulk_update(corregidas, [*CAMPOS_CONTADORES, 'fecha_modificacion'])
+        return desviaciones
+
+
 class MatrizRiesgo(models.Model):
     """Modelo principal para las matrices de riesgo"""
     
@@ -30,10 +207,30 @@ class MatrizRiesgo(models.Model):
         verbose_name="Empresa"
     )
     
+    # Contadores desnormalizados (se actualizan con deltas F() al guardar/eliminar riesgos)
+    conteo_riesgos = models.PositiveIntegerField(default=0, editable=False, verbose_name="Total de riesgos")
+    conteo_extrema = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos en zona extrema")
+    conteo_alta = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos en zona alta")
+    conteo_moderada = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos en zona moderada")
+    conteo_baja = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos en zona baja")
+    conteo_muy_baja = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos en zona muy baja")
+    conteo_aceptados = models.PositiveIntegerField(default=0, editable=False, verbose_name="Riesgos aceptados")
+    suma_efectividad_control = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Suma de efectividad de controles"
+    )
+    
+    objects = MatrizRiesgoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Matriz de Riesgo"
         verbose_name_plural = "Matrices de Riesgo"
         ordering = ['-fecha_modificacion']
+        indexes = [
+            # Cursor de mis_matrices: (fecha_modificacion, id) dentro de la empresa
+            models.Index(fields=['empresa', 'fecha_modificacion', 'id'], name='matriz_empresa_fecha_idx'),
+        ]
     
     def __str__(self):
         return self.nombre
@@ -46,17 +243,52 @@ class MatrizRiesgo(models.Model):
     
     @property
     def total_riesgos(self):
-        return self.riesgos.count()
+        # Usar la anotación de con_resumen_riesgos() si está disponible
+        if hasattr(self, 'numero_riesgos'):
+            return self.numero_riesgos
+        return self.conteo_riesgos
     
     @property
     def resumen_riesgos_por_nivel(self):
-        resumen = {'EXTREMA': 0, 'ALTA': 0, 'MODERADA': 0, 'BAJA': 0, 'MUY_BAJA': 0}
-        for riesgo in self.riesgos.all():
-            zona = riesgo.calcular_zona_riesgo()
-            nivel_key = zona['nivel'].replace(' ', '_')
-            if nivel_key in resumen:
-                resumen[nivel_key] += 1
-        return resumen
+        if hasattr(self, 'numero_riesgos'):
+            return {
+                nivel.replace(' ', '_'): getattr(self, campo_resumen_nivel(nivel))
+                for nivel in NIVELES_ZONA
+            }
+        return {
+            nivel.replace(' ', '_'): getattr(self, campo_contador_nivel(nivel))
+            for nivel in NIVELES_ZONA
+        }
+    
+    @classmethod
+    def aplicar_deltas_contadores(cls, deltas):
+        """
+        Aplica incrementos {matriz_id: {campo: delta}} con F(), una UPDATE por matriz.
+        Cambiar un riesgo cambia la matriz: fecha_modificacion se actualiza aunque los
+        contadores no cambien.
+        """
+        for matriz_id, cambios in deltas.items():
+            valores = {campo: F(campo) + delta for campo, delta in cambios.items() if delta}
+            if matriz_id:
+                cls.objects.filter(pk=matriz_id).update(fecha_modificacion=timezone.now(), **valores)
+    
+    def diferencias_contadores(self):
+        """
+        Compara los contadores guardados con los reales anotados por con_contadores_reales().
+        Retorna {campo: (guardado, real)} solo para los campos desviados.
+        """
+        reales = {
+            'conteo_riesgos': self.numero_riesgos,
+            'conteo_aceptados': self.numero_aceptados,
+            'suma_efectividad_control': self.suma_efectividad,
+        }
+        for nivel in NIVELES_ZONA:
+            reales[campo_contador_nivel(nivel)] = getattr(self, campo_resumen_nivel(nivel))
+        return {
+            campo: (getattr(self, campo), real)
+            for campo, real in reales.items()
+            if getattr(self, campo) != real
+        }
 
 
 class RiesgoMatriz(models.Model):
@@ -148,43 +380,80 @@ class RiesgoMatriz(models.Model):
         verbose_name="¿Se acepta el riesgo?"
     )
     
+    # Zona según los umbrales de la empresa; se calcula al guardar y se reclasifica
+    # en bloque cuando cambian los umbrales (ver reclasificar_riesgos)
+    nivel_zona = models.CharField(
+        max_length=10,
+        choices=[(nivel, nivel.title()) for nivel in NIVELES_ZONA],
+        default='MUY BAJA',
+        editable=False,
+        db_index=True,
+        verbose_name="Zona de Riesgo"
+    )
+    
     class Meta:
         verbose_name = "Riesgo"
         verbose_name_plural = "Riesgos"
         ordering = ['numero']
         unique_together = ['matriz', 'numero']
     
+    # Campos de los que depende la contribución del riesgo a los contadores de la matriz
+    CAMPOS_APORTE = ['matriz_id', 'nivel_zona', 'aceptado', 'efectividad_control']
+    
     def __str__(self):
         return f"{self.codigo or self.numero} - {self.nombre}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Recordar la contribución cargada para calcular deltas al guardar
+        if set(cls.CAMPOS_APORTE) <= set(field_names):
+            instance._aporte_guardado = (instance.matriz_id, instance.aporte_contadores())
+        return instance
+    
+    def tabla_zonas(self):
+        """Tabla de zonas de la empresa de la matriz (sin consultar si la matriz ya está cargada)"""
+        if self.__class__.matriz.is_cached(self):
+            return tabla_zonas_empresa(self.matriz.empresa_id)
+        return tabla_zonas_matriz(self.matriz_id)
+    
     def calcular_zona_riesgo(self):
-        """Calcula la zona de riesgo basada en probabilidad e impacto"""
-        valor = self.probabilidad * self.impacto
-        if valor >= 15:
-            return {'nivel': 'EXTREMA', 'color': 'bg-red-600', 'valor': valor}
-        elif valor >= 10:
-            return {'nivel': 'ALTA', 'color': 'bg-red-400', 'valor': valor}
-        elif valor >= 6:
-            return {'nivel': 'MODERADA', 'color': 'bg-yellow-400', 'valor': valor}
-        elif valor >= 3:
-            return {'nivel': 'BAJA', 'color': 'bg-green-400', 'valor': valor}
-        else:
-            return {'nivel': 'MUY BAJA', 'color': 'bg-green-600', 'valor': valor}
+        """Calcula la zona de riesgo basada en probabilidad e impacto y los umbrales de la empresa"""
+        return self.tabla_zonas().zona(self.probabilidad, self.impacto)
+    
+    def aporte_contadores(self):
+        """Contribución de este riesgo a los contadores desnormalizados de su matriz"""
+        return {
+            'conteo_riesgos': 1,
+            campo_contador_nivel(self.nivel_zona): 1,
+            'conteo_aceptados': 1 if self.aceptado else 0,
+            'suma_efectividad_control': self.efectividad_control or 0,
+        }
     
     @property
     def zona_riesgo(self):
-        return self.calcular_zona_riesgo()
+        """Zona guardada (no consulta los umbrales)"""
+        return zona_por_nivel(self.nivel_zona, self.probabilidad * self.impacto)
+    
+    @staticmethod
+    def controles_evaluacion_inicial():
+        """Checklist de evaluación de controles con todos los criterios sin cumplir"""
+        return {
+            'herramienta': False,
+            'manuales': False,
+            'efectividad': False,
+            'responsables': False,
+            'frecuencia': False
+        }
     
     def save(self, *args, **kwargs):
         # Inicializar controles_evaluacion si está vacío
         if not self.controles_evaluacion:
-            self.controles_evaluacion = {
-                'herramienta': False,
-                'manuales': False,
-                'efectividad': False,
-                'responsables': False,
-                'frecuencia': False
-            }
+            self.controles_evaluacion = self.controles_evaluacion_inicial()
+        self.nivel_zona = self.tabla_zonas().nivel(self.probabilidad, self.impacto)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'probabilidad', 'impacto'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'nivel_zona'}
         super().save(*args, **kwargs)
 
 
@@ -257,6 +526,136 @@ class ParametroMatriz(models.Model):
         return f"{self.get_tipo_display()} - {self.valor}: {self.etiqueta}"
 
 
+class ConfiguracionZonasRiesgo(models.Model):
+    """Umbrales de las zonas de riesgo (valor mínimo de probabilidad × impacto) de una empresa"""
+    
+    empresa = models.OneToOneField(
+        'empresa.Empresa',
+        on_delete=models.CASCADE,
+        related_name='configuracion_zonas_riesgo',
+        verbose_name="Empresa"
+    )
+    minimo_extrema = models.PositiveSmallIntegerField(
+        default=UMBRALES_POR_DEFECTO['EXTREMA'],
+        validators=[MinValueValidator(1), MaxValueValidator(25)],
+        verbose_name="Mínimo zona extrema"
+    )
+    minimo_alta = models.PositiveSmallIntegerField(
+        default=UMBRALES_POR_DEFECTO['ALTA'],
+        validators=[MinValueValidator(1), MaxValueValidator(25)],
+        verbose_name="Mínimo zona alta"
+    )
+    minimo_moderada = models.PositiveSmallIntegerField(
+        default=UMBRALES_POR_DEFECTO['MODERADA'],
+        validators=[MinValueValidator(1), MaxValueValidator(25)],
+        verbose_name="Mínimo zona moderada"
+    )
+    minimo_baja = models.PositiveSmallIntegerField(
+        default=UMBRALES_POR_DEFECTO['BAJA'],
+        validators=[MinValueValidator(1), MaxValueValidator(25)],
+        verbose_name="Mínimo zona baja"
+    )
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Configuración de Zonas de Riesgo"
+        verbose_name_plural = "Configuraciones de Zonas de Riesgo"
+    
+    def __str__(self):
+        return f"Zonas de riesgo - {self.empresa}"
+    
+    def umbrales(self):
+        return {
+            'EXTREMA': self.minimo_extrema,
+            'ALTA': self.minimo_alta,
+            'MODERADA': self.minimo_moderada,
+            'BAJA': self.minimo_baja,
+            'MUY BAJA': 0,
+        }
+    
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        
+        if not (self.minimo_extrema > self.minimo_alta > self.minimo_moderada > self.minimo_baja >= 1):
+            raise ValidationError(
+                'Los mínimos deben ser estrictamente decrecientes: extrema > alta > moderada > baja >= 1.'
+            )
+
+
+def reclasificar_riesgos(empresa_id, riesgos=None):
+    """
+    Recalcula la zona guardada de los riesgos de la empresa (o del subconjunto `riesgos`)
+    con sus umbrales vigentes: una UPDATE con CASE sobre las filas cuya zona cambia y la
+    corrección de los contadores de las matrices afectadas con un GROUP BY.
+    Retorna el número de riesgos reclasificados.
+    """
+    tabla = tabla_zonas_empresa(empresa_id)
+    if riesgos is None:
+        riesgos = RiesgoMatriz.objects.all()
+    riesgos = riesgos.filter(matriz__empresa_id=empresa_id).exclude(nivel_zona=tabla.expresion_nivel())
+    
+    with transaction.atomic():
+        matriz_ids = list(riesgos.order_by().values_list('matriz_id', flat=True).distinct())
+        if not matriz_ids:
+            return 0
+        reclasificados = riesgos.update(nivel_zona=tabla.expresion_nivel())
+        MatrizRiesgo.objects.filter(pk__in=matriz_ids).recalcular_contadores()
+    
+    invalidar_matrices(matriz_ids, [empresa_id])
+    return reclasificados
+
+
+class DocumentoBusquedaField(models.TextField):
+    """
+    Documento del índice de texto completo: tsvector en PostgreSQL; en SQLite la
+    columna oculta de la tabla FTS5 (la que se llama como la tabla). Solo se consulta
+    con el lookup __coincide.
+    """
+
+
+@DocumentoBusquedaField.register_lookup
+class Coincide(Lookup):
+    """documento__coincide=consulta: MATCH de FTS5 o @@ to_tsquery() de PostgreSQL"""
+    
+    lookup_name = 'coincide'
+    configuracion_postgres = 'spanish'
+    
+    def as_sqlite(self, compiler, connection):
+        columna = self.lhs
+        tabla = compiler.quote_name_unless_alias(columna.alias)
+        rhs, parametros = self.process_rhs(compiler, connection)
+        return f'{tabla}.{connection.ops.quote_name(columna.target.model._meta.db_table)} MATCH {rhs}', parametros
+    
+    def as_postgresql(self, compiler, connection):
+        lhs, parametros_lhs = self.process_lhs(compiler, connection)
+        rhs, parametros_rhs = self.process_rhs(compiler, connection)
+        return (
+            f"{lhs} @@ to_tsquery('{self.configuracion_postgres}', {rhs})",
+            [*parametros_lhs, *parametros_rhs]
+        )
+
+
+class IndiceBusquedaRiesgo(models.Model):
+    """
+    Fila del índice de texto completo de un riesgo. La tabla no la gestiona Django:
+    la crean la migración 0006 y los triggers la mantienen (ver busqueda.py).
+    """
+    
+    riesgo = models.OneToOneField(
+        RiesgoMatriz,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='indice_busqueda'
+    )
+    empresa_id = models.CharField(max_length=14)
+    documento = DocumentoBusquedaField()
+    
+    class Meta:
+        managed = False
+        db_table = 'matriz_riesgo_busqueda'
+
+
 class AuditoriaMatriz(models.Model):
     """Modelo para auditar cambios en las matrices"""
     
@@ -282,7 +681,8 @@ class AuditoriaMatriz(models.Model):
         blank=True, 
         verbose_name="Descripción del cambio"
     )
-    fecha_accion = models.DateTimeField(auto_now_add=True)
+    # Con default y no auto_now_add: la escritura diferida (ver auditoria.py) conserva la hora del evento
+    fecha_accion = models.DateTimeField(default=timezone.now, editable=False)
     datos_anteriores = models.JSONField(
         null=True, 
         blank=True, 
@@ -298,6 +698,11 @@ class AuditoriaMatriz(models.Model):
         verbose_name = "Auditoría de Matriz"
         verbose_name_plural = "Auditorías de Matrices"
         ordering = ['-fecha_accion']
+        # Columnas del cursor (fecha_accion, id), solas o después del filtro por matriz
+        indexes = [
+            models.Index(fields=['matriz', 'fecha_accion', 'id'], name='auditoria_matriz_fecha_idx'),
+            models.Index(fields=['fecha_accion', 'id'], name='auditoria_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.matriz.nombre} - {self.get_accion_display()} - {self.fecha_accion.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
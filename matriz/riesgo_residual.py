@@ -0,0 +1,204 @@
+# matriz/riesgo_residual.py
+"""
+Riesgo residual: probabilidad e impacto después de aplicar los controles.
+
+El cálculo se hace por columnas: los campos necesarios se leen con values_list (sin
+instanciar modelos) y cada columna se transforma de una vez. Como el resultado de un
+riesgo solo depende de (probabilidad, impacto, tipo de control, efectividad, criterios
+cumplidos), cada combinación distinta se calcula una sola vez y el resto de filas son
+búsquedas en diccionario; no se agregó numpy como dependencia.
+
+Modelo de reducción:
+- Los controles preventivos y detectivos reducen la probabilidad; los correctivos, el impacto.
+- La reducción es la efectividad del control (%) por el peso de su tipo, escalada por
+  la solidez documentada en la evaluación de controles: la mitad se reconoce siempre y
+  la otra mitad en proporción a los criterios cumplidos.
+- El nivel reducido se redondea hacia arriba y nunca baja de 1.
+"""
+import json
+from array import array
+from collections import Counter
+from math import ceil
+
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from .models import (
+    ESCALA_RIESGO, NIVELES_ZONA, TABLA_ZONAS_POR_DEFECTO, RiesgoMatriz, zona_por_nivel
+)
+
+CRITERIOS_CONTROL = list(RiesgoMatriz.controles_evaluacion_inicial())
+
+# Tipo de control -> (dimensión que reduce, peso de la efectividad)
+EFECTO_TIPO_CONTROL = {
+    'Preventivo': ('probabilidad', 1.0),
+    'Detectivo': ('probabilidad', 0.6),
+    'Correctivo': ('impacto', 1.0),
+}
+
+# Fracción de la efectividad reconocida aunque no se cumpla ningún criterio de la evaluación
+PESO_BASE_EVALUACION = 0.5
+
+CAMPOS_RESIDUAL = [
+    'probabilidad', 'impacto', 'nivel_zona', 'tipo_control', 'efectividad_control',
+    'evaluacion_texto',
+]
+
+
+def criterios_cumplidos(evaluacion):
+    """Número de criterios de la evaluación de controles marcados como cumplidos"""
+    if not isinstance(evaluacion, dict):
+        return 0
+    return sum(1 for criterio in CRITERIOS_CONTROL if evaluacion.get(criterio))
+
+
+def _columna_criterios_cumplidos(textos):
+    """
+    Columna de evaluaciones como texto JSON -> criterios cumplidos. Hay pocas
+    evaluaciones distintas, así que cada texto se decodifica una sola vez.
+    """
+    conteos = {}
+
+    def contar(texto):
+        conteo = conteos.get(texto)
+        if conteo is None:
+            evaluacion = json.loads(texto) if isinstance(texto, str) else texto
+            conteo = conteos[texto] = criterios_cumplidos(evaluacion)
+        return conteo
+
+    return list(map(contar, textos))
+
+
+def _reducir(nivel, reduccion):
+    # round() evita que errores de coma flotante suban un nivel (5 × 0.8 = 4.000…1)
+    return max(1, ceil(round(nivel * (1 - reduccion), 6)))
+
+
+def residual(probabilidad, impacto, tipo_control, efectividad, cumplidos):
+    """(probabilidad, impacto) residuales de un riesgo"""
+    dimension, peso = EFECTO_TIPO_CONTROL.get(tipo_control, (None, 0))
+    solidez = PESO_BASE_EVALUACION + (1 - PESO_BASE_EVALUACION) * cumplidos / len(CRITERIOS_CONTROL)
+    reduccion = min(max(efectividad or 0, 0), 100) / 100 * peso * solidez
+    if dimension == 'probabilidad':
+        return _reducir(probabilidad, reduccion), impacto
+    if dimension == 'impacto':
+        return probabilidad, _reducir(impacto, reduccion)
+    return probabilidad, impacto
+
+
+def columnas_riesgos(riesgos, campos=()):
+    """
+    Lee `campos` más los necesarios para el cálculo con una sola consulta values_list
+    y los retorna como columnas {campo: lista}.
+    """
+    nombres = [*campos, *CAMPOS_RESIDUAL]
+    # La evaluación se lee como texto para no decodificar el JSON de cada fila
+    filas = riesgos.annotate(
+        evaluacion_texto=Cast('controles_evaluacion', output_field=TextField())
+    ).values_list(*nombres)
+    if not filas:
+        columnas = {nombre: [] for nombre in nombres}
+    else:
+        columnas = dict(zip(nombres, map(list, zip(*filas))))
+    columnas['criterios_cumplidos'] = _columna_criterios_cumplidos(columnas.pop('evaluacion_texto'))
+    return columnas
+
+
+def calcular_residual(columnas, tabla=TABLA_ZONAS_POR_DEFECTO):
+    """
+    Columnas de riesgos -> columnas residuales: probabilidad_residual, impacto_residual,
+    valor_residual (arrays de enteros) y nivel_residual (lista de niveles según `tabla`).
+    """
+    resultados = {}
+
+    def calcular(*clave):
+        resultado = resultados.get(clave)
+        if resultado is None:
+            probabilidad, impacto = residual(*clave)
+            resultado = resultados[clave] = (
+                probabilidad, impacto, probabilidad * impacto, tabla.nivel(probabilidad, impacto)
+            )
+        return resultado
+
+    filas = list(map(
+        calcular,
+        columnas['probabilidad'], columnas['impacto'], columnas['tipo_control'],
+        columnas['efectividad_control'], columnas['criterios_cumplidos']
+    ))
+    if not filas:
+        probabilidades = impactos = valores = niveles = ()
+    else:
+        probabilidades, impactos, valores, niveles = zip(*filas)
+    return {
+        'probabilidad_residual': array('B', probabilidades),
+        'impacto_residual': array('B', impactos),
+        'valor_residual': array('B', valores),
+        'nivel_residual': list(niveles),
+    }
+
+
+def _por_nivel(niveles):
+    conteos = Counter(niveles)
+    return {nivel.replace(' ', '_'): conteos.get(nivel, 0) for nivel in NIVELES_ZONA}
+
+
+def resumen_residual(riesgos, tabla=TABLA_ZONAS_POR_DEFECTO):
+    """
+    Resumen inherente vs. residual de un queryset de RiesgoMatriz (una consulta):
+    conteos por zona, valores promedio, reducción y mapa de calor residual 5×5.
+    """
+    columnas = columnas_riesgos(riesgos.order_by())
+    residuales = calcular_residual(columnas, tabla)
+    total = len(columnas['probabilidad'])
+    suma_inherente = sum(map(int.__mul__, columnas['probabilidad'], columnas['impacto']))
+    suma_residual = sum(residuales['valor_residual'])
+    celdas = Counter(zip(residuales['probabilidad_residual'], residuales['impacto_residual']))
+
+    return {
+        'total_riesgos': total,
+        'valor_inherente_promedio': round(suma_inherente / total, 2) if total else 0,
+        'valor_residual_promedio': round(suma_residual / total, 2) if total else 0,
+        'porcentaje_reduccion': (
+            round((1 - suma_residual / suma_inherente) * 100, 2) if suma_inherente else 0
+        ),
+        'riesgos_que_bajan_de_zona': sum(map(
+            str.__ne__, columnas['nivel_zona'], residuales['nivel_residual']
+        )),
+        'riesgos_por_nivel_inherente': _por_nivel(columnas['nivel_zona']),
+        'riesgos_por_nivel_residual': _por_nivel(residuales['nivel_residual']),
+        'mapa_calor_residual': [
+            {
+                'probabilidad': probabilidad,
+                'impacto': impacto,
+                'total': celdas.get((probabilidad, impacto), 0),
+                'zona': tabla.zona(probabilidad, impacto),
+            }
+            for probabilidad in ESCALA_RIESGO
+            for impacto in ESCALA_RIESGO
+        ],
+    }
+
+
+def riesgos_residuales(riesgos, tabla=TABLA_ZONAS_POR_DEFECTO):
+    """Riesgo inherente y residual de cada riesgo del queryset, ordenados por matriz y número"""
+    columnas = columnas_riesgos(riesgos.order_by('matriz_id', 'numero'), ['id', 'matriz_id', 'numero'])
+    residuales = calcular_residual(columnas, tabla)
+    return [
+        {
+            'id': riesgo_id,
+            'matriz': matriz_id,
+            'numero': numero,
+            'zona_inherente': zona_por_nivel(nivel, probabilidad * impacto),
+            'probabilidad_residual': probabilidad_residual,
+            'impacto_residual': impacto_residual,
+            'zona_residual': zona_por_nivel(nivel_residual, valor_residual),
+        }
+        for (
+            riesgo_id, matriz_id, numero, probabilidad, impacto, nivel,
+            probabilidad_residual, impacto_residual, valor_residual, nivel_residual
+        ) in zip(
+            columnas['id'], columnas['matriz_id'], columnas['numero'], columnas['probabilidad'],
+            columnas['impacto'], columnas['nivel_zona'], residuales['probabilidad_residual'],
+            residuales['impacto_residual'], residuales['valor_residual'], residuales['nivel_residual']
+        )
+    ]
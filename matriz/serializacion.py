@@ -0,0 +1,133 @@
+# matriz/serializacion.py
+"""
+Serialización de matrices con la estructura del frontend, sin cargar el árbol en memoria.
+
+Los riesgos y las causas se leen con dos consultas values() ordenadas por número de
+riesgo y se combinan recorriendo ambos cursores a la vez (merge join), así que el
+número de consultas no depende del tamaño de la matriz. El JSON se emite por
+fragmentos para que la respuesta se pueda servir con StreamingHttpResponse.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .carga_riesgos import CAMPOS_RIESGO_FRONTEND
+from .models import RiesgoMatriz, CausaRiesgo, zona_por_nivel
+
+TAMANO_LOTE_LECTURA = 2000
+TAMANO_FRAGMENTO = 64 * 1024
+
+# Campo del modelo -> clave del frontend
+CLAVES_FRONTEND = {campo: clave for clave, (campo, _) in CAMPOS_RIESGO_FRONTEND.items()}
+
+CAMPOS_CAUSA_FRONTEND = ['id', 'causa', 'factor', 'controles']
+
+
+def _causas_por_riesgo(matriz_ids, campos, tamano_lote):
+    """
+    Itera ((matriz_id, numero), riesgo_id, [causas]) en el mismo orden que
+    iterar_riesgos_con_causas recorre los riesgos
+    """
+    causas = (
+        CausaRiesgo.objects
+        .filter(riesgo__matriz_id__in=matriz_ids)
+        .order_by('riesgo__matriz_id', 'riesgo__numero', 'orden', 'id')
+        .values('riesgo_id', 'riesgo__matriz_id', 'riesgo__numero', *campos)
+        .iterator(chunk_size=tamano_lote)
+    )
+    riesgo_actual, clave, grupo = None, None, []
+    for causa in causas:
+        riesgo_id = causa.pop('riesgo_id')
+        clave_causa = causa.pop('riesgo__matriz_id'), causa.pop('riesgo__numero')
+        if riesgo_id != riesgo_actual:
+            if grupo:
+                yield clave, riesgo_actual, grupo
+            riesgo_actual, clave, grupo = riesgo_id, clave_causa, []
+        grupo.append(causa)
+    if grupo:
+        yield clave, riesgo_actual, grupo
+
+
+def iterar_riesgos_con_causas(matriz_ids, campos, campos_causa=CAMPOS_CAUSA_FRONTEND,
+                              tamano_lote=TAMANO_LOTE_LECTURA):
+    """
+    Itera (riesgo, causas) para los riesgos de las matrices indicadas, ordenados por
+    matriz y número, como filas values() con `campos` (más 'id'). Usa exactamente dos
+    consultas y mantiene en memoria solo el riesgo en curso.
+
+    Las dos lecturas no comparten instantánea: si un riesgo se elimina o renumera entre
+    ambas, sus causas se descartan en vez de detener el recorrido de las siguientes.
+    """
+    extra = [campo for campo in ('matriz_id', 'numero') if campo not in campos]
+    riesgos = (
+        RiesgoMatriz.objects
+        .filter(matriz_id__in=matriz_ids)
+        .order_by('matriz_id', 'numero')
+        .values('id', *campos, *extra)
+        .iterator(chunk_size=tamano_lote)
+    )
+    grupos = _causas_por_riesgo(matriz_ids, campos_causa, tamano_lote)
+    siguiente = next(grupos, None)
+    for riesgo in riesgos:
+        clave = riesgo['matriz_id'], riesgo['numero']
+        for campo in extra:
+            del riesgo[campo]
+        # Grupos que ordenan antes (o en la misma posición) y son de otro riesgo
+        while siguiente is not None and siguiente[0] <= clave and siguiente[1] != riesgo['id']:
+            siguiente = next(grupos, None)
+        causas = []
+        if siguiente is not None and siguiente[1] == riesgo['id']:
+            causas = siguiente[2]
+            siguiente = next(grupos, None)
+        yield riesgo, causas
+
+
+def riesgo_frontend(riesgo, causas):
+    """Convierte una fila values() de RiesgoMatriz al formato del frontend"""
+    datos = {'id': riesgo['id']}
+    for campo, clave in CLAVES_FRONTEND.items():
+        datos[clave] = riesgo[campo]
+        if campo == 'descripcion':
+            datos['causas'] = causas
+    datos['zonaRiesgo'] = zona_por_nivel(riesgo['nivel_zona'], riesgo['probabilidad'] * riesgo['impacto'])
+    return datos
+
+
+def iterar_riesgos_frontend(matriz_id, tamano_lote=TAMANO_LOTE_LECTURA):
+    """Itera los riesgos de la matriz (con sus causas) en formato frontend"""
+    campos = [*CLAVES_FRONTEND, 'nivel_zona']
+    for riesgo, causas in iterar_riesgos_con_causas([matriz_id], campos, tamano_lote=tamano_lote):
+        yield riesgo_frontend(riesgo, causas)
+
+
+def agrupar_fragmentos(piezas, tamano=TAMANO_FRAGMENTO):
+    """Agrupa piezas pequeñas de texto en fragmentos de ~`tamano` bytes codificados en UTF-8"""
+    buffer, acumulado = [], 0
+    for pieza in piezas:
+        buffer.append(pieza)
+        acumulado += len(pieza)
+        if acumulado >= tamano:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, acumulado = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def matriz_frontend_json(cabecera, matriz_id, tamano_lote=TAMANO_LOTE_LECTURA):
+    """
+    Genera el JSON de la matriz por fragmentos: primero los campos de `cabecera`
+    y luego la lista 'riesgos', un riesgo a la vez.
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def piezas():
+        inicio = encoder.encode(dict(cabecera))
+        yield inicio[:-1]
+        yield ', "riesgos": [' if len(inicio) > 2 else '"riesgos": ['
+        for indice, riesgo in enumerate(iterar_riesgos_frontend(matriz_id, tamano_lote)):
+            if indice:
+                yield ', '
+            yield encoder.encode(riesgo)
+        yield ']}'
+
+    return agrupar_fragmentos(piezas())
@@ -1,11 +1,20 @@
 # matriz/serializers.py
 from rest_framework import serializers
-from .models import MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz
+from .models import (
+    MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz, ConfiguracionZonasRiesgo,
+    CAMPOS_CONTADORES, NIVELES_ZONA, campo_contador_nivel
+)
 from django.db import transaction
+from .carga_riesgos import validar_riesgos, insertar_riesgos, sincronizar_riesgos, sincronizar_causas
+from .serializacion import iterar_riesgos_frontend
+from API_C.campos import CamposDinamicosMixin
 
-class CausaRiesgoSerializer(serializers.ModelSerializer):
+class CausaRiesgoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para las causas de riesgo"""
     
+    # Escribible: al actualizar un riesgo, el id empareja cada causa con la existente
+    id = serializers.IntegerField(required=False)
+    
     class Meta:
         model = CausaRiesgo
         fields = ['id', 'causa', 'factor', 'controles', 'orden']
@@ -16,11 +25,11 @@ class CausaRiesgoSerializer(serializers.ModelSerializer):
         return value
 
 
-class RiesgoMatrizSerializer(serializers.ModelSerializer):
+class RiesgoMatrizSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para los riesgos individuales"""
     
     causas = CausaRiesgoSerializer(many=True, required=False)
-    zona_riesgo = serializers.ReadOnlyField(source='calcular_zona_riesgo')
+    zona_riesgo = serializers.ReadOnlyField()  # Zona guardada en el riesgo
     
     class Meta:
         model = RiesgoMatriz
@@ -31,6 +40,7 @@ class RiesgoMatrizSerializer(serializers.ModelSerializer):
             'controles_evaluacion', 'tratamiento', 'responsable_control',
             'aceptado', 'causas', 'zona_riesgo'
         ]
+        dependencias = {'zona_riesgo': ['nivel_zona', 'probabilidad', 'impacto']}
     
     def validate_nombre(self, value):
         if not value.strip():
@@ -50,6 +60,7 @@ class RiesgoMatrizSerializer(serializers.ModelSerializer):
         
         # Crear causas
         for orden, causa_data in enumerate(causas_data, 1):
+            causa_data.pop('id', None)
             causa_data['orden'] = orden
             CausaRiesgo.objects.create(riesgo=riesgo, **causa_data)
         
@@ -58,17 +69,23 @@ class RiesgoMatrizSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         causas_data = validated_data.pop('causas', [])
         
-        # Actualizar campos del riesgo
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Actualizar causas si se proporcionaron
-        if causas_data:
-            instance.causas.all().delete()
-            for orden, causa_data in enumerate(causas_data, 1):
-                causa_data['orden'] = orden
-                CausaRiesgo.objects.create(riesgo=instance, **causa_data)
+        with transaction.atomic():
+            # Actualizar campos del riesgo
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            # Actualizar causas si se proporcionaron (solo se escriben las que cambian); las
+            # que traen id se emparejan por id y las demás por posición
+            if causas_data:
+                causas = [
+                    {
+                        **{campo: causa_data.get(campo, '') for campo in ['causa', 'factor', 'controles']},
+                        **({'id': causa_data['id']} if 'id' in causa_data else {}),
+                    }
+                    for causa_data in causas_data
+                ]
+                sincronizar_causas({instance.pk: causas})
         
         return instance
 
@@ -78,7 +95,7 @@ from rest_framework import serializers
 from .models import MatrizRiesgo
 from django.db import transaction
 
-class MatrizRiesgoSerializer(serializers.ModelSerializer):
+class MatrizRiesgoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simplificado para debugging"""
     
     class Meta:
@@ -135,11 +152,14 @@ class MatrizRiesgoSerializer(serializers.ModelSerializer):
 # Comentar temporalmente otros serializers complejos para evitar conflictos
 
 
-class MatrizRiesgoListSerializer(serializers.ModelSerializer):
-    """Serializer optimizado para listas de matrices"""
+class MatrizRiesgoListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """
+    Serializer optimizado para listas de matrices.
+    Espera un queryset con con_resumen_riesgos() y select_related('creado_por', 'empresa').
+    """
     
-    total_riesgos = serializers.ReadOnlyField()
-    resumen_riesgos_por_nivel = serializers.ReadOnlyField()
+    total_riesgos = serializers.ReadOnlyField()  # Anotado en queryset
+    resumen_riesgos_por_nivel = serializers.ReadOnlyField()  # Anotado en queryset
     creado_por_nombre = serializers.CharField(source='creado_por.get_full_name', read_only=True)
     empresa_nombre = serializers.CharField(source='empresa.nombre', read_only=True)
     
@@ -150,9 +170,14 @@ class MatrizRiesgoListSerializer(serializers.ModelSerializer):
             'fecha_modificacion', 'creado_por_nombre', 'empresa_nombre',
             'total_riesgos', 'resumen_riesgos_por_nivel'
         ]
+        # Propiedades del modelo: usan las anotaciones de con_resumen_riesgos() o los contadores
+        dependencias = {
+            'total_riesgos': ['conteo_riesgos'],
+            'resumen_riesgos_por_nivel': [campo_contador_nivel(nivel) for nivel in NIVELES_ZONA],
+        }
 
 
-class ParametroMatrizSerializer(serializers.ModelSerializer):
+class ParametroMatrizSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para los parámetros del sistema"""
     
     class Meta:
@@ -160,7 +185,30 @@ class ParametroMatrizSerializer(serializers.ModelSerializer):
         fields = ['id', 'tipo', 'valor', 'etiqueta', 'descripcion', 'activo']
 
 
-class AuditoriaMatrizSerializer(serializers.ModelSerializer):
+class ConfiguracionZonasRiesgoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """Serializer para los umbrales de zona de riesgo de una empresa"""
+    
+    class Meta:
+        model = ConfiguracionZonasRiesgo
+        fields = ['minimo_extrema', 'minimo_alta', 'minimo_moderada', 'minimo_baja', 'fecha_modificacion']
+        read_only_fields = ['fecha_modificacion']
+    
+    def validate(self, attrs):
+        campos = ['minimo_extrema', 'minimo_alta', 'minimo_moderada', 'minimo_baja']
+        # Los campos no enviados conservan el valor actual (o el valor por defecto al crear)
+        valores = [
+            attrs.get(campo, getattr(self.instance, campo) if self.instance
+                      else ConfiguracionZonasRiesgo._meta.get_field(campo).default)
+            for campo in campos
+        ]
+        if not (valores[0] > valores[1] > valores[2] > valores[3] >= 1):
+            raise serializers.ValidationError(
+                'Los mínimos deben ser estrictamente decrecientes: extrema > alta > moderada > baja >= 1.'
+            )
+        return attrs
+
+
+class AuditoriaMatrizSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para el registro de auditoría"""
     
     usuario_nombre = serializers.CharField(source='usuario.get_full_name', read_only=True)
@@ -173,10 +221,11 @@ class AuditoriaMatrizSerializer(serializers.ModelSerializer):
             'accion', 'descripcion', 'fecha_accion', 'datos_anteriores', 'datos_nuevos'
         ]
         read_only_fields = ['id', 'fecha_accion']
+        expandibles = {'matriz': 'matriz.serializers.MatrizRiesgoSerializer'}
 
 
 # Serializer especial para el frontend
-class MatrizRiesgoFrontendSerializer(serializers.ModelSerializer):
+class MatrizRiesgoFrontendSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer especial que coincide con la estructura del frontend.
     Maneja la estructura específica que espera el componente React.
@@ -185,6 +234,7 @@ class MatrizRiesgoFrontendSerializer(serializers.ModelSerializer):
     # Para compatibilidad con el frontend
     fechaCreacion = serializers.DateField(source='fecha_creacion')
     fechaModificacion = serializers.DateTimeField(source='fecha_modificacion', read_only=True)
+    riesgos = serializers.ListField(child=serializers.JSONField(), required=False, write_only=True)
     
     class Meta:
         model = MatrizRiesgo
@@ -194,48 +244,26 @@ class MatrizRiesgoFrontendSerializer(serializers.ModelSerializer):
         ]
     
     def to_representation(self, instance):
-        """Personalizar la representación para el frontend"""
+        """
+        Personalizar la representación para el frontend.
+        Los riesgos y sus causas se leen con dos consultas; con el contexto
+        incluir_riesgos=False solo se serializa la cabecera (ver la acción 'frontend').
+        """
         data = super().to_representation(instance)
-        
-        # Convertir riesgos al formato esperado por el frontend
-        riesgos_frontend = []
-        for riesgo in instance.riesgos.all():
-            riesgo_data = {
-                'id': riesgo.id,
-                'numero': riesgo.numero,
-                'fecha': riesgo.fecha,
-                'codigo': riesgo.codigo,
-                'nombre': riesgo.nombre,
-                'descripcion': riesgo.descripcion,
-                'causas': [
-                    {
-                        'causa': causa.causa,
-                        'factor': causa.factor,
-                        'controles': causa.controles
-                    }
-                    for causa in riesgo.causas.all()
-                ],
-                'efectos': riesgo.efectos,
-                'tipoRiesgo': riesgo.tipo_riesgo,
-                'probabilidad': riesgo.probabilidad,
-                'impacto': riesgo.impacto,
-                'controlesExistentes': riesgo.controles_existentes,
-                'tipoControl': riesgo.tipo_control,
-                'efectividadControl': riesgo.efectividad_control,
-                'controlesEvaluacion': riesgo.controles_evaluacion,
-                'tratamiento': riesgo.tratamiento,
-                'responsableControl': riesgo.responsable_control,
-                'aceptado': riesgo.aceptado,
-                'zonaRiesgo': riesgo.calcular_zona_riesgo()
-            }
-            riesgos_frontend.append(riesgo_data)
-        
-        data['riesgos'] = riesgos_frontend
+        if self.context.get('incluir_riesgos', True):
+            data['riesgos'] = list(iterar_riesgos_frontend(instance.pk))
         return data
     
+    def validate_riesgos(self, value):
+        """Validar todos los riesgos en una sola pasada, antes de abrir la transacción"""
+        riesgos, errores = validar_riesgos(value)
+        if errores:
+            raise serializers.ValidationError(errores)
+        return riesgos
+    
     def create(self, validated_data):
         """Crear matriz desde el frontend"""
-        riesgos_data = self.initial_data.get('riesgos', [])
+        riesgos = validated_data.pop('riesgos', [])
         request = self.context.get('request')
         
         # Asignar usuario y empresa
@@ -248,42 +276,23 @@ class MatrizRiesgoFrontendSerializer(serializers.ModelSerializer):
         
         with transaction.atomic():
             matriz = MatrizRiesgo.objects.create(**validated_data)
-            
-            # Procesar riesgos del frontend
-            for riesgo_data in riesgos_data:
-                causas_data = riesgo_data.pop('causas', [])
-                
-                # Mapear campos del frontend al modelo
-                riesgo_modelo = {
-                    'matriz': matriz,
-                    'numero': riesgo_data.get('numero'),
-                    'fecha': riesgo_data.get('fecha'),
-                    'codigo': riesgo_data.get('codigo', ''),
-                    'nombre': riesgo_data.get('nombre'),
-                    'descripcion': riesgo_data.get('descripcion', ''),
-                    'efectos': riesgo_data.get('efectos', ''),
-                    'tipo_riesgo': riesgo_data.get('tipoRiesgo', ''),
-                    'probabilidad': riesgo_data.get('probabilidad', 1),
-                    'impacto': riesgo_data.get('impacto', 1),
-                    'controles_existentes': riesgo_data.get('controlesExistentes', ''),
-                    'tipo_control': riesgo_data.get('tipoControl', 'Preventivo'),
-                    'efectividad_control': riesgo_data.get('efectividadControl', 0),
-                    'controles_evaluacion': riesgo_data.get('controlesEvaluacion', {}),
-                    'tratamiento': riesgo_data.get('tratamiento', ''),
-                    'responsable_control': riesgo_data.get('responsableControl', ''),
-                    'aceptado': riesgo_data.get('aceptado', False)
-                }
-                
-                riesgo = RiesgoMatriz.objects.create(**riesgo_modelo)
-                
-                # Crear causas
-                for orden, causa_data in enumerate(causas_data, 1):
-                    CausaRiesgo.objects.create(
-                        riesgo=riesgo,
-                        causa=causa_data.get('causa', ''),
-                        factor=causa_data.get('factor', ''),
-                        controles=causa_data.get('controles', ''),
-                        orden=orden
-                    )
+            # Riesgos y causas con bulk_create por lotes
+            insertar_riesgos(matriz, riesgos)
+        
+        return matriz
+    
+    def update(self, instance, validated_data):
+        """
+        Actualizar matriz desde el frontend. Si se envía 'riesgos', se reconcilian
+        con los existentes y solo se escriben las filas que cambiaron.
+        """
+        riesgos = validated_data.pop('riesgos', None)
+        
+        with transaction.atomic():
+            matriz = super().update(instance, validated_data)
+            if riesgos is not None:
+                self.resumen_sincronizacion = sincronizar_riesgos(matriz, riesgos)
+                # Los contadores y la fecha se actualizaron con F(): releerlos para la respuesta y el ETag
+                matriz.refresh_from_db(fields=[*CAMPOS_CONTADORES, 'fecha_modificacion'])
         
-        return matriz
\ No newline at end of file
+        return matriz
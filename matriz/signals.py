@@ -0,0 +1,99 @@
+# matriz/signals.py
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .cache import invalidar, invalidar_catalogos, invalidar_matrices
+
+
+def _empresa_de(riesgo):
+    """[empresa_id] de la matriz del riesgo si ya está cargada; None para consultarla"""
+    if type(riesgo).matriz.is_cached(riesgo):
+        return [riesgo.matriz.empresa_id]
+    return None
+
+
+def capturar_aporte_anterior(sender, instance, raw=False, **kwargs):
+    """Antes de guardar, asegura conocer la contribución previa del riesgo a los contadores"""
+    if raw or instance.pk is None or getattr(instance, '_aporte_guardado', None):
+        return
+
+    # La instancia no se cargó completa desde la base de datos: leer su estado guardado
+    fila = sender.objects.filter(pk=instance.pk).values(*sender.CAMPOS_APORTE).first()
+    if fila:
+        instance._aporte_guardado = (fila['matriz_id'], sender(**fila).aporte_contadores())
+
+
+def actualizar_contadores_al_guardar(sender, instance, created, raw=False, **kwargs):
+    """Aplica a la matriz la diferencia entre la contribución anterior y la nueva del riesgo"""
+    from .models import MatrizRiesgo
+
+    if raw:
+        return
+
+    deltas = defaultdict(Counter)
+    anterior = None if created else getattr(instance, '_aporte_guardado', None)
+    if anterior:
+        matriz_id, aporte = anterior
+        deltas[matriz_id].subtract(aporte)
+
+    aporte_nuevo = instance.aporte_contadores()
+    deltas[instance.matriz_id].update(aporte_nuevo)
+
+    MatrizRiesgo.aplicar_deltas_contadores(deltas)
+    instance._aporte_guardado = (instance.matriz_id, aporte_nuevo)
+    # Si el riesgo cambió de matriz la empresa de la anterior no se conoce: se consulta
+    invalidar_matrices(deltas.keys(), None if len(deltas) > 1 else _empresa_de(instance))
+
+
+def actualizar_contadores_al_eliminar(sender, instance, origin=None, **kwargs):
+    """Descuenta el riesgo eliminado de los contadores de su matriz"""
+    from .models import MatrizRiesgo
+
+    # En eliminaciones en cascada (matriz o empresa) la matriz también desaparece
+    if isinstance(origin, QuerySet):
+        origen_es_riesgo = origin.model is sender
+    else:
+        origen_es_riesgo = isinstance(origin, sender)
+    if not origen_es_riesgo:
+        return
+
+    deltas = {instance.matriz_id: Counter()}
+    deltas[instance.matriz_id].subtract(instance.aporte_contadores())
+    MatrizRiesgo.aplicar_deltas_contadores(deltas)
+    invalidar_matrices(deltas.keys(), _empresa_de(instance))
+
+
+def invalidar_cache_matriz(sender, instance, raw=False, **kwargs):
+    """Invalida los agregados cacheados al crear, modificar o eliminar una matriz"""
+    if raw:
+        return
+    invalidar(empresa_ids=[instance.empresa_id], matriz_ids=[instance.pk])
+    cache.delete(f'matriz:empresa:{instance.pk}')
+
+
+def reclasificar_al_cambiar_umbrales(sender, instance, raw=False, **kwargs):
+    """Al crear, modificar o eliminar los umbrales de una empresa, reclasifica sus riesgos en bloque"""
+    from .models import MatrizRiesgo, olvidar_umbrales, reclasificar_riesgos
+
+    if raw:
+        return
+    olvidar_umbrales(instance.empresa_id)
+    reclasificar_riesgos(instance.empresa_id)
+    # Las zonas de las celdas y del riesgo residual dependen de los umbrales aunque
+    # ninguna zona guardada haya cambiado
+    invalidar(
+        empresa_ids=[instance.empresa_id],
+        matriz_ids=MatrizRiesgo.objects.filter(empresa_id=instance.empresa_id).values_list('pk', flat=True)
+    )
+
+
+def invalidar_bootstrap(sender, **kwargs):
+    """
+    Cambia la versión de los catálogos del bootstrap. Se hace al confirmar la transacción
+    para que ninguna petición concurrente guarde los datos anteriores bajo la nueva versión.
+    También aplica a los fixtures (raw), que suelen cargar justamente estos catálogos.
+    """
+    transaction.on_commit(invalidar_catalogos, using=kwargs.get('using'))
@@ -1,3 +1,1156 @@
+import csv
+import datetime
+import io
+import json
+import tempfile
+import warnings
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from API_C.consultas_repetidas import ConsultasRepetidas, vigilar
+from empresa.models import Empresa
+from normas.models import Norma
+from users.models import CustomUser
+
+from . import archivo_auditoria, auditoria, importacion, riesgo_residual, serializacion
+from .busqueda import BusquedaFTS5, BusquedaIndexada, backend_busqueda
+from .cache import obtener_o_calcular
+from .estadisticas import mapa_calor
+from .carga_riesgos import CAMPOS_RIESGO_FRONTEND, sincronizar_riesgos, validar_riesgos
+from .models import (
+    NIVELES_ZONA, AuditoriaMatriz, CausaRiesgo, ConfiguracionZonasRiesgo, MatrizRiesgo, ParametroMatriz,
+    RiesgoMatriz, campo_contador_nivel, reclasificar_riesgos, tabla_zonas_empresa
+)
+from .serializers import ConfiguracionZonasRiesgoSerializer, MatrizRiesgoFrontendSerializer
+
+
+def crear_empresa(nit='900'):
+    return Empresa.objects.create(nombre=f'Empresa {nit}', nit=nit, direccion='d', email='e@example.com', telefono='1')
+
+
+def crear_matriz(empresa, nombre='M', riesgos=3, **campos):
+    matriz = MatrizRiesgo.objects.create(
+        nombre=nombre, fecha_creacion=datetime.date.today(), empresa=empresa, **campos
+    )
+    for numero in range(1, riesgos + 1):
+        RiesgoMatriz.objects.create(
+            matriz=matriz, numero=numero, fecha=datetime.date.today(), nombre=f'R{numero}',
+            probabilidad=numero % 5 + 1, impacto=(numero * 2) % 5 + 1, tipo_riesgo='Operativo',
+            efectividad_control=numero * 10, aceptado=numero % 2 == 0
+        )
+    return matriz
+
+
+
+class ContadoresTests(TestCase):
+    """Los contadores desnormalizados coinciden siempre con un agregado fresco de los riesgos"""
+
+    def setUp(self):
+        empresa = crear_empresa()
+        self.matriz = crear_matriz(empresa, 'A', riesgos=4)
+        self.otra = crear_matriz(empresa, 'B', riesgos=2)
+
+    def assertContadoresReales(self, *matrices):
+        for matriz in matrices:
+            real = MatrizRiesgo.objects.filter(pk=matriz.pk).con_contadores_reales().get()
+            self.assertEqual(real.diferencias_contadores(), {}, matriz.nombre)
+
+    def test_crear_y_modificar(self):
+        self.assertEqual(MatrizRiesgo.objects.get(pk=self.matriz.pk).conteo_riesgos, 4)
+        riesgo = RiesgoMatriz.objects.get(matriz=self.matriz, numero=1)
+        riesgo.probabilidad = riesgo.impacto = 5
+        riesgo.aceptado = not riesgo.aceptado
+        riesgo.efectividad_control = 90
+        riesgo.save()
+        self.assertContadoresReales(self.matriz)
+
+    def test_modificar_instancia_parcial(self):
+        riesgo = RiesgoMatriz.objects.only('id', 'nombre').get(matriz=self.matriz, numero=2)
+        riesgo.aceptado = False
+        riesgo.save()
+        self.assertContadoresReales(self.matriz)
+
+    def test_cambiar_de_matriz(self):
+        riesgo = RiesgoMatriz.objects.get(matriz=self.matriz, numero=3)
+        riesgo.matriz = self.otra
+        riesgo.numero = 10
+        riesgo.save()
+        self.assertContadoresReales(self.matriz, self.otra)
+        self.assertEqual(MatrizRiesgo.objects.get(pk=self.otra.pk).conteo_riesgos, 3)
+
+    def test_eliminar(self):
+        RiesgoMatriz.objects.get(matriz=self.matriz, numero=1).delete()
+        RiesgoMatriz.objects.filter(matriz=self.matriz, numero__gte=3).delete()
+        self.assertContadoresReales(self.matriz)
+        self.assertEqual(MatrizRiesgo.objects.get(pk=self.matriz.pk).conteo_riesgos, 1)
+        # En cascada la matriz desaparece con sus riesgos: no hay nada que descontar
+        self.matriz.delete()
+        self.assertContadoresReales(self.otra)
+
+    def test_acciones_del_admin(self):
+        usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            is_staff=True, is_superuser=True
+        )
+        self.client.force_login(usuario)
+        seleccion = list(RiesgoMatriz.objects.values_list('pk', flat=True))
+        for accion, aceptados in [('marcar_aceptados', 6), ('marcar_no_aceptados', 0)]:
+            respuesta = self.client.post(
+                '/admin/matriz/riesgomatriz/', {'action': accion, '_selected_action': seleccion}
+            )
+            self.assertEqual(respuesta.status_code, 302)
+            self.assertContadoresReales(self.matriz, self.otra)
+            self.assertEqual(
+                sum(MatrizRiesgo.objects.values_list('conteo_aceptados', flat=True)), aceptados
+            )
+
+    def test_reconciliar_corrige_desviaciones(self):
+        MatrizRiesgo.objects.filter(pk=self.matriz.pk).update(conteo_riesgos=99, conteo_aceptados=0)
+        salida = io.StringIO()
+        call_command('reconciliar_contadores_matriz', dry_run=True, stdout=salida)
+        self.assertIn('con desviaciones: 1', salida.getvalue())
+        self.assertEqual(MatrizRiesgo.objects.get(pk=self.matriz.pk).conteo_riesgos, 99)
+
+        salida = io.StringIO()
+        call_command('reconciliar_contadores_matriz', stdout=salida)
+        self.assertIn('corregidas: 1', salida.getvalue())
+        self.assertContadoresReales(self.matriz, self.otra)
+
+
+    def test_cache_se_invalida_al_confirmar(self):
+        riesgo = RiesgoMatriz.objects.select_related('matriz').get(matriz=self.matriz, numero=1)
+        self.assertEqual(obtener_o_calcular('matriz', self.matriz.pk, 'prueba', lambda: 'antes'), 'antes')
+        with self.captureOnCommitCallbacks() as callbacks:
+            riesgo.aceptado = not riesgo.aceptado
+            riesgo.save()
+            self.assertEqual(obtener_o_calcular('matriz', self.matriz.pk, 'prueba', lambda: 'despues'), 'antes')
+        # La matriz ya estaba cargada: la empresa no se consulta al invalidar
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(obtener_o_calcular('matriz', self.matriz.pk, 'prueba', lambda: 'despues'), 'despues')
+
+
+class ZonasRiesgoTests(TestCase):
+    """Umbrales por empresa: validación, reclasificación en bloque, contadores y filtro del admin"""
+
+    # Con crear_matriz(riesgos=5): valores 6, 15, 8, 20 y 1
+    UMBRALES = {'minimo_extrema': 16, 'minimo_alta': 9, 'minimo_moderada': 7, 'minimo_baja': 2}
+
+    def setUp(self):
+        # Los umbrales se cachean por empresa y las empresas de las pruebas repiten id
+        self.addCleanup(cache.clear)
+        self.empresa = crear_empresa()
+        self.matriz = crear_matriz(self.empresa, 'A', riesgos=5)
+        self.ajena = crear_matriz(crear_empresa('901'), 'Ajena', riesgos=5)
+
+    def niveles(self, matriz):
+        return list(matriz.riesgos.order_by('numero').values_list('nivel_zona', flat=True))
+
+    def contadores(self, matriz):
+        matriz = MatrizRiesgo.objects.get(pk=matriz.pk)
+        return [getattr(matriz, campo_contador_nivel(nivel)) for nivel in NIVELES_ZONA]
+
+    def test_umbrales_por_defecto(self):
+        self.assertEqual(self.niveles(self.matriz), ['MODERADA', 'EXTREMA', 'MODERADA', 'EXTREMA', 'MUY BAJA'])
+        self.assertEqual(self.contadores(self.matriz), [2, 0, 2, 0, 1])
+
+    def test_validacion(self):
+        configuracion = ConfiguracionZonasRiesgo(empresa=self.empresa, minimo_extrema=10, minimo_alta=10)
+        with self.assertRaises(ValidationError):
+            configuracion.clean()
+        serializer = ConfiguracionZonasRiesgoSerializer(data={'minimo_alta': 15})
+        self.assertFalse(serializer.is_valid())
+        # Parcial: los campos no enviados conservan el valor guardado
+        configuracion = ConfiguracionZonasRiesgo.objects.create(empresa=self.empresa, **self.UMBRALES)
+        self.assertTrue(ConfiguracionZonasRiesgoSerializer(configuracion, data={'minimo_alta': 10}, partial=True).is_valid())
+        self.assertFalse(ConfiguracionZonasRiesgoSerializer(configuracion, data={'minimo_alta': 16}, partial=True).is_valid())
+
+    def test_cambio_de_umbrales_reclasifica_en_bloque(self):
+        configuracion = ConfiguracionZonasRiesgo.objects.create(empresa=self.empresa, **self.UMBRALES)
+        self.assertEqual(self.niveles(self.matriz), ['BAJA', 'ALTA', 'MODERADA', 'EXTREMA', 'MUY BAJA'])
+        self.assertEqual(self.contadores(self.matriz), [1, 1, 1, 1, 1])
+        self.assertContadoresReales()
+        # Los riesgos de otra empresa no cambian
+        self.assertEqual(self.niveles(self.ajena), ['MODERADA', 'EXTREMA', 'MODERADA', 'EXTREMA', 'MUY BAJA'])
+
+        # Los riesgos nuevos usan los umbrales vigentes
+        RiesgoMatriz.objects.create(
+            matriz=self.matriz, numero=6, fecha=datetime.date.today(), nombre='R6',
+            probabilidad=3, impacto=3, tipo_riesgo='Operativo'
+        )
+        self.assertEqual(self.matriz.riesgos.get(numero=6).nivel_zona, 'ALTA')
+
+        # Sin configuración vuelven los umbrales por defecto
+        configuracion.delete()
+        self.assertEqual(
+            self.niveles(self.matriz), ['MODERADA', 'EXTREMA', 'MODERADA', 'EXTREMA', 'MUY BAJA', 'MODERADA']
+        )
+        self.assertContadoresReales()
+
+    def test_reclasificar_solo_escribe_las_filas_que_cambian(self):
+        self.assertEqual(reclasificar_riesgos(self.empresa.pk), 0)
+        # Umbrales guardados sin la señal: la reclasificación queda pendiente
+        with mock.patch('matriz.models.reclasificar_riesgos'):
+            ConfiguracionZonasRiesgo.objects.create(empresa=self.empresa, **self.UMBRALES)
+        self.assertEqual(reclasificar_riesgos(self.empresa.pk), 2)
+        self.assertEqual(reclasificar_riesgos(self.empresa.pk), 0)
+        self.assertContadoresReales()
+
+    def test_api_modifica_umbrales(self):
+        usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=self.empresa
+        )
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        self.assertEqual(cliente.put('/api/matriz/zonas-riesgo/', self.UMBRALES, format='json').status_code, 403)
+
+        usuario.groups.add(Group.objects.create(name='Administradores'))
+        respuesta = cliente.put('/api/matriz/zonas-riesgo/', {'minimo_alta': 20}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = cliente.put('/api/matriz/zonas-riesgo/', self.UMBRALES, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.data['personalizada'])
+        self.assertEqual(self.contadores(self.matriz), [1, 1, 1, 1, 1])
+
+    def test_filtro_del_admin(self):
+        ConfiguracionZonasRiesgo.objects.create(empresa=self.empresa, **self.UMBRALES)
+        self.client.force_login(CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            is_staff=True, is_superuser=True
+        ))
+        respuesta = self.client.get('/admin/matriz/riesgomatriz/', {'zona_riesgo': 'extrema'})
+        self.assertEqual(
+            sorted((riesgo.matriz.nombre, riesgo.numero) for riesgo in respuesta.context['cl'].result_list),
+            [('A', 4), ('Ajena', 2), ('Ajena', 4)]
+        )
+
+    def assertContadoresReales(self):
+        for matriz in (self.matriz, self.ajena):
+            real = MatrizRiesgo.objects.filter(pk=matriz.pk).con_contadores_reales().get()
+            self.assertEqual(real.diferencias_contadores(), {}, matriz.nombre)
+
+
+class MapaCalorTests(TestCase):
+    """Mapas de calor de la matriz y de la empresa: conteos por celda con un GROUP BY"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = crear_empresa()
+        # Con 6 riesgos la celda (2, 3) tiene dos: los números 1 y 6
+        cls.matriz = crear_matriz(cls.empresa, 'A', riesgos=6)
+        cls.otra = crear_matriz(cls.empresa, 'B', riesgos=2)
+        crear_matriz(crear_empresa('901'), 'Ajena', riesgos=6)
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=cls.empresa
+        )
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    @staticmethod
+    def celda(datos, probabilidad, impacto):
+        return next(
+            celda for celda in datos['celdas']
+            if (celda['probabilidad'], celda['impacto']) == (probabilidad, impacto)
+        )
+
+    def test_una_consulta_agrupada(self):
+        riesgos = RiesgoMatriz.objects.filter(matriz=self.matriz)
+        with self.assertNumQueries(1) as consultas:
+            datos = mapa_calor(riesgos)
+        self.assertIn('GROUP BY', consultas.captured_queries[0]['sql'])
+        self.assertEqual(len(datos['celdas']), 25)
+        self.assertEqual(datos['total_riesgos'], 6)
+        self.assertEqual(self.celda(datos, 2, 3)['total'], 2)
+        self.assertEqual(self.celda(datos, 2, 3)['zona']['nivel'], 'MODERADA')
+        self.assertEqual(self.celda(datos, 5, 5)['total'], 0)
+
+        with self.assertNumQueries(1):
+            datos = mapa_calor(riesgos, incluir_ids=True)
+        self.assertEqual(
+            self.celda(datos, 2, 3)['ids'],
+            list(riesgos.filter(numero__in=[1, 6]).order_by('id').values_list('id', flat=True))
+        )
+
+    def test_mapa_de_la_matriz(self):
+        url = f'/api/matriz/matrices/{self.matriz.pk}/heatmap/'
+        datos = self.cliente.get(url).json()
+        self.assertEqual(datos['total_riesgos'], 6)
+        self.assertEqual(
+            {(c['probabilidad'], c['impacto']): c['total'] for c in datos['celdas'] if c['total']},
+            {(2, 3): 2, (3, 5): 1, (4, 2): 1, (5, 4): 1, (1, 1): 1}
+        )
+        # La segunda petición sale de la caché: sin GROUP BY
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.cliente.get(url).json(), datos)
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in consultas.captured_queries))
+
+    def test_mapa_de_la_empresa(self):
+        datos = self.cliente.get('/api/matriz/matrices/heatmap-empresa/').json()
+        # A (6 riesgos) y B (2), sin la matriz de la otra empresa
+        self.assertEqual(datos['total_riesgos'], 8)
+        self.assertEqual(self.celda(datos, 2, 3)['total'], 3)
+        self.assertEqual(self.celda(datos, 3, 5)['total'], 2)
+        datos = self.cliente.get('/api/matriz/matrices/heatmap-empresa/?ids=true').json()
+        self.assertEqual(len(self.celda(datos, 2, 3)['ids']), 3)
+
+
+class RiesgoResidualTests(TestCase):
+    """Riesgo residual por tipo de control, efectividad y criterios cumplidos"""
+
+    # (probabilidad, impacto, tipo de control, efectividad, criterios cumplidos) -> residual
+    CASOS = [
+        ((5, 4, 'Preventivo', 100, 5), (1, 4)),   # reducción total de la probabilidad
+        ((4, 3, 'Detectivo', 50, 0), (4, 3)),     # 50 % × 0.6 × 0.5 = 15 %: 3.4 sube a 4
+        ((3, 5, 'Correctivo', 80, 0), (3, 3)),    # el correctivo reduce el impacto
+        ((5, 5, 'Preventivo', 80, 5), (1, 5)),    # 5 × 0.2 no sube a 2 por coma flotante
+        ((4, 4, 'Preventivo', 100, 2), (2, 4)),   # solidez 0.5 + 0.5 × 2/5 = 0.7
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = crear_empresa()
+        cls.matriz = crear_matriz(cls.empresa, riesgos=0)
+        for numero, ((probabilidad, impacto, tipo, efectividad, cumplidos), _) in enumerate(cls.CASOS, 1):
+            criterios = RiesgoMatriz.controles_evaluacion_inicial()
+            criterios.update({criterio: True for criterio in list(criterios)[:cumplidos]})
+            RiesgoMatriz.objects.create(
+                matriz=cls.matriz, numero=numero, fecha=datetime.date.today(), nombre=f'R{numero}',
+                probabilidad=probabilidad, impacto=impacto, tipo_riesgo='Operativo',
+                tipo_control=tipo, efectividad_control=efectividad, controles_evaluacion=criterios
+            )
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=cls.empresa
+        )
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_residual(self):
+        for entrada, esperado in self.CASOS:
+            with self.subTest(entrada=entrada):
+                self.assertEqual(riesgo_residual.residual(*entrada), esperado)
+        # Sin tipo de control conocido no hay reducción
+        self.assertEqual(riesgo_residual.residual(4, 4, None, 100, 5), (4, 4))
+
+    def test_riesgos_residuales(self):
+        with self.assertNumQueries(1):
+            filas = riesgo_residual.riesgos_residuales(RiesgoMatriz.objects.filter(matriz=self.matriz))
+        self.assertEqual(
+            [(fila['probabilidad_residual'], fila['impacto_residual']) for fila in filas],
+            [esperado for _, esperado in self.CASOS]
+        )
+        self.assertEqual(filas[0]['zona_inherente']['nivel'], 'EXTREMA')
+        self.assertEqual(filas[0]['zona_residual'], {'nivel': 'BAJA', 'color': 'bg-green-400', 'valor': 4})
+
+    def assertResumen(self, resumen):
+        # Inherente 20 + 12 + 15 + 25 + 16 = 88; residual 4 + 12 + 9 + 5 + 8 = 38
+        self.assertEqual(resumen['total_riesgos'], 5)
+        self.assertEqual(resumen['valor_inherente_promedio'], 17.6)
+        self.assertEqual(resumen['valor_residual_promedio'], 7.6)
+        self.assertEqual(resumen['porcentaje_reduccion'], 56.82)
+        self.assertEqual(resumen['riesgos_que_bajan_de_zona'], 4)
+        self.assertEqual(
+            resumen['riesgos_por_nivel_residual'],
+            {'EXTREMA': 0, 'ALTA': 1, 'MODERADA': 2, 'BAJA': 2, 'MUY_BAJA': 0}
+        )
+        celdas = {(c['probabilidad'], c['impacto']): c['total'] for c in resumen['mapa_calor_residual'] if c['total']}
+        self.assertEqual(celdas, {esperado: 1 for _, esperado in self.CASOS})
+
+    def test_estadisticas_de_la_matriz_y_de_la_empresa(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        respuesta = cliente.get(f'/api/matriz/matrices/{self.matriz.pk}/estadisticas/')
+        self.assertResumen(respuesta.json()['riesgo_residual'])
+        respuesta = cliente.get('/api/matriz/estadisticas-empresa/')
+        self.assertResumen(respuesta.json()['riesgo_residual'])
+
+
+class BootstrapTests(TestCase):
+    """Catálogos del bootstrap: ETag fuerte, 304 y nueva versión al cambiar un catálogo"""
+
+    URL = '/api/matriz/bootstrap/'
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        ParametroMatriz.objects.create(tipo='PROBABILIDAD', valor=1, etiqueta='Raro', descripcion='d')
+
+    def test_etag_y_304(self):
+        respuesta = self.client.get(self.URL)
+        self.assertEqual(respuesta.status_code, 200)
+        version = respuesta.json()['version']
+        self.assertEqual(respuesta['ETag'], f'"{version}"')
+        self.assertEqual(respuesta['X-Bootstrap-Version'], version)
+        self.assertEqual(respuesta['Cache-Control'], 'public, no-cache')
+        self.assertEqual(respuesta.json()['parametros_matriz'][0]['etiqueta'], 'Raro')
+        self.assertNotIn('normas_disponibles', respuesta.json())
+
+        # Codificado una vez: las siguientes peticiones solo leen la caché
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(self.URL, HTTP_IF_NONE_MATCH=f'"{version}"')
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+        respuesta = self.client.get(self.URL, {'v': version})
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_cambio_de_catalogo_publica_otra_version(self):
+        etag = self.client.get(self.URL)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ParametroMatriz.objects.create(tipo='IMPACTO', valor=1, etiqueta='Menor', descripcion='d')
+        respuesta = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(len(respuesta.json()['parametros_matriz']), 2)
+
+        # Las normas disponibles solo van en la variante autenticada
+        self.client.force_login(CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1'
+        ))
+        respuesta = self.client.get(self.URL)
+        self.assertEqual(respuesta.json()['normas_disponibles'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Norma.objects.create(nombre='ISO', descripcion='d', version='1', estado='aprobada')
+        nueva = self.client.get(self.URL, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertEqual([norma['nombre'] for norma in nueva.json()['normas_disponibles']], ['ISO'])
+
+    def test_cambio_de_umbrales_no_cambia_el_bootstrap(self):
+        # Los umbrales son de cada empresa (zonas-riesgo), no un catálogo del bootstrap
+        etag = self.client.get(self.URL)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ConfiguracionZonasRiesgo.objects.create(empresa=crear_empresa(), minimo_extrema=20)
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class TableroEmpresaTests(TestCase):
+    """Estadísticas de la empresa: agregados, caché y su invalidación al confirmar"""
+
+    URL = '/api/matriz/estadisticas-empresa/'
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = crear_empresa()
+        # Valores 6, 15, 8, 20 (A) y 6, 15 (B); aceptados los pares; efectividad 10 × número
+        cls.matriz = crear_matriz(empresa, 'A', riesgos=4)
+        crear_matriz(empresa, 'B', riesgos=2)
+        crear_matriz(crear_empresa('901'), 'Ajena', riesgos=4)
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=empresa
+        )
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def test_agregados(self):
+        datos = self.cliente.get(self.URL).json()
+        self.assertEqual(datos['total_matrices'], 2)
+        self.assertEqual(datos['total_riesgos'], 6)
+        self.assertEqual(
+            datos['riesgos_por_nivel'], {'EXTREMA': 3, 'ALTA': 0, 'MODERADA': 3, 'BAJA': 0, 'MUY_BAJA': 0}
+        )
+        self.assertEqual(datos['riesgos_por_tipo'], {'Operativo': 6})
+        self.assertEqual(datos['porcentaje_riesgos_aceptados'], 50.0)
+        self.assertEqual(datos['efectividad_promedio_controles'], 21.67)
+        # De mayor a menor valor; los empates siguen el id (texto) de la matriz
+        criticos = [(riesgo['zona_riesgo']['valor'], riesgo['matriz']) for riesgo in datos['riesgos_criticos']]
+        self.assertEqual([valor for valor, _ in criticos], [20, 15, 15])
+        self.assertEqual(sorted(criticos), [(15, 'A'), (15, 'B'), (20, 'A')])
+        self.assertEqual({matriz['nombre'] for matriz in datos['matrices_recientes']}, {'A', 'B'})
+
+    def test_se_invalida_al_confirmar_una_escritura(self):
+        self.assertEqual(self.cliente.get(self.URL).json()['porcentaje_riesgos_aceptados'], 50.0)
+        # Servido desde la caché: no vuelve a leer los riesgos
+        with CaptureQueriesContext(connection) as consultas:
+            self.cliente.get(self.URL)
+        self.assertFalse(any('matriz_riesgomatriz' in q['sql'] for q in consultas.captured_queries))
+
+        riesgo = self.matriz.riesgos.get(numero=2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            riesgo.aceptado = False
+            riesgo.save()
+            # Antes de confirmar la caché no cambia
+            self.assertEqual(self.cliente.get(self.URL).json()['porcentaje_riesgos_aceptados'], 50.0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.cliente.get(self.URL).json()['porcentaje_riesgos_aceptados'], 33.33)
+
+
+class CrearFrontendTests(TestCase):
+    """create-frontend inserta riesgos y causas en bloque: consultas constantes"""
+
+    URL = '/api/matriz/matrices/create-frontend/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=crear_empresa()
+        )
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    @staticmethod
+    def payload(nombre, riesgos):
+        return {
+            'nombre': nombre, 'descripcion': 'd', 'responsable': 'r', 'fechaCreacion': '2026-01-15',
+            'riesgos': [
+                {
+                    'numero': numero, 'fecha': '2026-01-15', 'nombre': f'R{numero}', 'tipoRiesgo': 'Operativo',
+                    'probabilidad': numero % 5 + 1, 'impacto': 5, 'aceptado': numero % 2 == 0,
+                    'efectividadControl': 10,
+                    'causas': [
+                        {'causa': f'C{numero}.{orden}', 'factor': 'Método'} for orden in range(1, numero % 3 + 1)
+                    ],
+                }
+                for numero in range(1, riesgos + 1)
+            ],
+        }
+
+    def crear(self, nombre, riesgos):
+        tabla_zonas_empresa(self.usuario.empresa_id)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.cliente.post(self.URL, self.payload(nombre, riesgos), format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+        return MatrizRiesgo.objects.get(pk=respuesta.json()['matriz']['id']), len(consultas.captured_queries)
+
+    def test_riesgos_y_causas_en_bloque(self):
+        matriz, consultas = self.crear('Pequeña', 3)
+        # Savepoints del atomic, id libre, INSERT de la matriz, de los riesgos y de las
+        # causas, y una UPDATE de los contadores
+        self.assertEqual(consultas, 7)
+        self.assertEqual(
+            list(CausaRiesgo.objects.filter(riesgo__matriz=matriz)
+                 .order_by('riesgo__numero', 'orden').values_list('causa', 'orden')),
+            [('C1.1', 1), ('C2.1', 1), ('C2.2', 2)]
+        )
+        # Contadores: 3 riesgos (valores 10, 15, 20), uno aceptado, efectividad 10 cada uno
+        self.assertEqual(
+            [matriz.conteo_riesgos, matriz.conteo_extrema, matriz.conteo_alta, matriz.conteo_aceptados,
+             matriz.suma_efectividad_control],
+            [3, 2, 1, 1, 30]
+        )
+
+        # El número de consultas no depende del tamaño del payload
+        matriz, consultas = self.crear('Grande', 40)
+        self.assertEqual(consultas, 7)
+        self.assertEqual(matriz.conteo_riesgos, 40)
+        self.assertEqual(
+            CausaRiesgo.objects.filter(riesgo__matriz=matriz).count(), sum(numero % 3 for numero in range(1, 41))
+        )
+        real = MatrizRiesgo.objects.filter(pk=matriz.pk).con_contadores_reales().get()
+        self.assertEqual(real.diferencias_contadores(), {})
+
+
+class SincronizacionTests(TestCase):
+    """Reconciliación de riesgos y causas: solo se escribe lo que cambió"""
+
+    def setUp(self):
+        empresa = crear_empresa()
+        self.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        self.matriz = crear_matriz(empresa, riesgos=3)
+        self.riesgo = RiesgoMatriz.objects.get(matriz=self.matriz, numero=1)
+        self.causas = [
+            CausaRiesgo.objects.create(riesgo=self.riesgo, causa=f'C{orden}', orden=orden) for orden in (1, 2)
+        ]
+
+    def payload(self, cambios=None, con_id=True):
+        """Los riesgos actuales en formato del frontend, con `cambios` {numero: {clave: valor}}"""
+        riesgos = []
+        for riesgo in RiesgoMatriz.objects.filter(matriz=self.matriz).order_by('numero'):
+            datos = {clave: getattr(riesgo, campo) for clave, (campo, _) in CAMPOS_RIESGO_FRONTEND.items()}
+            if con_id:
+                datos['id'] = riesgo.pk
+            riesgos.append({**datos, **(cambios or {}).get(riesgo.numero, {})})
+        return riesgos
+
+    def sincronizar(self, riesgos):
+        validos, errores = validar_riesgos(riesgos)
+        self.assertEqual(errores, {})
+        return sincronizar_riesgos(self.matriz, validos)
+
+    def assertContadoresReales(self):
+        real = MatrizRiesgo.objects.filter(pk=self.matriz.pk).con_contadores_reales().get()
+        self.assertEqual(real.diferencias_contadores(), {})
+
+    def test_sin_cambios_no_escribe_riesgos(self):
+        riesgos = self.payload()
+        tabla_zonas_empresa(self.matriz.empresa_id)
+        # Leer los riesgos + los savepoints del atomic + la UPDATE de la matriz (fecha_modificacion)
+        with self.assertNumQueries(4):
+            resumen = self.sincronizar(riesgos)
+        self.assertEqual(resumen['riesgos_actualizados'], 0)
+        self.assertEqual(resumen['riesgos_creados'] + resumen['riesgos_eliminados'], 0)
+
+    def test_empareja_por_id_e_intercambia_numeros(self):
+        ids = dict(RiesgoMatriz.objects.filter(matriz=self.matriz).values_list('numero', 'pk'))
+        # Intercambiar 1 y 2 obliga a pasar por números temporales (unique_together)
+        riesgos = self.payload({1: {'numero': 2, 'nombre': 'antes 1'}, 2: {'numero': 1}})
+        resumen = self.sincronizar(riesgos)
+        self.assertEqual(resumen['riesgos_actualizados'], 2)
+        self.assertEqual(
+            dict(RiesgoMatriz.objects.filter(matriz=self.matriz).values_list('pk', 'numero')),
+            {ids[1]: 2, ids[2]: 1, ids[3]: 3}
+        )
+        self.assertEqual(RiesgoMatriz.objects.get(pk=ids[1]).nombre, 'antes 1')
+
+    def test_empareja_por_numero_crea_y_elimina(self):
+        ids = dict(RiesgoMatriz.objects.filter(matriz=self.matriz).values_list('numero', 'pk'))
+        riesgos = self.payload({2: {'probabilidad': 5, 'impacto': 5, 'aceptado': True}}, con_id=False)
+        riesgos = [riesgo for riesgo in riesgos if riesgo['numero'] != 1]
+        riesgos.append({**riesgos[0], 'numero': 7, 'nombre': 'Nuevo'})
+        # Lectura, DELETE de causas y riesgos del 1, UPDATE del 2, INSERT del 7, una UPDATE de
+        # contadores por insertar_riesgos y otra por la sincronización, más los savepoints
+        with self.assertNumQueries(9):
+            resumen = self.sincronizar(riesgos)
+        self.assertEqual(
+            (resumen['riesgos_creados'], resumen['riesgos_actualizados'], resumen['riesgos_eliminados']),
+            (1, 1, 1)
+        )
+        riesgo = RiesgoMatriz.objects.get(matriz=self.matriz, numero=2)
+        self.assertEqual((riesgo.pk, riesgo.nivel_zona, riesgo.aceptado), (ids[2], 'EXTREMA', True))
+        self.assertFalse(RiesgoMatriz.objects.filter(pk=ids[1]).exists())
+        self.assertFalse(CausaRiesgo.objects.filter(riesgo_id=ids[1]).exists())
+        self.assertEqual(
+            list(RiesgoMatriz.objects.filter(matriz=self.matriz).order_by('numero').values_list('numero', flat=True)),
+            [2, 3, 7]
+        )
+        self.assertContadoresReales()
+
+    def test_causas_se_actualizan_crean_y_eliminan(self):
+        primera, segunda = self.causas
+        riesgos = self.payload({1: {'causas': [
+            {'id': segunda.pk, 'causa': 'C2 editada'},
+            {'causa': 'Nueva'},
+        ]}})
+        resumen = self.sincronizar(riesgos)
+        self.assertEqual(resumen['causas'], {'creadas': 1, 'actualizadas': 1, 'eliminadas': 1})
+        self.assertEqual(
+            list(self.riesgo.causas.order_by('orden').values_list('pk', 'causa', 'orden')),
+            [(segunda.pk, 'C2 editada', 1), (CausaRiesgo.objects.latest('pk').pk, 'Nueva', 2)]
+        )
+        self.assertFalse(CausaRiesgo.objects.filter(pk=primera.pk).exists())
+
+    def test_actualizar_riesgo_empareja_causas_por_id(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        primera, segunda = self.causas
+        respuesta = cliente.patch(
+            f'/api/matriz/matrices/{self.matriz.pk}/riesgos/{self.riesgo.pk}/',
+            {'causas': [
+                {'id': segunda.pk, 'causa': 'C2'},
+                {'id': primera.pk, 'causa': 'C1 editada'},
+                {'causa': 'C3'},
+            ]},
+            format='json'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            list(self.riesgo.causas.order_by('orden').values_list('pk', 'causa')),
+            [(segunda.pk, 'C2'), (primera.pk, 'C1 editada'), (CausaRiesgo.objects.latest('pk').pk, 'C3')]
+        )
+
+
+
+class ClonacionTests(TestCase):
+    """La copia trae riesgos, causas y contadores calculados sobre lo copiado"""
+
+    def test_clonar_matriz(self):
+        empresa = crear_empresa()
+        usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        origen = crear_matriz(empresa, 'Original', riesgos=4)
+        for riesgo in RiesgoMatriz.objects.filter(matriz=origen, numero__lte=2):
+            CausaRiesgo.objects.bulk_create([
+                CausaRiesgo(riesgo=riesgo, causa=f'{riesgo.numero}.{orden}', orden=orden) for orden in (1, 2)
+            ])
+        # Contadores desviados en la original: no deben pasar a la copia
+        MatrizRiesgo.objects.filter(pk=origen.pk).update(conteo_riesgos=99, conteo_aceptados=0)
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        respuesta = cliente.post(f'/api/matriz/matrices/{origen.pk}/clone/', {'nombre': 'Copia'}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual((respuesta.data['riesgos_copiados'], respuesta.data['causas_copiadas']), (4, 4))
+
+        copia = MatrizRiesgo.objects.get(pk=respuesta.data['matriz']['id'])
+        self.assertEqual(copia.nombre, 'Copia')
+        self.assertEqual(
+            list(RiesgoMatriz.objects.filter(matriz=copia).order_by('numero').values_list('numero', 'nivel_zona')),
+            list(RiesgoMatriz.objects.filter(matriz=origen).order_by('numero').values_list('numero', 'nivel_zona'))
+        )
+        self.assertEqual(
+            sorted(CausaRiesgo.objects.filter(riesgo__matriz=copia).values_list('riesgo__numero', 'causa')),
+            [(1, '1.1'), (1, '1.2'), (2, '2.1'), (2, '2.2')]
+        )
+        real = MatrizRiesgo.objects.filter(pk=copia.pk).con_contadores_reales().get()
+        self.assertEqual(real.diferencias_contadores(), {})
+        self.assertEqual((copia.conteo_riesgos, copia.conteo_aceptados), (4, 2))
+
+
+
+CSV_IMPORTACION = (
+    'numero,fecha,nombre,tipo_riesgo,probabilidad,impacto,aceptado,causa,causa_factor\n'
+    '1,2024-01-10,Caída del servicio,Operativo,4,5,sí,Falla eléctrica,Infraestructura\n'
+    '1,,,,,,,Sin respaldo,Sistemas de información\n'
+    '2,2024-01-10,Probabilidad fuera de rango,Operativo,9,2,,,\n'
+    '3,2024-01-10,Tipo desconocido,Climático,2,2,,,\n'
+    '4,2024-01-10,Impacto no numérico,Operativo,2,alto,,,\n'
+    '5,2024-01-10,Fuga de datos,Estratégico,2,3,no,,\n'
+)
+
+NDJSON_IMPORTACION = '\n'.join([
+    json.dumps({'numero': 1, 'fecha': '2024-01-10', 'nombre': 'A', 'tipo_riesgo': 'Operativo',
+                'probabilidad': 3, 'impacto': 3, 'causas': [{'causa': 'X'}, {'causa': 'Y'}]}),
+    '{no es json',
+    json.dumps({'numero': 2, 'fecha': '2024-01-10', 'nombre': 'B', 'tipo_riesgo': 'Otro',
+                'probabilidad': 0, 'impacto': 3}),
+    '',
+    json.dumps({'numero': 3, 'fecha': '2024-01-10', 'nombre': 'C', 'tipo_riesgo': 'Financiero',
+                'probabilidad': 1, 'impacto': 5}),
+])
+
+
+class ImportacionTests(TestCase):
+    """Importación CSV/NDJSON: errores por fila, simulación y lotes confirmados"""
+
+    def setUp(self):
+        empresa = crear_empresa()
+        self.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        self.matriz = crear_matriz(empresa, riesgos=0)
+
+    def importar(self, contenido, formato, **parametros):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        archivo = SimpleUploadedFile(f'riesgos.{formato}', contenido.encode())
+        consulta = '&'.join(f'{clave}={valor}' for clave, valor in parametros.items())
+        return cliente.post(
+            f'/api/matriz/matrices/{self.matriz.pk}/importar/?{consulta}', {'archivo': archivo}, format='multipart'
+        )
+
+    def assertContadoresReales(self):
+        real = MatrizRiesgo.objects.filter(pk=self.matriz.pk).con_contadores_reales().get()
+        self.assertEqual(real.diferencias_contadores(), {})
+
+    def test_csv_con_errores_por_fila(self):
+        respuesta = self.importar(CSV_IMPORTACION, 'csv')
+        self.assertEqual(respuesta.status_code, 201)
+        reporte = respuesta.data
+        self.assertEqual((reporte['riesgos_leidos'], reporte['riesgos_creados']), (5, 2))
+        self.assertIsNone(reporte['interrumpido'])
+        self.assertEqual(
+            [(error['fila'], error['numero'], sorted(error['errores'])) for error in reporte['errores']],
+            [(4, 2, ['probabilidad']), (5, 3, ['tipo_riesgo']), (6, 4, ['impacto'])]
+        )
+        riesgo = RiesgoMatriz.objects.get(matriz=self.matriz, numero=1)
+        self.assertEqual((riesgo.nivel_zona, riesgo.aceptado), ('EXTREMA', True))
+        self.assertEqual(
+            list(riesgo.causas.order_by('orden').values_list('causa', 'factor')),
+            [('Falla eléctrica', 'Infraestructura'), ('Sin respaldo', 'Sistemas de información')]
+        )
+        self.assertContadoresReales()
+
+        # Reimportar: los números ya existentes se reportan, no se duplican
+        reporte = self.importar(CSV_IMPORTACION, 'csv').data
+        self.assertEqual(reporte['riesgos_creados'], 0)
+        self.assertEqual(reporte['total_errores'], 5)
+
+    def test_ndjson(self):
+        reporte = self.importar(NDJSON_IMPORTACION, 'ndjson').data
+        self.assertEqual((reporte['riesgos_leidos'], reporte['riesgos_creados']), (3, 2))
+        self.assertEqual(
+            [(error['fila'], sorted(error['errores'])) for error in reporte['errores']],
+            [(2, ['non_field_errors']), (3, ['probabilidad', 'tipo_riesgo'])]
+        )
+        self.assertEqual(
+            list(CausaRiesgo.objects.filter(riesgo__matriz=self.matriz).order_by('orden').values_list('causa', flat=True)),
+            ['X', 'Y']
+        )
+        self.assertContadoresReales()
+
+    def test_simular_no_escribe(self):
+        respuesta = self.importar(CSV_IMPORTACION, 'csv', simular='true')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertTrue(respuesta.data['simulado'])
+        self.assertEqual((respuesta.data['riesgos_creados'], respuesta.data['total_errores']), (2, 3))
+        self.assertFalse(RiesgoMatriz.objects.filter(matriz=self.matriz).exists())
+
+    def test_lote_fallido_conserva_los_anteriores(self):
+        insertar_riesgos = importacion.insertar_riesgos
+        llamadas = []
+
+        def fallar_en_el_segundo(*args):
+            llamadas.append(args)
+            if len(llamadas) == 2:
+                raise IntegrityError('lote rechazado')
+            return insertar_riesgos(*args)
+
+        contenido = '\n'.join(
+            json.dumps({'numero': numero, 'fecha': '2024-01-10', 'nombre': f'R{numero}', 'tipo_riesgo': 'Operativo'})
+            for numero in range(1, 6)
+        )
+        with mock.patch.object(importacion, 'insertar_riesgos', side_effect=fallar_en_el_segundo):
+            reporte = importacion.importar_riesgos(self.matriz, io.BytesIO(contenido.encode()), 'ndjson', tamano_lote=2)
+        self.assertEqual(reporte['riesgos_creados'], 2)
+        self.assertEqual(reporte['interrumpido'], {'fila': 3, 'error': 'lote rechazado'})
+        self.assertEqual(
+            list(RiesgoMatriz.objects.filter(matriz=self.matriz).order_by('numero').values_list('numero', flat=True)),
+            [1, 2]
+        )
+        self.assertEqual(len(llamadas), 2)
+        self.assertContadoresReales()
+
+
+
+class SalidaPorFragmentosTests(TestCase):
+    """JSON del frontend y exportaciones CSV/NDJSON: mismo contenido, dos consultas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = crear_empresa()
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        cls.matriz = crear_matriz(empresa, 'Principal', riesgos=4)
+        cls.otra = crear_matriz(empresa, 'Otra', riesgos=2)
+        for riesgo in RiesgoMatriz.objects.filter(numero__lte=2):
+            CausaRiesgo.objects.bulk_create([
+                CausaRiesgo(riesgo=riesgo, causa=f'{riesgo.nombre}.{orden}', factor='Método', orden=orden)
+                for orden in range(1, riesgo.numero + 1)
+            ])
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def consumir(self, url, consultas=2):
+        """Contenido completo de la respuesta por fragmentos; las lecturas ocurren al consumirla"""
+        respuesta = self.cliente.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        with self.assertNumQueries(consultas):
+            return b''.join(respuesta.streaming_content).decode('utf-8')
+
+    def esperados(self, *matrices):
+        """(matriz, riesgo, [causas]) desde el ORM, en el orden de la exportación"""
+        riesgos = RiesgoMatriz.objects.filter(matriz__in=matrices).order_by('matriz_id', 'numero')
+        return [
+            (riesgo, list(riesgo.causas.order_by('orden'))) for riesgo in riesgos.prefetch_related('causas')
+        ]
+
+    def test_causas_de_un_riesgo_eliminado_entre_lecturas(self):
+        original = serializacion._causas_por_riesgo
+
+        def causas_y_luego_eliminar(*args):
+            # Lee las causas y elimina el riesgo 1 antes de que se lean los riesgos
+            grupos = list(original(*args))
+            RiesgoMatriz.objects.filter(matriz=self.matriz, numero=1).delete()
+            yield from grupos
+
+        with mock.patch.object(serializacion, '_causas_por_riesgo', causas_y_luego_eliminar):
+            filas = list(serializacion.iterar_riesgos_con_causas([self.matriz.pk, self.otra.pk], ['nombre']))
+        # Las matrices se recorren en el orden de sus ids (texto)
+        esperadas = {
+            self.matriz.pk: [('R2', ['R2.1', 'R2.2']), ('R3', []), ('R4', [])],
+            self.otra.pk: [('R1', ['R1.1']), ('R2', ['R2.1', 'R2.2'])],
+        }
+        self.assertEqual(
+            [(riesgo['nombre'], [causa['causa'] for causa in causas]) for riesgo, causas in filas],
+            [fila for matriz_id in sorted(esperadas) for fila in esperadas[matriz_id]]
+        )
+
+    def test_json_frontend(self):
+        datos = json.loads(self.consumir(f'/api/matriz/matrices/{self.matriz.pk}/frontend/'))
+        self.assertEqual(datos['nombre'], 'Principal')
+        self.assertEqual(
+            [
+                (riesgo['id'], riesgo['numero'], riesgo['probabilidad'], riesgo['aceptado'],
+                 riesgo['zonaRiesgo']['nivel'], [causa['causa'] for causa in riesgo['causas']])
+                for riesgo in datos['riesgos']
+            ],
+            [
+                (riesgo.pk, riesgo.numero, riesgo.probabilidad, riesgo.aceptado, riesgo.nivel_zona,
+                 [causa.causa for causa in causas])
+                for riesgo, causas in self.esperados(self.matriz)
+            ]
+        )
+        # Misma estructura que la respuesta sin fragmentos del serializer
+        completa = json.loads(json.dumps(
+            MatrizRiesgoFrontendSerializer(MatrizRiesgo.objects.get(pk=self.matriz.pk)).data, cls=DjangoJSONEncoder
+        ))
+        self.assertEqual(datos, completa)
+
+    def test_csv(self):
+        contenido = self.consumir('/api/matriz/matrices/exportar-empresa/?formato=csv')
+        self.assertTrue(contenido.startswith('\ufeff'))
+        filas = list(csv.DictReader(io.StringIO(contenido[1:])))
+        esperadas = [
+            (riesgo.matriz_id, str(riesgo.numero), str(riesgo.probabilidad * riesgo.impacto), riesgo.nivel_zona,
+             causa.causa if causa else '')
+            for riesgo, causas in self.esperados(self.matriz, self.otra)
+            for causa in (causas or [None])
+        ]
+        self.assertEqual(
+            [
+                (fila['matriz_id'], fila['numero'], fila['valor_riesgo'], fila['zona_riesgo'], fila['causa'])
+                for fila in filas
+            ],
+            esperadas
+        )
+
+    def test_ndjson(self):
+        contenido = self.consumir(f'/api/matriz/matrices/{self.matriz.pk}/exportar/?formato=ndjson')
+        registros = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual(
+            [
+                (registro['numero'], registro['zona_riesgo'], registro['efectividad_control'],
+                 [(causa['orden'], causa['causa']) for causa in registro['causas']])
+                for registro in registros
+            ],
+            [
+                (riesgo.numero, riesgo.nivel_zona, riesgo.efectividad_control,
+                 [(causa.orden, causa.causa) for causa in causas])
+                for riesgo, causas in self.esperados(self.matriz)
+            ]
+        )
+
+
+
+class BusquedaTests(TestCase):
+    """Búsqueda de texto completo (FTS5 en SQLite): relevancia y filtro por empresa en el índice"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = crear_empresa()
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=cls.empresa
+        )
+        cls.matriz = crear_matriz(cls.empresa, 'Seguridad', riesgos=3)
+        riesgos = {riesgo.numero: riesgo for riesgo in RiesgoMatriz.objects.filter(matriz=cls.matriz)}
+        RiesgoMatriz.objects.filter(pk=riesgos[1].pk).update(descripcion='Posible fuga por terceros')
+        RiesgoMatriz.objects.filter(pk=riesgos[2].pk).update(nombre='Fuga de información')
+        CausaRiesgo.objects.create(riesgo=riesgos[3], causa='Fugas en el almacenamiento', orden=1)
+        cls.ids = {numero: riesgo.pk for numero, riesgo in riesgos.items()}
+        ajena = crear_matriz(crear_empresa('901'), 'Fuga ajena', riesgos=1)
+        RiesgoMatriz.objects.filter(matriz=ajena).update(nombre='Fuga de información')
+
+    def test_motor_indexado_es_abstracto(self):
+        self.assertIsInstance(backend_busqueda(), BusquedaFTS5)
+        with self.assertRaises(TypeError):
+            BusquedaIndexada()
+
+    def test_riesgos_por_relevancia_de_la_empresa(self):
+        resultado = backend_busqueda().filtrar_riesgos(RiesgoMatriz.objects.all(), 'fuga', self.empresa.pk)
+        ordenados = resultado.order_by('-rango_busqueda').values_list('pk', flat=True)
+        # Nombre (peso 10) > descripción (4) > causas (1); el riesgo de la otra empresa no aparece
+        self.assertEqual(list(ordenados), [self.ids[2], self.ids[1], self.ids[3]])
+
+    def test_matrices_filtradas_por_empresa(self):
+        buscar = backend_busqueda().filtrar_matrices
+        self.assertEqual(list(buscar(MatrizRiesgo.objects.all(), 'fuga', self.empresa.pk)), [self.matriz])
+        self.assertEqual(MatrizRiesgo.objects.count(), 2)
+        self.assertEqual(buscar(MatrizRiesgo.objects.all(), 'fuga').count(), 2)
+
+    def test_listado_ordenado_por_relevancia(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        datos = cliente.get(f'/api/matriz/matrices/{self.matriz.pk}/riesgos/?search=fuga&fields=id').json()
+        self.assertEqual([riesgo['id'] for riesgo in datos['results']], [self.ids[2], self.ids[1], self.ids[3]])
+
+
+
+class EscrituraCondicionalTests(TestCase):
+    """update-frontend respeta If-Match y devuelve el ETag de la versión guardada"""
+
+    def test_update_frontend_condicional(self):
+        empresa = crear_empresa()
+        usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        matriz = crear_matriz(empresa, riesgos=2)
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        detalle = f'/api/matriz/matrices/{matriz.pk}/'
+        url = f'/api/matriz/matrices/{matriz.pk}/update-frontend/'
+        etag = cliente.get(detalle)['ETag']
+
+        riesgos = [
+            {'numero': numero, 'fecha': '2024-01-10', 'nombre': f'R{numero}', 'tipoRiesgo': 'Operativo'}
+            for numero in (1, 2, 3)
+        ]
+        respuesta = cliente.put(url, {'nombre': 'Nueva', 'riesgos': riesgos}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['cambios']['riesgos_creados'], 1)
+        self.assertEqual(MatrizRiesgo.objects.get(pk=matriz.pk).conteo_riesgos, 3)
+        # El ETag de la respuesta es el de la versión guardada: sirve para la siguiente escritura
+        self.assertEqual(respuesta['ETag'], cliente.get(detalle)['ETag'])
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+        respuesta = cliente.put(url, {'nombre': 'Pisada'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 412)
+        self.assertEqual(MatrizRiesgo.objects.get(pk=matriz.pk).nombre, 'Nueva')
+
+
+class ConsultasRepetidasTests(TestCase):
+    """
+    Listados de matrices sin N+1. El runner de pruebas vigila cada petición: si un
+    listado vuelve a consultar por fila, la petición lanza ConsultasRepetidas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        empresa = Empresa.objects.create(
+            nombre='Empresa', nit='900', direccion='d', email='e@example.com', telefono='1'
+        )
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1',
+            empresa=empresa, is_staff=True, is_superuser=True
+        )
+        for indice in range(8):
+            matriz = MatrizRiesgo.objects.create(
+                nombre=f'M{indice}', fecha_creacion=datetime.date.today(), empresa=empresa,
+                creado_por=cls.usuario
+            )
+            for numero in range(1, 4):
+                RiesgoMatriz.objects.create(
+                    matriz=matriz, numero=numero, fecha=datetime.date.today(), nombre=f'R{numero}',
+                    probabilidad=numero, impacto=numero, tipo_riesgo='Operativo'
+                )
+
+    def test_listados_sin_n_mas_uno(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        for url in ['/api/matriz/matrices/', '/api/matriz/matrices/mis_matrices/']:
+            self.assertEqual(cliente.get(url).status_code, 200)
+        self.client.force_login(self.usuario)
+        for url in ['/admin/matriz/matrizriesgo/', '/admin/matriz/riesgomatriz/']:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_mis_matrices_por_paginas_ordenado(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        esperado = list(MatrizRiesgo.objects.order_by('-fecha_modificacion', '-id').values_list('pk', flat=True))
+        recibido = []
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            for pagina in (1, 2, 3):
+                respuesta = cliente.get(f'/api/matriz/matrices/mis_matrices/?page={pagina}&page_size=3')
+                self.assertEqual(respuesta.status_code, 200)
+                recibido += [matriz['id'] for matriz in respuesta.data['matrices']]
+        self.assertEqual(recibido, esperado)
+
+    def test_detector_informa_el_origen(self):
+        with self.assertRaises(ConsultasRepetidas) as error:
+            with vigilar('prueba', modo='error'):
+                for riesgo in RiesgoMatriz.objects.all():
+                    riesgo.matriz.nombre
+        mensaje = str(error.exception)
+        self.assertIn('24 veces', mensaje)
+        self.assertIn('matriz/tests.py', mensaje)
+
+
+class AuditoriaEscrituraTests(TestCase):
+    """Los registros se escriben al hacer commit y un fallo no los pierde"""
+
+    def setUp(self):
+        self.matriz = crear_matriz(crear_empresa(), riesgos=0)
+
+    def test_se_escribe_al_hacer_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            auditoria.registrar(self.matriz.pk, None, 'UPDATE', 'cambio', datos_nuevos={'nombre': 'x'})
+        self.assertEqual(AuditoriaMatriz.objects.filter(matriz=self.matriz).count(), 1)
+        self.assertEqual(auditoria._pendientes, [])
+
+    @mock.patch.object(auditoria, '_iniciar_temporizador')
+    def test_fallo_devuelve_el_lote_a_la_cola(self, iniciar_temporizador):
+        with mock.patch.object(AuditoriaMatriz.objects, 'bulk_create', side_effect=OperationalError):
+            with self.captureOnCommitCallbacks(execute=True):
+                auditoria.registrar(self.matriz.pk, None, 'UPDATE', 'cambio')
+        self.assertEqual(len(auditoria._pendientes), 1)
+        iniciar_temporizador.assert_called_once()
+
+        # El próximo volcado (temporizador o fin de petición) lo escribe
+        auditoria.volcar_si_vencido()
+        self.assertEqual(AuditoriaMatriz.objects.filter(matriz=self.matriz).count(), 1)
+        self.assertEqual(auditoria._pendientes, [])
+
+
+class AuditoriaArchivadaTests(TestCase):
+    """El listado que alcanza el archivo mezcla filas vivas y archivadas página a página"""
+
+    def setUp(self):
+        empresa = crear_empresa()
+        self.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1', empresa=empresa
+        )
+        matriz = crear_matriz(empresa, riesgos=0)
+        inicio = datetime.datetime(2020, 1, 20)
+        AuditoriaMatriz.objects.bulk_create([
+            AuditoriaMatriz(matriz=matriz, accion='UPDATE', descripcion=f'a{dias}',
+                            fecha_accion=inicio + datetime.timedelta(days=dias))
+            for dias in (0, 5, 15, 20, 40)
+        ])
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        call_command('archivar_auditoria_matriz', dias=30, directorio=self.directorio, stdout=mock.Mock())
+        # Filas vivas: recientes y una con fecha dentro del rango archivado (escritura tardía)
+        AuditoriaMatriz.objects.bulk_create([
+            AuditoriaMatriz(matriz=matriz, accion='UPDATE', descripcion='tardia',
+                            fecha_accion=inicio + datetime.timedelta(days=10)),
+            AuditoriaMatriz(matriz=matriz, accion='UPDATE', descripcion='reciente'),
+            AuditoriaMatriz(matriz=matriz, accion='CREATE', descripcion='reciente'),
+        ])
+
+    def test_paginas_en_orden_sin_cargar_todo(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        url = '/api/matriz/auditoria/?fecha_desde=2020-01-01&page_size=2'
+        descripciones = []
+        with mock.patch.object(archivo_auditoria, 'DIRECTORIO', self.directorio):
+            while url:
+                datos = cliente.get(url).json()
+                self.assertIsNone(datos['previous'])
+                self.assertLessEqual(len(datos['results']), 2)
+                descripciones += [registro['descripcion'] for registro in datos['results']]
+                url = datos['next']
+        self.assertEqual(
+            descripciones, ['reciente', 'reciente', 'a40', 'a20', 'a15', 'tardia', 'a5', 'a0']
+        )
 
-# Create your tests here.
+    def test_solo_abre_los_segmentos_de_la_pagina(self):
+        self.assertEqual(len(archivo_auditoria.cargar_manifiesto(self.directorio)['segmentos']), 2)
+        with mock.patch.object(archivo_auditoria.gzip, 'open', wraps=archivo_auditoria.gzip.open) as abrir:
+            filas = archivo_auditoria.leer_archivados_recientes(directorio=self.directorio)
+            self.assertEqual(next(filas)['descripcion'], 'a40')
+            self.assertEqual(abrir.call_count, 1)
+            self.assertEqual([fila['descripcion'] for fila in filas], ['a20', 'a15', 'a5', 'a0'])
+            self.assertEqual(abrir.call_count, 2)
@@ -4,13 +4,16 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 
+from .bootstrap import BootstrapView
+
 from .views import (
     MatrizRiesgoViewSet,
     RiesgoMatrizViewSet,
     ParametroMatrizViewSet,
     AuditoriaMatrizViewSet,
     ParametrosConfiguracionView,
-    EstadisticasEmpresaMatricesView
+    EstadisticasEmpresaMatricesView,
+    ConfiguracionZonasRiesgoView
 )
 
 # Router principal
@@ -42,6 +45,11 @@ urlpatterns = [
         'put': 'update_frontend'
     }), name='actualizar-matriz-frontend'),
     
+    # Obtener matriz con estructura del frontend (respuesta por fragmentos)
+    path('matrices/<str:pk>/frontend/', MatrizRiesgoViewSet.as_view({
+        'get': 'frontend'
+    }), name='obtener-matriz-frontend'),
+    
     # Mis matrices (filtradas por empresa)
     path('mis-matrices/', MatrizRiesgoViewSet.as_view({
         'get': 'mis_matrices'
@@ -63,6 +71,13 @@ urlpatterns = [
     path('parametros-configuracion/', ParametrosConfiguracionView.as_view(), 
          name='parametros-configuracion'),
     
+    # Catálogos iniciales del frontend en una sola respuesta cacheada
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
+    
+    # Umbrales de zona de riesgo de la empresa
+    path('zonas-riesgo/', ConfiguracionZonasRiesgoView.as_view(), 
+         name='zonas-riesgo'),
+    
     # Estadísticas generales de la empresa
     path('estadisticas-empresa/', EstadisticasEmpresaMatricesView.as_view(), 
          name='estadisticas-empresa-matrices'),
@@ -1,16 +1,43 @@
 # matriz/views.py
-from rest_framework import viewsets, status, filters
+import heapq
+from datetime import datetime, time, timedelta
+from functools import partial
+from types import SimpleNamespace
+
+from rest_framework import viewsets, status, filters, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Count, Q
+from django.db.models import Avg, Count, F, Q
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.permissions import AllowAny  # Agregar este import
 
+from API_C.campos import CamposDinamicosViewMixin
+from API_C.condicional import ConsultaCondicionalMixin
+from API_C.paginacion import PaginacionCursor
+
 
-from .models import MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz
+from .models import (
+    MatrizRiesgo, RiesgoMatriz, CausaRiesgo, ParametroMatriz, AuditoriaMatriz, ConfiguracionZonasRiesgo,
+    NIVELES_ZONA, campo_resumen_nivel, conteos_por_nivel, tabla_zonas_empresa, zona_por_nivel
+)
+from . import archivo_auditoria, auditoria
+from .busqueda import BusquedaTextoCompletoFilter
+from .cache import obtener_o_calcular
+from .clonacion import clonar_matriz
+from .estadisticas import mapa_calor
+from .exportacion import FORMATOS_EXPORTACION, GENERADORES_EXPORTACION
+from .importacion import FORMATOS_IMPORTACION, importar_riesgos
+from .riesgo_residual import resumen_residual, riesgos_residuales
+from .serializacion import matriz_frontend_json
 from .serializers import (
     MatrizRiesgoSerializer, 
     MatrizRiesgoListSerializer,
@@ -18,26 +45,34 @@ from .serializers import (
     RiesgoMatrizSerializer, 
     CausaRiesgoSerializer,
     ParametroMatrizSerializer,
-    AuditoriaMatrizSerializer
+    AuditoriaMatrizSerializer,
+    ConfiguracionZonasRiesgoSerializer
 )
 from .permissions import MatrizRiesgoPermission
 
-class MatrizRiesgoViewSet(viewsets.ModelViewSet):
+class MatrizRiesgoViewSet(ConsultaCondicionalMixin, CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar matrices de riesgo
     """
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Búsqueda de texto completo (después de OrderingFilter: sin ?ordering= ordena por relevancia)
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BusquedaTextoCompletoFilter]
     filterset_fields = ['responsable', 'fecha_creacion']
-    search_fields = ['nombre', 'descripcion', 'responsable']
     ordering_fields = ['fecha_creacion', 'fecha_modificacion', 'nombre']
     ordering = ['-fecha_modificacion']
+    pagination_class = PaginacionCursor
+    ordering_cursor = ['-fecha_modificacion', '-id']
+    campo_modificacion = 'fecha_modificacion'
     
     def get_queryset(self):
         """Filtrar matrices según el usuario"""
         user = self.request.user
         queryset = MatrizRiesgo.objects.select_related('creado_por', 'empresa')
         
+        if self.action in ['list', 'mis_matrices']:
+            # Total y conteo por nivel anotados en la misma consulta (sin N+1)
+            queryset = queryset.con_resumen_riesgos()
+        
         # Administradores ven todas las matrices
         if user.groups.filter(name='Administradores').exists():
             return queryset
@@ -52,7 +87,7 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
         """Usar diferentes serializers según la acción"""
         if self.action == 'list':
             return MatrizRiesgoListSerializer
-        elif self.action in ['create_frontend', 'update_frontend']:
+        elif self.action in ['create_frontend', 'update_frontend', 'frontend']:
             return MatrizRiesgoFrontendSerializer
         return MatrizRiesgoSerializer
     
@@ -64,41 +99,36 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
         
         matriz = serializer.save(creado_por=user, empresa=user.empresa)
         
-        # Registrar auditoría
-        AuditoriaMatriz.objects.create(
-            matriz=matriz,
-            usuario=user,
-            accion='CREATE',
-            descripcion=f'Matriz creada: {matriz.nombre}',
-            datos_nuevos=serializer.data
+        # Registrar auditoría (escritura diferida, solo los campos de la matriz)
+        auditoria.registrar(
+            matriz.pk, user, 'CREATE', f'Matriz creada: {matriz.nombre}',
+            datos_nuevos=auditoria.instantanea(matriz)
         )
     
     def perform_update(self, serializer):
-        """Registrar cambios en auditoría"""
-        datos_anteriores = MatrizRiesgoSerializer(self.get_object()).data
+        """Registrar en auditoría solo los campos que cambiaron"""
+        # serializer.instance ya viene de get_object(): no se vuelve a consultar
+        anteriores = auditoria.instantanea(serializer.instance)
         matriz = serializer.save()
         
-        AuditoriaMatriz.objects.create(
-            matriz=matriz,
-            usuario=self.request.user,
-            accion='UPDATE',
-            descripcion=f'Matriz actualizada: {matriz.nombre}',
-            datos_anteriores=datos_anteriores,
-            datos_nuevos=serializer.data
-        )
+        datos_anteriores, datos_nuevos = auditoria.diferencia(anteriores, auditoria.instantanea(matriz))
+        if datos_nuevos:
+            auditoria.registrar(
+                matriz.pk, self.request.user, 'UPDATE', f'Matriz actualizada: {matriz.nombre}',
+                datos_anteriores=datos_anteriores,
+                datos_nuevos=datos_nuevos
+            )
     
     def perform_destroy(self, instance):
-        """Registrar eliminación en auditoría"""
-        AuditoriaMatriz.objects.create(
-            matriz=instance,
-            usuario=self.request.user,
-            accion='DELETE',
-            descripcion=f'Matriz eliminada: {instance.nombre}',
-            datos_anteriores=MatrizRiesgoSerializer(instance).data
-        )
+        """
+        Eliminar la matriz. Su auditoría se borra en cascada, así que también se
+        descartan los registros que aún estén pendientes de escritura.
+        """
+        matriz_id = instance.pk
         instance.delete()
+        auditoria.descartar(matriz_id)
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], url_path='create-frontend')
     def create_frontend(self, request):
         """
         Endpoint especial para crear matrices desde el frontend
@@ -133,8 +163,12 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['put'])
     def update_frontend(self, request, pk=None):
         """
-        Endpoint especial para actualizar matrices desde el frontend
+        Endpoint especial para actualizar matrices desde el frontend.
+        Admite If-Match / If-Unmodified-Since como update (412 si la matriz cambió).
         """
+        return self._escritura_condicional(request, partial(self._actualizar_frontend, request))
+    
+    def _actualizar_frontend(self, request):
         matriz = self.get_object()
         serializer = MatrizRiesgoFrontendSerializer(
             matriz,
@@ -149,7 +183,8 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
                 return Response(
                     {
                         'message': 'Matriz actualizada exitosamente',
-                        'matriz': MatrizRiesgoSerializer(matriz, context={'request': request}).data
+                        'matriz': MatrizRiesgoSerializer(matriz, context={'request': request}).data,
+                        'cambios': getattr(serializer, 'resumen_sincronizacion', None)
                     },
                     status=status.HTTP_200_OK
                 )
@@ -163,6 +198,49 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
             {'errors': serializer.errors},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Clonar la matriz con todos sus riesgos y causas en el servidor (p. ej. para iniciar
+        un nuevo periodo). Opcionalmente recibe nombre, descripcion, responsable y
+        fecha_creacion de la copia.
+        """
+        origen = self.get_object()
+        serializer = MatrizRiesgoSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        matriz, riesgos, causas = clonar_matriz(origen, request.user, **serializer.validated_data)
+        auditoria.registrar(
+            matriz.pk, request.user, 'CREATE', f'Matriz clonada de {origen.pk}: {matriz.nombre}',
+            datos_nuevos=auditoria.instantanea(matriz)
+        )
+        return Response(
+            {
+                'message': 'Matriz clonada exitosamente',
+                'matriz': MatrizRiesgoSerializer(matriz, context={'request': request}).data,
+                'riesgos_copiados': riesgos,
+                'causas_copiadas': causas
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['get'])
+    def frontend(self, request, pk=None):
+        """
+        Obtener la matriz con la estructura del frontend.
+        El JSON se emite por fragmentos: memoria acotada y dos consultas para
+        riesgos y causas, sin importar el tamaño de la matriz.
+        """
+        matriz = self.get_object()
+        cabecera = MatrizRiesgoFrontendSerializer(
+            matriz,
+            context={'request': request, 'incluir_riesgos': False}
+        ).data
+        return StreamingHttpResponse(
+            matriz_frontend_json(cabecera, matriz.pk),
+            content_type='application/json'
+        )
     
     @action(detail=True, methods=['get'])
     def estadisticas(self, request, pk=None):
@@ -200,20 +278,170 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
             estadisticas['promedio_impacto'] = round(promedios['impacto__avg'] or 0, 2)
             estadisticas['efectividad_promedio_controles'] = round(promedios['efectividad_control__avg'] or 0, 2)
         
+        estadisticas['riesgo_residual'] = obtener_o_calcular(
+            'matriz', matriz.pk, 'residual',
+            lambda: resumen_residual(riesgos, tabla_zonas_empresa(matriz.empresa_id))
+        )
+        
         return Response(estadisticas)
     
+    @action(detail=True, methods=['get'])
+    def residual(self, request, pk=None):
+        """Riesgo inherente y residual (después de controles) de cada riesgo de la matriz"""
+        matriz = self.get_object()
+        riesgos = RiesgoMatriz.objects.filter(matriz_id=matriz.pk)
+        tabla = tabla_zonas_empresa(matriz.empresa_id)
+        return Response({
+            'resumen': obtener_o_calcular(
+                'matriz', matriz.pk, 'residual', lambda: resumen_residual(riesgos, tabla)
+            ),
+            'riesgos': obtener_o_calcular(
+                'matriz', matriz.pk, 'residual_riesgos', lambda: riesgos_residuales(riesgos, tabla)
+            ),
+        })
+    
+    def _empresa_solicitada(self, request):
+        """
+        Empresa sobre la que opera una acción de empresa: los administradores pueden
+        indicarla con ?empresa=; los demás usan la propia (None si no tienen).
+        """
+        user = request.user
+        empresa_id = request.query_params.get('empresa')
+        if empresa_id and user.groups.filter(name='Administradores').exists():
+            return empresa_id
+        if hasattr(user, 'empresa') and user.empresa:
+            return user.empresa_id
+        return None
+    
+    def _respuesta_exportacion(self, formato, matriz_ids, nombre):
+        """StreamingHttpResponse con la exportación en CSV o NDJSON"""
+        respuesta = StreamingHttpResponse(
+            GENERADORES_EXPORTACION[formato](matriz_ids),
+            content_type=FORMATOS_EXPORTACION[formato]
+        )
+        fecha = timezone.now().strftime('%Y%m%d')
+        respuesta['Content-Disposition'] = f'attachment; filename="{nombre}-{fecha}.{formato}"'
+        return respuesta
+    
     @action(detail=True, methods=['get'])
     def exportar(self, request, pk=None):
-        """Exportar matriz en formato JSON para respaldo"""
+        """
+        Exportar matriz. Con ?formato=csv o ?formato=ndjson se exportan los riesgos con
+        causas, zona y evaluación de controles por fragmentos; sin formato, el respaldo JSON.
+        """
         matriz = self.get_object()
-        serializer = MatrizRiesgoSerializer(matriz)
+        formato = request.query_params.get('formato', 'json')
+        
+        if formato in GENERADORES_EXPORTACION:
+            return self._respuesta_exportacion(formato, [matriz.pk], matriz.pk)
+        if formato != 'json':
+            return Response(
+                {'error': f'Formato no soportado: {formato}. Use csv, ndjson o json.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        serializer = MatrizRiesgoSerializer(matriz)
         return Response({
             'matriz': serializer.data,
             'fecha_exportacion': timezone.now(),
             'exportado_por': request.user.get_full_name()
         })
     
+    @action(detail=False, methods=['get'], url_path='exportar-empresa')
+    def exportar_empresa(self, request):
+        """Exportar todas las matrices de la empresa del usuario (?formato=csv|ndjson)"""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in GENERADORES_EXPORTACION:
+            return Response(
+                {'error': f'Formato no soportado: {formato}. Use csv o ndjson.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        empresa_id = self._empresa_solicitada(request)
+        if empresa_id is None:
+            return Response(
+                {'error': 'El usuario no tiene una empresa asignada.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        matriz_ids = MatrizRiesgo.objects.filter(empresa_id=empresa_id).values('pk')
+        return self._respuesta_exportacion(formato, matriz_ids, f'matrices-{empresa_id}')
+    
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    def importar(self, request, pk=None):
+        """
+        Importar riesgos desde un archivo CSV o NDJSON (campo 'archivo').
+        El formato se toma de ?formato= o de la extensión del archivo; con ?simular=true
+        solo se valida. Las filas con errores se omiten y se reportan por número de línea.
+        Si un lote falla, los anteriores quedan importados y el reporte trae 'interrumpido'.
+        """
+        matriz = self.get_object()
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response(
+                {'error': "Debe enviar el archivo en el campo 'archivo'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        formato = request.query_params.get('formato') or archivo.name.rsplit('.', 1)[-1].lower()
+        if formato not in FORMATOS_IMPORTACION:
+            return Response(
+                {'error': f'Formato no soportado: {formato}. Use csv o ndjson.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        simular = request.query_params.get('simular', '').lower() in ('1', 'true')
+        reporte = importar_riesgos(matriz, archivo, formato, simular=simular)
+        reporte['simulado'] = simular
+        
+        if reporte['interrumpido']:
+            # Los lotes anteriores al fallido quedaron confirmados (ver importacion.py)
+            codigo = status.HTTP_500_INTERNAL_SERVER_ERROR
+        elif reporte['riesgos_creados'] and not simular:
+            codigo = status.HTTP_201_CREATED
+        elif reporte['total_errores']:
+            codigo = status.HTTP_400_BAD_REQUEST
+        else:
+            codigo = status.HTTP_200_OK
+        return Response(reporte, status=codigo)
+    
+    @action(detail=True, methods=['get'])
+    def heatmap(self, request, pk=None):
+        """
+        Mapa de calor probabilidad × impacto de la matriz: conteo por celda
+        (y con ?ids=true, los ids de los riesgos de cada celda)
+        """
+        matriz = self.get_object()
+        incluir_ids = request.query_params.get('ids', '').lower() in ('1', 'true')
+        datos = obtener_o_calcular(
+            'matriz', matriz.pk, 'heatmap_ids' if incluir_ids else 'heatmap',
+            lambda: mapa_calor(
+                RiesgoMatriz.objects.filter(matriz_id=matriz.pk), incluir_ids,
+                tabla_zonas_empresa(matriz.empresa_id)
+            )
+        )
+        return Response(datos)
+    
+    @action(detail=False, methods=['get'], url_path='heatmap-empresa')
+    def heatmap_empresa(self, request):
+        """Mapa de calor probabilidad × impacto de todas las matrices de la empresa"""
+        empresa_id = self._empresa_solicitada(request)
+        if empresa_id is None:
+            return Response(
+                {'error': 'El usuario no tiene una empresa asignada.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        incluir_ids = request.query_params.get('ids', '').lower() in ('1', 'true')
+        datos = obtener_o_calcular(
+            'empresa', empresa_id, 'heatmap_ids' if incluir_ids else 'heatmap',
+            lambda: mapa_calor(
+                RiesgoMatriz.objects.filter(matriz__empresa_id=empresa_id), incluir_ids,
+                tabla_zonas_empresa(empresa_id)
+            )
+        )
+        return Response(datos)
+    
     @action(detail=False, methods=['get'])
     def mis_matrices(self, request):
         """Obtener matrices del usuario actual"""
@@ -233,34 +461,45 @@ class MatrizRiesgoViewSet(viewsets.ModelViewSet):
                 Q(responsable__icontains=search)
             )
         
-        # Aplicar filtro de nivel de riesgo
+        # Aplicar filtro de nivel de riesgo sobre los conteos anotados
         filter_risk_level = request.query_params.get('filterRiskLevel', '')
         if filter_risk_level:
-            # Filtrar matrices que contengan riesgos del nivel especificado
-            matrices_con_nivel = []
-            for matriz in queryset:
-                if any(r.calcular_zona_riesgo()['nivel'] == filter_risk_level.replace('_', ' ') 
-                       for r in matriz.riesgos.all()):
-                    matrices_con_nivel.append(matriz.id)
-            queryset = queryset.filter(id__in=matrices_con_nivel)
-        
-        serializer = MatrizRiesgoListSerializer(queryset, many=True)
+            niveles = [nivel.replace(' ', '_') for nivel in NIVELES_ZONA]
+            if filter_risk_level.replace(' ', '_') in niveles:
+                campo = campo_resumen_nivel(filter_risk_level)
+                queryset = queryset.filter(**{f'{campo}__gt': 0})
+            else:
+                queryset = queryset.none()
+        
+        return self.responder_condicional(
+            self.validadores_listado(queryset), lambda: self._respuesta_mis_matrices(queryset)
+        )
+
+    def _respuesta_mis_matrices(self, queryset):
+        # Paginado por cursor (?cursor=) o por páginas (?page=); 'total' cuenta todas las matrices
+        user = self.request.user
+        pagina = self.paginate_queryset(queryset)
+        serializer = MatrizRiesgoListSerializer(pagina, many=True)
+        datos = self.paginator.get_paginated_data(serializer.data)
         return Response({
-            'matrices': serializer.data,
-            'total': queryset.count(),
+            'matrices': datos.pop('results'),
+            'total': self.paginator.contar(queryset, self.request),
+            **datos,
             'empresa': user.empresa.nombre if hasattr(user, 'empresa') and user.empresa else None
         })
 
 
-class RiesgoMatrizViewSet(viewsets.ModelViewSet):
+class RiesgoMatrizViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar riesgos individuales
     """
     serializer_class = RiesgoMatrizSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, BusquedaTextoCompletoFilter]
     filterset_fields = ['matriz', 'tipo_riesgo', 'probabilidad', 'impacto', 'aceptado']
-    search_fields = ['nombre', 'descripcion', 'codigo']
+    pagination_class = PaginacionCursor
+    # (matriz, numero) es único: el índice de unique_together sirve al cursor
+    ordering_cursor = ['matriz_id', 'numero']
     
     def get_queryset(self):
         """Filtrar riesgos según la empresa del usuario"""
@@ -282,7 +521,7 @@ class RiesgoMatrizViewSet(viewsets.ModelViewSet):
         return context
 
 
-class ParametroMatrizViewSet(viewsets.ReadOnlyModelViewSet):
+class ParametroMatrizViewSet(CamposDinamicosViewMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para obtener parámetros del sistema (solo lectura)
     """
@@ -293,6 +532,44 @@ class ParametroMatrizViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['tipo']
 
 
+# Parámetros fijos de configuración de las matrices (también se sirven en el bootstrap)
+PARAMETROS_CONFIGURACION = {
+    'probabilidad': [
+        {'value': 1, 'label': 'Raro', 'description': 'Muy improbable que ocurra'},
+        {'value': 2, 'label': 'Improbable', 'description': 'Poco probable que ocurra'},
+        {'value': 3, 'label': 'Posible', 'description': 'Podría ocurrir'},
+        {'value': 4, 'label': 'Probable', 'description': 'Probablemente ocurrirá'},
+        {'value': 5, 'label': 'Casi Seguro', 'description': 'Casi seguro que ocurrirá'}
+    ],
+    'impacto': [
+        {'value': 1, 'label': 'Insignificante', 'description': 'No hay interrupción en las operaciones'},
+        {'value': 2, 'label': 'Menor', 'description': 'Interrupción por algunas horas'},
+        {'value': 3, 'label': 'Moderado', 'description': 'Interrupción por un día'},
+        {'value': 4, 'label': 'Mayor', 'description': 'Interrupción por más de dos días'},
+        {'value': 5, 'label': 'Catastrófico', 'description': 'Interrupción por más de cinco días'}
+    ],
+    'tipos_riesgo': [
+        {'value': 'Operativo', 'label': 'Operativo'},
+        {'value': 'Estratégico', 'label': 'Estratégico'},
+        {'value': 'Financiero', 'label': 'Financiero'},
+        {'value': 'Cumplimiento', 'label': 'Cumplimiento'},
+        {'value': 'Tecnológico', 'label': 'Tecnológico'}
+    ],
+    'tipos_control': [
+        {'value': 'Preventivo', 'label': 'Preventivo'},
+        {'value': 'Correctivo', 'label': 'Correctivo'},
+        {'value': 'Detectivo', 'label': 'Detectivo'}
+    ],
+    'factores_causa': [
+        {'value': 'Información', 'label': 'Información'},
+        {'value': 'Método', 'label': 'Método'},
+        {'value': 'Personas', 'label': 'Personas'},
+        {'value': 'Sistemas de información', 'label': 'Sistemas de información'},
+        {'value': 'Infraestructura', 'label': 'Infraestructura'}
+    ]
+}
+
+
 class ParametrosConfiguracionView(APIView):
     """
     Vista para obtener todos los parámetros de configuración del sistema
@@ -301,43 +578,63 @@ class ParametrosConfiguracionView(APIView):
     
     def get(self, request):
         """Obtener parámetros hardcodeados"""
-        parametros = {
-            'probabilidad': [
-                {'value': 1, 'label': 'Raro', 'description': 'Muy improbable que ocurra'},
-                {'value': 2, 'label': 'Improbable', 'description': 'Poco probable que ocurra'},
-                {'value': 3, 'label': 'Posible', 'description': 'Podría ocurrir'},
-                {'value': 4, 'label': 'Probable', 'description': 'Probablemente ocurrirá'},
-                {'value': 5, 'label': 'Casi Seguro', 'description': 'Casi seguro que ocurrirá'}
-            ],
-            'impacto': [
-                {'value': 1, 'label': 'Insignificante', 'description': 'No hay interrupción en las operaciones'},
-                {'value': 2, 'label': 'Menor', 'description': 'Interrupción por algunas horas'},
-                {'value': 3, 'label': 'Moderado', 'description': 'Interrupción por un día'},
-                {'value': 4, 'label': 'Mayor', 'description': 'Interrupción por más de dos días'},
-                {'value': 5, 'label': 'Catastrófico', 'description': 'Interrupción por más de cinco días'}
-            ],
-            'tipos_riesgo': [
-                {'value': 'Operativo', 'label': 'Operativo'},
-                {'value': 'Estratégico', 'label': 'Estratégico'},
-                {'value': 'Financiero', 'label': 'Financiero'},
-                {'value': 'Cumplimiento', 'label': 'Cumplimiento'},
-                {'value': 'Tecnológico', 'label': 'Tecnológico'}
-            ],
-            'tipos_control': [
-                {'value': 'Preventivo', 'label': 'Preventivo'},
-                {'value': 'Correctivo', 'label': 'Correctivo'},
-                {'value': 'Detectivo', 'label': 'Detectivo'}
-            ],
-            'factores_causa': [
-                {'value': 'Información', 'label': 'Información'},
-                {'value': 'Método', 'label': 'Método'},
-                {'value': 'Personas', 'label': 'Personas'},
-                {'value': 'Sistemas de información', 'label': 'Sistemas de información'},
-                {'value': 'Infraestructura', 'label': 'Infraestructura'}
-            ]
+        return Response(PARAMETROS_CONFIGURACION)
+
+class ConfiguracionZonasRiesgoView(APIView):
+    """
+    Umbrales de zona de riesgo de la empresa del usuario (o de ?empresa= para administradores).
+    Al modificarlos, los riesgos de la empresa se reclasifican en bloque.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def _empresa_id(self, request):
+        empresa_id = request.query_params.get('empresa')
+        if empresa_id and request.user.groups.filter(name='Administradores').exists():
+            return empresa_id
+        if hasattr(request.user, 'empresa') and request.user.empresa:
+            return request.user.empresa_id
+        return None
+    
+    def _respuesta(self, empresa_id, configuracion):
+        tabla = tabla_zonas_empresa(empresa_id)
+        datos = ConfiguracionZonasRiesgoSerializer(configuracion).data if configuracion else {
+            'minimo_extrema': tabla.umbrales['EXTREMA'],
+            'minimo_alta': tabla.umbrales['ALTA'],
+            'minimo_moderada': tabla.umbrales['MODERADA'],
+            'minimo_baja': tabla.umbrales['BAJA'],
+            'fecha_modificacion': None,
         }
-        
-        return Response(parametros)
+        datos['personalizada'] = configuracion is not None
+        datos['celdas'] = [
+            tabla.zona(probabilidad, impacto)
+            for (probabilidad, impacto) in sorted(tabla.celdas)
+        ]
+        return Response(datos)
+    
+    def get(self, request):
+        empresa_id = self._empresa_id(request)
+        if empresa_id is None:
+            return Response({'error': 'Usuario sin empresa asignada'}, status=status.HTTP_400_BAD_REQUEST)
+        configuracion = ConfiguracionZonasRiesgo.objects.filter(empresa_id=empresa_id).first()
+        return self._respuesta(empresa_id, configuracion)
+    
+    def put(self, request):
+        if not request.user.groups.filter(name='Administradores').exists():
+            return Response(
+                {'error': 'Solo los administradores pueden modificar los umbrales.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        empresa_id = self._empresa_id(request)
+        if empresa_id is None:
+            return Response({'error': 'Usuario sin empresa asignada'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        configuracion = ConfiguracionZonasRiesgo.objects.filter(empresa_id=empresa_id).first()
+        serializer = ConfiguracionZonasRiesgoSerializer(configuracion, data=request.data, partial=configuracion is not None)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            configuracion = serializer.save(empresa_id=empresa_id)
+        return self._respuesta(empresa_id, configuracion)
+
 
 class EstadisticasEmpresaMatricesView(APIView):
     """
@@ -345,6 +642,9 @@ class EstadisticasEmpresaMatricesView(APIView):
     """
     permission_classes = [AllowAny]
     
+    # Número de riesgos críticos (zonas EXTREMA y ALTA) incluidos en la respuesta
+    LIMITE_RIESGOS_CRITICOS = 10
+    
     def get(self, request):
         """Estadísticas generales de matrices de riesgo de la empresa"""
         user = request.user
@@ -355,14 +655,33 @@ class EstadisticasEmpresaMatricesView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        matrices = MatrizRiesgo.objects.filter(empresa=user.empresa)
-        riesgos = RiesgoMatriz.objects.filter(matriz__empresa=user.empresa)
+        empresa_id = user.empresa.pk
+        estadisticas = obtener_o_calcular(
+            'empresa', empresa_id, 'estadisticas',
+            lambda: self.calcular_estadisticas(empresa_id)
+        )
+        return Response(estadisticas)
+    
+    def calcular_estadisticas(self, empresa_id):
+        """Calcula el tablero con agregados agrupados; el costo no depende del número de riesgos"""
+        matrices = MatrizRiesgo.objects.filter(empresa_id=empresa_id)
+        riesgos = RiesgoMatriz.objects.filter(matriz__empresa_id=empresa_id)
+        
+        # Totales, niveles, aceptados y efectividad en una sola consulta
+        agregados = riesgos.aggregate(
+            total=Count('id'),
+            aceptados=Count('id', filter=Q(aceptado=True)),
+            efectividad_promedio=Avg('efectividad_control'),
+            **conteos_por_nivel()
+        )
+        total_riesgos = agregados['total']
         
         estadisticas = {
             'total_matrices': matrices.count(),
-            'total_riesgos': riesgos.count(),
+            'total_riesgos': total_riesgos,
             'riesgos_por_nivel': {
-                'EXTREMA': 0, 'ALTA': 0, 'MODERADA': 0, 'BAJA': 0, 'MUY_BAJA': 0
+                nivel.replace(' ', '_'): agregados[campo_resumen_nivel(nivel)]
+                for nivel in NIVELES_ZONA
             },
             'riesgos_por_tipo': {},
             'matrices_recientes': [],
@@ -371,81 +690,176 @@ class EstadisticasEmpresaMatricesView(APIView):
             'porcentaje_riesgos_aceptados': 0
         }
         
-        # Calcular riesgos por nivel
-        for riesgo in riesgos:
-            zona = riesgo.calcular_zona_riesgo()
-            nivel_key = zona['nivel'].replace(' ', '_')
-            if nivel_key in estadisticas['riesgos_por_nivel']:
-                estadisticas['riesgos_por_nivel'][nivel_key] += 1
-        
-        # Riesgos por tipo
+        # Riesgos por tipo (GROUP BY tipo_riesgo)
+        por_tipo = dict(
+            riesgos.order_by().values_list('tipo_riesgo').annotate(total=Count('id'))
+        )
         for tipo, _ in RiesgoMatriz.TIPOS_RIESGO:
-            count = riesgos.filter(tipo_riesgo=tipo).count()
-            if count > 0:
-                estadisticas['riesgos_por_tipo'][tipo] = count
+            if por_tipo.get(tipo):
+                estadisticas['riesgos_por_tipo'][tipo] = por_tipo[tipo]
         
-        # Matrices recientes (últimas 5)
-        matrices_recientes = matrices.order_by('-fecha_modificacion')[:5]
+        # Matrices recientes (últimas 5); el total sale del contador desnormalizado
         estadisticas['matrices_recientes'] = [
             {
-                'id': m.id,
-                'nombre': m.nombre,
-                'fecha_modificacion': m.fecha_modificacion,
-                'total_riesgos': m.total_riesgos,
-                'responsable': m.responsable
+                'id': m['id'],
+                'nombre': m['nombre'],
+                'fecha_modificacion': m['fecha_modificacion'],
+                'total_riesgos': m['conteo_riesgos'],
+                'responsable': m['responsable']
             }
-            for m in matrices_recientes
+            for m in matrices.order_by('-fecha_modificacion').values(
+                'id', 'nombre', 'fecha_modificacion', 'conteo_riesgos', 'responsable'
+            )[:5]
         ]
         
-        # Riesgos críticos (nivel EXTREMA y ALTA)
-        riesgos_criticos = [
-            r for r in riesgos 
-            if r.calcular_zona_riesgo()['nivel'] in ['EXTREMA', 'ALTA']
-        ][:10]
+        # Riesgos críticos (nivel EXTREMA y ALTA): ordenados y limitados en SQL
+        riesgos_criticos = riesgos.filter(
+            nivel_zona__in=['EXTREMA', 'ALTA']
+        ).annotate(
+            valor=F('probabilidad') * F('impacto')
+        ).order_by('-valor', 'matriz_id', 'numero').values(
+            'id', 'nombre', 'matriz__nombre', 'valor', 'nivel_zona', 'aceptado'
+        )[:self.LIMITE_RIESGOS_CRITICOS]
         
         estadisticas['riesgos_criticos'] = [
             {
-                'id': r.id,
-                'nombre': r.nombre,
-                'matriz': r.matriz.nombre,
-                'zona_riesgo': r.calcular_zona_riesgo(),
-                'aceptado': r.aceptado
+                'id': r['id'],
+                'nombre': r['nombre'],
+                'matriz': r['matriz__nombre'],
+                'zona_riesgo': zona_por_nivel(r['nivel_zona'], r['valor']),
+                'aceptado': r['aceptado']
             }
             for r in riesgos_criticos
         ]
         
+        # Riesgo residual de todas las matrices (una consulta values_list, cálculo por columnas)
+        estadisticas['riesgo_residual'] = resumen_residual(riesgos, tabla_zonas_empresa(empresa_id))
+        
         # Calcular promedios
-        if riesgos.exists():
-            from django.db.models import Avg
-            efectividad_avg = riesgos.aggregate(Avg('efectividad_control'))['efectividad_control__avg']
-            estadisticas['efectividad_promedio_controles'] = round(efectividad_avg or 0, 2)
-            
-            riesgos_aceptados = riesgos.filter(aceptado=True).count()
+        if total_riesgos:
+            estadisticas['efectividad_promedio_controles'] = round(agregados['efectividad_promedio'] or 0, 2)
             estadisticas['porcentaje_riesgos_aceptados'] = round(
-                (riesgos_aceptados / riesgos.count()) * 100, 2
+                (agregados['aceptados'] / total_riesgos) * 100, 2
             )
         
-        return Response(estadisticas)
+        return estadisticas
 
 
-class AuditoriaMatrizViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditoriaMatrizViewSet(CamposDinamicosViewMixin, viewsets.ReadOnlyModelViewSet):
     """
-    ViewSet para consultar auditoría de matrices (solo lectura)
+    ViewSet para consultar auditoría de matrices (solo lectura).
+    Con ?fecha_desde=/?fecha_hasta= que alcancen el archivo en frío, el listado
+    incluye también los registros archivados (ver archivo_auditoria.py), siempre por
+    -fecha_accion y con un cursor que solo avanza (previous es null y no hay count).
     """
     serializer_class = AuditoriaMatrizSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['matriz', 'usuario', 'accion']
     ordering = ['-fecha_accion']
+    # Con el archivo en frío el cursor solo avanza (ver list())
+    pagination_class = PaginacionCursor
+    ordering_cursor = ['-fecha_accion', '-id']
+    
+    def _es_administrador(self):
+        return self.request.user.groups.filter(name='Administradores').exists()
+    
+    def _rango_fechas(self):
+        """Rango [desde, hasta) pedido; una fecha sin hora en fecha_hasta incluye todo ese día"""
+        rango = []
+        for parametro in ['fecha_desde', 'fecha_hasta']:
+            valor = self.request.query_params.get(parametro)
+            fecha = None
+            if valor:
+                fecha = parse_datetime(valor)
+                if fecha is None:
+                    dia = parse_date(valor)
+                    if dia is None:
+                        raise serializers.ValidationError({parametro: 'Fecha inválida.'})
+                    fecha = datetime.combine(dia, time.min)
+                    if parametro == 'fecha_hasta':
+                        fecha += timedelta(days=1)
+            rango.append(fecha)
+        return rango
     
     def get_queryset(self):
-        """Filtrar auditoría según permisos del usuario"""
+        """Filtrar auditoría según permisos del usuario y rango de fechas"""
         user = self.request.user
+        queryset = AuditoriaMatriz.objects.select_related('matriz', 'usuario')
         
-        if user.groups.filter(name='Administradores').exists():
-            return AuditoriaMatriz.objects.all()
+        desde, hasta = self._rango_fechas()
+        if desde:
+            queryset = queryset.filter(fecha_accion__gte=desde)
+        if hasta:
+            queryset = queryset.filter(fecha_accion__lt=hasta)
+        
+        if self._es_administrador():
+            return queryset
         
         if hasattr(user, 'empresa') and user.empresa:
-            return AuditoriaMatriz.objects.filter(matriz__empresa=user.empresa)
+            return queryset.filter(matriz__empresa=user.empresa)
         
-        return AuditoriaMatriz.objects.none()
\ No newline at end of file
+        return queryset.none()
+    
+    def list(self, request, *args, **kwargs):
+        desde, hasta = self._rango_fechas()
+        limite = archivo_auditoria.limite_archivo()
+        if limite is None or desde is None or desde > limite:
+            return super().list(request, *args, **kwargs)
+        
+        # El rango alcanza el archivo: se combinan filas vivas y archivadas
+        if self._es_administrador():
+            empresa_id = None
+        elif hasattr(request.user, 'empresa') and request.user.empresa:
+            empresa_id = request.user.empresa_id
+        else:
+            return super().list(request, *args, **kwargs)
+        
+        # Ambas fuentes en el orden del cursor, cada una acotada por la posición pedida: la
+        # consulta viva trae a lo sumo una página y del archivo solo se abren los segmentos
+        # necesarios para completarla
+        paginador = self.paginator
+        queryset = self.filter_queryset(self.get_queryset()).order_by('-fecha_accion', '-id')
+        posicion = paginador.posicion_flujo(request, self, queryset)
+        antes_de = None
+        if posicion is not None:
+            try:
+                queryset = queryset.filter(paginador._despues_de(posicion, False))
+                antes_de = (datetime.fromisoformat(posicion[0]), int(posicion[1]))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(paginador.invalid_cursor_message)
+        filtros = {
+            campo: request.query_params[campo]
+            for campo in self.filterset_fields if request.query_params.get(campo)
+        }
+        archivados = (
+            SimpleNamespace(fecha_accion=fecha, id=id_registro, fila=fila)
+            for fila in archivo_auditoria.leer_archivados_recientes(desde, hasta, empresa_id, filtros, antes_de)
+            for fecha, id_registro in [archivo_auditoria.clave_orden(fila)]
+        )
+        mezcla = heapq.merge(
+            queryset[:paginador.page_size + 1], archivados,
+            key=lambda registro: (registro.fecha_accion, registro.id), reverse=True
+        )
+        pagina = paginador.paginar_flujo(self._sin_duplicados(mezcla))
+        
+        # ?fields= puede omitir id y fecha_accion: se serializa después de ordenar
+        instancias = [registro for registro in pagina if isinstance(registro, AuditoriaMatriz)]
+        serializer = self.get_serializer(instancias, many=True)
+        serializados = dict(zip((instancia.id for instancia in instancias), serializer.data))
+        campos = [campo for campo in archivo_auditoria.CAMPOS_ARCHIVADOS if campo in serializer.child.fields]
+        registros = [
+            serializados[registro.id] if isinstance(registro, AuditoriaMatriz)
+            else {campo: registro.fila[campo] for campo in campos}
+            for registro in pagina
+        ]
+        return paginador.get_paginated_response(registros)
+    
+    @staticmethod
+    def _sin_duplicados(registros):
+        """Un registro aún vivo que ya se archivó sale una vez (la versión viva va primero)"""
+        anterior = None
+        for registro in registros:
+            if anterior is None or registro.id != anterior.id:
+                yield registro
+            anterior = registro
@@ -1,6 +1,95 @@
-from django.contrib import admin
-from .models import Norma, Caracteristica, SubCaracteristica
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .importacion import FORMATOS_IMPORTACION, importar_normas, leer_definicion
+from .models import Norma, Caracteristica, SubCaracteristica, VersionNorma
+
+
+class ImportarNormaForm(forms.Form):
+    archivo = forms.FileField(help_text="Definición de la norma en YAML (.yaml, .yml) o JSON (.json)")
+    actualizar = forms.BooleanField(
+        required=False,
+        help_text="Actualizar las normas que ya existen con el mismo nombre y versión"
+    )
+    simular = forms.BooleanField(required=False, help_text="Solo validar, sin escribir")
+
+
+@admin.register(Norma)
+class NormaAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'version', 'estado', 'fecha_actualizacion']
+    list_filter = ['estado']
+    search_fields = ['nombre']
+    change_list_template = 'admin/normas/norma/change_list.html'
+
+    def get_urls(self):
+        return [
+            path(
+                'importar/',
+                self.admin_site.admin_view(self.importar_view),
+                name='normas_norma_importar'
+            ),
+        ] + super().get_urls()
+
+    def importar_view(self, request):
+        """Carga de normas completas desde YAML o JSON (ver normas/importacion.py)"""
+        if not self.has_add_permission(request):
+            return redirect('admin:normas_norma_changelist')
+
+        form = ImportarNormaForm(request.POST or None, request.FILES or None)
+        reporte = None
+        if request.method == 'POST' and form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            extension = archivo.name.rsplit('.', 1)[-1].lower()
+            formato = 'json' if extension == 'json' else 'yaml'
+            try:
+                definiciones = leer_definicion(archivo, formato)
+            except ValueError as e:
+                form.add_error('archivo', str(e))
+            else:
+                reporte = importar_normas(
+                    definiciones,
+                    actualizar=form.cleaned_data['actualizar'],
+                    simular=form.cleaned_data['simular'],
+                    usuario=request.user
+                )
+                if reporte['total_errores']:
+                    messages.error(request, 'El archivo tiene errores; no se importó nada.')
+                elif form.cleaned_data['simular']:
+                    messages.info(request, f"Archivo válido: {reporte['normas_validas']} normas.")
+                else:
+                    messages.success(
+                        request,
+                        f"Normas creadas: {reporte['normas_creadas']}, actualizadas: {reporte['normas_actualizadas']}."
+                    )
+                    return redirect('admin:normas_norma_changelist')
+
+        contexto = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar normas',
+            'form': form,
+            'reporte': reporte,
+            'formatos': FORMATOS_IMPORTACION,
+        }
+        return TemplateResponse(request, 'admin/normas/norma/importar.html', contexto)
+
 
-admin.site.register(Norma)
 admin.site.register(Caracteristica)
 admin.site.register(SubCaracteristica)
+
+
+@admin.register(VersionNorma)
+class VersionNormaAdmin(admin.ModelAdmin):
+    """Versiones congeladas: solo lectura"""
+    list_display = ['norma', 'numero', 'hash_contenido', 'fecha_creacion', 'creado_por']
+    list_filter = ['norma']
+    readonly_fields = ['norma', 'numero', 'contenido', 'hash_contenido', 'fecha_creacion', 'creado_por']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class NormasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'normas'
+
+    def ready(self):
+        from .models import Caracteristica, SubCaracteristica
+        from .signals import editar_estructura_norma
+        for modelo in (Caracteristica, SubCaracteristica):
+            post_save.connect(editar_estructura_norma, sender=modelo)
+            post_delete.connect(editar_estructura_norma, sender=modelo)
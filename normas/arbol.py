@@ -0,0 +1,122 @@
+# normas/arbol.py
+"""
+Árbol norma -> características -> subcaracterísticas para plantillas y evaluaciones.
+
+Si la norma trae el prefetch de prefetch_arbol() el árbol se arma sin consultas, en una
+sola pasada sobre las filas ya cargadas (filtrar u ordenar sobre el related manager
+descartaría el prefetch). Sin prefetch se hacen dos consultas values(): características
+y subcaracterísticas de todas las normas pedidas.
+"""
+from collections import defaultdict
+
+from django.db.models import Prefetch
+
+from .models import Caracteristica, SubCaracteristica
+
+# Campos de cada nivel en la plantilla de evaluación y en la estructura para evaluar
+CAMPOS_PLANTILLA = (
+    ['id', 'nombre', 'descripcion', 'porcentaje_peso'],
+    ['id', 'nombre', 'descripcion', 'criterios_evaluacion'],
+)
+CAMPOS_EVALUACION = (
+    ['id', 'nombre', 'descripcion', 'orden'],
+    ['id', 'nombre', 'descripcion', 'criterios_evaluacion', 'orden'],
+)
+# Versiones congeladas (VersionNorma): todo lo necesario para evaluar y para las plantillas
+CAMPOS_VERSION = (
+    ['id', 'nombre', 'descripcion', 'porcentaje_peso', 'orden', 'es_obligatoria'],
+    ['id', 'nombre', 'descripcion', 'criterios_evaluacion', 'orden', 'es_obligatoria'],
+)
+
+
+def _orden(fila):
+    # Mismo orden que Meta.ordering de ambos modelos
+    return fila['orden'], fila['nombre']
+
+
+def prefetch_arbol(solo_obligatorias=False):
+    """Prefetch de características y subcaracterísticas (ordenadas) que consume arboles_normas()"""
+    caracteristicas = Caracteristica.objects.order_by('orden', 'nombre')
+    subcaracteristicas = SubCaracteristica.objects.order_by('orden', 'nombre')
+    if solo_obligatorias:
+        caracteristicas = caracteristicas.filter(es_obligatoria=True)
+        subcaracteristicas = subcaracteristicas.filter(es_obligatoria=True)
+    return Prefetch(
+        'caracteristicas',
+        queryset=caracteristicas.prefetch_related(Prefetch('subcaracteristicas', queryset=subcaracteristicas))
+    )
+
+
+def _filas_prefetch(norma, solo_obligatorias):
+    """(características, subcaracterísticas) como diccionarios desde el prefetch de la norma"""
+    caracteristicas, subcaracteristicas = [], []
+    for caracteristica in norma.caracteristicas.all():
+        if solo_obligatorias and not caracteristica.es_obligatoria:
+            continue
+        caracteristicas.append(caracteristica.__dict__)
+        subcaracteristicas.extend(
+            subcaracteristica.__dict__
+            for subcaracteristica in caracteristica.subcaracteristicas.all()
+            if not solo_obligatorias or subcaracteristica.es_obligatoria
+        )
+    return caracteristicas, subcaracteristicas
+
+
+def _filas_consulta(norma_ids, campos_caracteristica, campos_subcaracteristica, solo_obligatorias):
+    """(características, subcaracterísticas) de varias normas con dos consultas values()"""
+    filtro = {'es_obligatoria': True} if solo_obligatorias else {}
+    caracteristicas = list(
+        Caracteristica.objects.filter(norma_id__in=norma_ids, **filtro)
+        .order_by().values('norma_id', 'orden', 'nombre', *campos_caracteristica)
+    )
+    subcaracteristicas = list(
+        SubCaracteristica.objects.filter(caracteristica__norma_id__in=norma_ids, **filtro)
+        .order_by().values('caracteristica_id', 'orden', 'nombre', *campos_subcaracteristica)
+    )
+    if solo_obligatorias:
+        # Las subcaracterísticas de una característica opcional no forman parte del árbol
+        ids = {caracteristica['id'] for caracteristica in caracteristicas}
+        subcaracteristicas = [sub for sub in subcaracteristicas if sub['caracteristica_id'] in ids]
+    return caracteristicas, subcaracteristicas
+
+
+def _armar(caracteristicas, subcaracteristicas, campos_caracteristica, campos_subcaracteristica):
+    """{norma_id: [característica con 'subcaracteristicas']} en una pasada por nivel"""
+    por_caracteristica = defaultdict(list)
+    for sub in sorted(subcaracteristicas, key=_orden):
+        por_caracteristica[sub['caracteristica_id']].append(
+            {campo: sub[campo] for campo in campos_subcaracteristica}
+        )
+    arboles = defaultdict(list)
+    for caracteristica in sorted(caracteristicas, key=_orden):
+        nodo = {campo: caracteristica[campo] for campo in campos_caracteristica}
+        nodo['subcaracteristicas'] = por_caracteristica.get(caracteristica['id'], [])
+        arboles[caracteristica['norma_id']].append(nodo)
+    return arboles
+
+
+def arboles_normas(normas, campos=CAMPOS_EVALUACION, solo_obligatorias=False):
+    """
+    {norma_id: [características con sus subcaracterísticas]} de las normas indicadas.
+    Usa el prefetch de las que lo traen; las demás se resuelven con dos consultas en total.
+    `campos` = (campos de característica, campos de subcaracterística).
+    """
+    campos_caracteristica, campos_subcaracteristica = campos
+    caracteristicas, subcaracteristicas, sin_prefetch = [], [], []
+    for norma in normas:
+        if 'caracteristicas' in getattr(norma, '_prefetched_objects_cache', {}):
+            filas = _filas_prefetch(norma, solo_obligatorias)
+            caracteristicas.extend(filas[0])
+            subcaracteristicas.extend(filas[1])
+        else:
+            sin_prefetch.append(norma.pk)
+    if sin_prefetch:
+        filas = _filas_consulta(sin_prefetch, campos_caracteristica, campos_subcaracteristica, solo_obligatorias)
+        caracteristicas.extend(filas[0])
+        subcaracteristicas.extend(filas[1])
+    return _armar(caracteristicas, subcaracteristicas, campos_caracteristica, campos_subcaracteristica)
+
+
+def arbol_norma(norma, campos=CAMPOS_EVALUACION, solo_obligatorias=False):
+    """Características con sus subcaracterísticas de una norma (ver arboles_normas)"""
+    return arboles_normas([norma], campos, solo_obligatorias).get(norma.pk, [])
@@ -0,0 +1,349 @@
+# normas/importacion.py
+"""
+Importación de normas completas (características, pesos, subcaracterísticas y criterios)
+desde YAML o JSON.
+
+Todo el archivo se valida en memoria antes de escribir: reglas de los campos del modelo,
+pesos que suman 100 % y nombres únicos según los unique_together. Después cada norma se
+inserta con bulk_create por nivel, todo en una transacción. Con actualizar=True la
+importación es un upsert idempotente: la norma se empareja por (nombre, versión), las
+características por nombre y las subcaracterísticas por nombre dentro de su característica;
+solo se escriben las filas que cambiaron y nada se elimina, por eso los pesos se validan
+sobre el árbol resultante (las características que no vienen en el archivo se conservan).
+Si el contenido de una norma aprobada cambia, pasa a borrador como al editarla; si el
+archivo la declara aprobada se aprueba de nuevo y se congela una versión nueva.
+
+Formato (un objeto norma, una lista de normas o {'normas': [...]}):
+
+    nombre: ISO/IEC 25010
+    version: "2011"
+    descripcion: Modelo de calidad del producto
+    estado: aprobada            # opcional
+    caracteristicas:
+      - nombre: Adecuación funcional
+        descripcion: ...
+        porcentaje_peso: 12.5
+        subcaracteristicas:
+          - nombre: Completitud funcional
+            descripcion: ...
+            criterios_evaluacion: ...
+"""
+import json
+from decimal import Decimal
+
+import yaml
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Caracteristica, Norma, SubCaracteristica
+
+FORMATOS_IMPORTACION = ['yaml', 'json']
+
+# Clave del archivo -> (campo del modelo, valor por defecto); None = obligatorio
+CAMPOS_NORMA = {
+    'nombre': ('nombre', None),
+    'descripcion': ('descripcion', None),
+    'version': ('version', None),
+}
+CAMPOS_CARACTERISTICA = {
+    'nombre': ('nombre', None),
+    'descripcion': ('descripcion', None),
+    'porcentaje_peso': ('porcentaje_peso', None),
+    'es_obligatoria': ('es_obligatoria', True),
+}
+CAMPOS_SUBCARACTERISTICA = {
+    'nombre': ('nombre', None),
+    'descripcion': ('descripcion', None),
+    'criterios_evaluacion': ('criterios_evaluacion', ''),
+    'es_obligatoria': ('es_obligatoria', True),
+}
+
+TOLERANCIA_PESOS = Decimal('0.01')
+
+
+def leer_definicion(archivo, formato):
+    """
+    Lee el archivo (binario o texto) y retorna la lista de definiciones de normas.
+    Lanza ValueError si el archivo no se puede interpretar.
+    """
+    contenido = archivo.read()
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode('utf-8-sig')
+    try:
+        datos = json.loads(contenido) if formato == 'json' else yaml.safe_load(contenido)
+    except (ValueError, yaml.YAMLError) as e:
+        raise ValueError(f'El archivo no es {formato.upper()} válido: {e}')
+    if isinstance(datos, dict) and 'normas' in datos:
+        datos = datos['normas']
+    return datos if isinstance(datos, list) else [datos]
+
+
+def _limpiar_campos(modelo, datos, campos, errores):
+    """Aplica Field.clean() (tipos, rangos, choices, longitudes) a cada campo mapeado"""
+    limpios = {}
+    for clave, (nombre_campo, por_defecto) in campos.items():
+        valor = datos.get(clave, por_defecto)
+        if valor is None:
+            errores[clave] = ['Este campo es obligatorio.']
+            continue
+        if isinstance(valor, float):
+            # Evita 12.1 -> 12.0999999... en los DecimalField
+            valor = str(valor)
+        try:
+            limpios[nombre_campo] = modelo._meta.get_field(nombre_campo).clean(valor, None)
+        except ValidationError as e:
+            errores[clave] = e.messages
+    return limpios
+
+
+def _validar_lista(datos, clave, validar_elemento, errores):
+    """Valida la lista datos[clave] elemento por elemento, incluidos los nombres repetidos"""
+    elementos = datos.get(clave) or []
+    if not isinstance(elementos, list):
+        errores[clave] = ['Se esperaba una lista.']
+        return []
+    validos, nombres = [], set()
+    for indice, elemento in enumerate(elementos):
+        errores_elemento = {}
+        if not isinstance(elemento, dict):
+            errores_elemento['non_field_errors'] = ['Se esperaba un objeto.']
+        else:
+            limpio = validar_elemento(elemento, errores_elemento)
+            limpio.setdefault('orden', indice + 1)
+            nombre = limpio.get('nombre')
+            if nombre is not None:
+                if nombre in nombres:
+                    errores_elemento['nombre'] = ['Nombre repetido.']
+                nombres.add(nombre)
+            validos.append(limpio)
+        if errores_elemento:
+            errores.setdefault(clave, {})[indice] = errores_elemento
+    return validos
+
+
+def _validar_subcaracteristica(datos, errores):
+    subcaracteristica = _limpiar_campos(SubCaracteristica, datos, CAMPOS_SUBCARACTERISTICA, errores)
+    if 'orden' in datos:
+        _orden(datos, subcaracteristica, SubCaracteristica, errores)
+    return subcaracteristica
+
+
+def _validar_caracteristica(datos, errores):
+    caracteristica = _limpiar_campos(Caracteristica, datos, CAMPOS_CARACTERISTICA, errores)
+    if 'orden' in datos:
+        _orden(datos, caracteristica, Caracteristica, errores)
+    caracteristica['subcaracteristicas'] = _validar_lista(
+        datos, 'subcaracteristicas', _validar_subcaracteristica, errores
+    )
+    return caracteristica
+
+
+def _orden(datos, limpio, modelo, errores):
+    try:
+        limpio['orden'] = modelo._meta.get_field('orden').clean(datos['orden'], None)
+    except ValidationError as e:
+        errores['orden'] = e.messages
+
+
+def validar_norma(datos):
+    """
+    Valida la definición completa de una norma sin consultar la base de datos.
+    Retorna (norma, errores); norma incluye 'caracteristicas' con sus 'subcaracteristicas'.
+    """
+    errores = {}
+    if not isinstance(datos, dict):
+        return None, {'non_field_errors': ['Se esperaba un objeto.']}
+
+    norma = _limpiar_campos(Norma, datos, CAMPOS_NORMA, errores)
+    if 'estado' in datos:
+        try:
+            norma['estado'] = Norma._meta.get_field('estado').clean(datos['estado'], None)
+        except ValidationError as e:
+            errores['estado'] = e.messages
+    norma['caracteristicas'] = _validar_lista(datos, 'caracteristicas', _validar_caracteristica, errores)
+
+    if not norma['caracteristicas'] and 'caracteristicas' not in errores:
+        errores['caracteristicas'] = ['La norma debe tener al menos una característica.']
+    elif 'caracteristicas' not in errores:
+        total = sum(caracteristica['porcentaje_peso'] for caracteristica in norma['caracteristicas'])
+        if abs(total - Decimal('100.00')) >= TOLERANCIA_PESOS:
+            errores['caracteristicas'] = [f'Los porcentajes deben sumar 100%. Total actual: {total}%']
+    return norma, errores
+
+
+def validar_normas(definiciones):
+    """Valida todas las normas del archivo. Retorna ({índice: norma}, {índice: errores})"""
+    validas, errores, claves = {}, {}, set()
+    for indice, datos in enumerate(definiciones):
+        norma, errores_norma = validar_norma(datos)
+        clave = (norma or {}).get('nombre'), (norma or {}).get('version')
+        if None not in clave:
+            if clave in claves:
+                errores_norma['nombre'] = ['Norma repetida en el archivo (mismo nombre y versión).']
+            claves.add(clave)
+        if errores_norma:
+            errores[indice] = errores_norma
+        else:
+            validas[indice] = norma
+    return validas, errores
+
+
+def _asignar_cambios(instancia, datos):
+    """Asigna a la instancia los valores que difieren; retorna True si cambió algo"""
+    cambios = False
+    for campo, valor in datos.items():
+        if getattr(instancia, campo) != valor:
+            setattr(instancia, campo, valor)
+            cambios = True
+    return cambios
+
+
+def _sin_hijos(datos, hijos):
+    return {campo: valor for campo, valor in datos.items() if campo != hijos}
+
+
+def _insertar_norma(definicion, existente, usuario, reporte):
+    """Crea o actualiza una norma con su árbol; bulk_create/bulk_update por nivel"""
+    estado = definicion.pop('estado', None)
+    caracteristicas = definicion.pop('caracteristicas')
+
+    if existente is None:
+        # Se crea en borrador y se aprueba al final, con el árbol completo
+        norma = Norma.objects.create(creado_por=usuario, **definicion)
+        reporte['normas_creadas'] += 1
+        actuales, subcaracteristicas_actuales, cambio = {}, {}, True
+    else:
+        norma = existente
+        cambio = _asignar_cambios(norma, definicion)
+        actuales = {caracteristica.nombre: caracteristica for caracteristica in norma.caracteristicas.all()}
+        subcaracteristicas_actuales = {
+            (sub.caracteristica_id, sub.nombre): sub
+            for sub in SubCaracteristica.objects.filter(caracteristica__norma=norma)
+        }
+
+    nuevas, modificadas = [], []
+    for datos in caracteristicas:
+        caracteristica = actuales.get(datos['nombre'])
+        if caracteristica is None:
+            nuevas.append(Caracteristica(norma=norma, **_sin_hijos(datos, 'subcaracteristicas')))
+        elif _asignar_cambios(caracteristica, _sin_hijos(datos, 'subcaracteristicas')):
+            modificadas.append(caracteristica)
+    Caracteristica.objects.bulk_create(nuevas)
+    Caracteristica.objects.bulk_update(modificadas, list(CAMPOS_CARACTERISTICA) + ['orden'])
+    por_nombre = {**actuales, **{caracteristica.nombre: caracteristica for caracteristica in nuevas}}
+
+    subcaracteristicas_nuevas, subcaracteristicas_modificadas = [], []
+    for datos in caracteristicas:
+        caracteristica = por_nombre[datos['nombre']]
+        for sub_datos in datos['subcaracteristicas']:
+            sub = subcaracteristicas_actuales.get((caracteristica.pk, sub_datos['nombre']))
+            if sub is None:
+                subcaracteristicas_nuevas.append(SubCaracteristica(caracteristica=caracteristica, **sub_datos))
+            elif _asignar_cambios(sub, sub_datos):
+                subcaracteristicas_modificadas.append(sub)
+    SubCaracteristica.objects.bulk_create(subcaracteristicas_nuevas)
+    SubCaracteristica.objects.bulk_update(
+        subcaracteristicas_modificadas, list(CAMPOS_SUBCARACTERISTICA) + ['orden']
+    )
+
+    reporte['caracteristicas_creadas'] += len(nuevas)
+    reporte['caracteristicas_actualizadas'] += len(modificadas)
+    reporte['subcaracteristicas_creadas'] += len(subcaracteristicas_nuevas)
+    reporte['subcaracteristicas_actualizadas'] += len(subcaracteristicas_modificadas)
+    estructura_cambio = bool(nuevas or modificadas or subcaracteristicas_nuevas or subcaracteristicas_modificadas)
+
+    if existente is not None and (cambio or estructura_cambio):
+        reporte['normas_actualizadas'] += 1
+        if norma.estado == 'aprobada':
+            # bulk_* no dispara las señales: misma regla que editar una norma aprobada. Con
+            # la norma en borrador, aprobarla abajo congela la versión nueva.
+            Norma.registrar_edicion_estructura(norma.pk)
+            norma.estado = 'borrador'
+            cambio = True
+    if estado is not None and norma.estado != estado:
+        norma.estado = estado
+        cambio = True
+    if cambio:
+        # save() congela una versión nueva si la norma queda aprobada
+        norma.save()
+    elif estructura_cambio:
+        # Invalida lo que depende de la norma (fecha_actualizacion, señales post_save)
+        norma.save(update_fields=['fecha_actualizacion'])
+    return norma
+
+
+def _validar_pesos_resultantes(normas, existentes, errores):
+    """
+    Los pesos de las normas existentes deben sumar 100 % en el árbol que queda tras el
+    upsert: los del archivo más los de las características que no se mencionan.
+    """
+    conservadas = {}
+    for norma_id, nombre, peso in Caracteristica.objects.filter(
+        norma__in=existentes.values()
+    ).values_list('norma_id', 'nombre', 'porcentaje_peso'):
+        conservadas.setdefault(norma_id, {})[nombre] = peso
+    for indice, norma in normas.items():
+        existente = existentes.get((norma['nombre'], norma['version']))
+        if existente is None:
+            continue
+        del_archivo = {caracteristica['nombre'] for caracteristica in norma['caracteristicas']}
+        fuera = {
+            nombre: peso for nombre, peso in conservadas.get(existente.pk, {}).items()
+            if nombre not in del_archivo
+        }
+        total = sum(caracteristica['porcentaje_peso'] for caracteristica in norma['caracteristicas'])
+        total += sum(fuera.values(), Decimal('0'))
+        if abs(total - Decimal('100.00')) >= TOLERANCIA_PESOS:
+            errores[indice] = {'caracteristicas': [
+                f'Los porcentajes deben sumar 100% en la norma resultante; se conservan '
+                f'{", ".join(sorted(fuera))}, que no están en el archivo. Total resultante: {total}%'
+            ]}
+
+
+def importar_normas(definiciones, actualizar=False, simular=False, usuario=None):
+    """
+    Valida e importa las normas del archivo en una sola transacción. Si alguna definición
+    no es válida (o ya existe y no se pidió actualizar) no se escribe nada. Retorna el reporte:
+    {'normas_validas', 'normas_creadas', ..., 'total_errores', 'errores': {índice: errores}}
+    """
+    reporte = {
+        'normas_validas': 0,
+        'normas_creadas': 0,
+        'normas_actualizadas': 0,
+        'caracteristicas_creadas': 0,
+        'caracteristicas_actualizadas': 0,
+        'subcaracteristicas_creadas': 0,
+        'subcaracteristicas_actualizadas': 0,
+        'total_errores': 0,
+        'errores': {},
+    }
+    normas, errores = validar_normas(definiciones)
+
+    existentes = {}
+    if normas:
+        claves = {(norma['nombre'], norma['version']) for norma in normas.values()}
+        for norma in Norma.objects.filter(nombre__in={nombre for nombre, _ in claves}):
+            if (norma.nombre, norma.version) in claves:
+                existentes[(norma.nombre, norma.version)] = norma
+    if existentes and not actualizar:
+        for indice, norma in normas.items():
+            if (norma['nombre'], norma['version']) in existentes:
+                errores[indice] = {'nombre': [
+                    'Ya existe una norma con este nombre y versión (use el modo actualizar).'
+                ]}
+    elif existentes:
+        _validar_pesos_resultantes(normas, existentes, errores)
+
+    reporte['normas_validas'] = len(definiciones) - len(errores)
+    if errores:
+        reporte['total_errores'] = len(errores)
+        reporte['errores'] = errores
+        return reporte
+    if simular:
+        return reporte
+
+    with transaction.atomic():
+        for definicion in normas.values():
+            existente = existentes.get((definicion['nombre'], definicion['version']))
+            _insertar_norma(definicion, existente, usuario, reporte)
+    return reporte
@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from normas.importacion import FORMATOS_IMPORTACION, importar_normas, leer_definicion
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa normas completas (características, pesos, subcaracterísticas y criterios) '
+        'desde un archivo YAML o JSON. Valida todo el archivo antes de escribir e inserta '
+        'cada nivel con bulk_create en una sola transacción.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .yaml, .yml o .json')
+        parser.add_argument('--formato', choices=FORMATOS_IMPORTACION, help='Por defecto según la extensión')
+        parser.add_argument(
+            '--actualizar', action='store_true',
+            help='Actualizar las normas existentes (mismo nombre y versión) en lugar de fallar'
+        )
+        parser.add_argument('--simular', action='store_true', help='Solo validar, sin escribir')
+
+    def handle(self, *args, **options):
+        ruta = Path(options['archivo'])
+        formato = options['formato'] or ('json' if ruta.suffix.lower() == '.json' else 'yaml')
+        try:
+            with ruta.open('rb') as archivo:
+                definiciones = leer_definicion(archivo, formato)
+            reporte = importar_normas(definiciones, actualizar=options['actualizar'], simular=options['simular'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+        if reporte['total_errores']:
+            raise CommandError(
+                'El archivo no es válido; no se importó nada:\n'
+                + json.dumps(reporte['errores'], ensure_ascii=False, indent=2)
+            )
+
+        for clave, valor in reporte.items():
+            if clave not in ('total_errores', 'errores'):
+                self.stdout.write(f'  {clave}: {valor}')
+        mensaje = 'Archivo válido (simulación, no se escribió nada)' if options['simular'] else 'Importación completada'
+        self.stdout.write(self.style.SUCCESS(mensaje))
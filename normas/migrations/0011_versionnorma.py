@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 01:55
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('normas', '0010_alter_caracteristica_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionNorma',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(verbose_name='Número de versión')),
+                ('contenido', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Árbol de la norma')),
+                ('hash_contenido', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256 del contenido')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('norma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versiones', to='normas.norma')),
+            ],
+            options={
+                'verbose_name': 'Versión de norma',
+                'verbose_name_plural': 'Versiones de normas',
+                'ordering': ['norma', '-numero'],
+                'unique_together': {('norma', 'numero')},
+            },
+        ),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
+import hashlib
+import json
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from empresa.models import Empresa
 from django.core.validators import MaxValueValidator,MinValueValidator
 from decimal import Decimal
@@ -44,6 +50,67 @@ class Norma(models.Model):
         """Valida que los porcentajes de características sumen 100%"""
         total = sum(car.porcentaje_peso for car in self.caracteristicas.all())
         return abs(total - Decimal('100.00')) < Decimal('0.01')  # Tolerancia de 0.01%
+    
+    def save(self, *args, **kwargs):
+        if self.estado != 'aprobada':
+            return super().save(*args, **kwargs)
+        # Al pasar a aprobada se congela la versión; guardar otros campos de una norma
+        # que ya estaba aprobada no recalcula el árbol
+        with transaction.atomic():
+            anterior = None
+            if self.pk is not None and not self._state.adding:
+                anterior = (
+                    Norma.objects.select_for_update()
+                    .filter(pk=self.pk).values_list('estado', flat=True).first()
+                )
+            super().save(*args, **kwargs)
+            if anterior != 'aprobada':
+                self.congelar()
+    
+    def congelar(self, usuario=None):
+        """
+        Congela el árbol actual de la norma en una VersionNorma inmutable y la retorna.
+        Si el contenido es igual al de la última versión, retorna esa versión.
+        """
+        from .arbol import CAMPOS_VERSION, arbol_norma
+        
+        contenido = {
+            'nombre': self.nombre,
+            'descripcion': self.descripcion,
+            'version': self.version,
+            'caracteristicas': arbol_norma(self, CAMPOS_VERSION),
+        }
+        hash_contenido = VersionNorma.calcular_hash(contenido)
+        with transaction.atomic():
+            # El bloqueo de la norma serializa dos aprobaciones simultáneas: la segunda ve
+            # la versión de la primera y no choca con (norma, numero)
+            Norma.objects.select_for_update().only('pk').get(pk=self.pk)
+            ultima = self.versiones.order_by('-numero').first()
+            if ultima is not None and ultima.hash_contenido == hash_contenido:
+                return ultima
+            return VersionNorma.objects.create(
+                norma=self,
+                numero=ultima.numero + 1 if ultima else 1,
+                contenido=contenido,
+                hash_contenido=hash_contenido,
+                creado_por=usuario,
+            )
+    
+    def version_vigente(self):
+        """Última versión congelada de la norma (None si nunca se aprobó)"""
+        return self.versiones.order_by('-numero').first()
+    
+    @classmethod
+    def registrar_edicion_estructura(cls, norma_id):
+        """
+        Editar la estructura cuenta como modificación de la norma (fecha_actualizacion, que
+        usan el ETag y Last-Modified) y una norma aprobada pasa a borrador: sus versiones
+        congeladas no cambian y al aprobarla de nuevo se congela una versión nueva.
+        """
+        cls.objects.filter(pk=norma_id).update(
+            fecha_actualizacion=timezone.now(),
+            estado=Case(When(estado='aprobada', then=Value('borrador')), default=F('estado')),
+        )
 
 class Caracteristica(models.Model):
     norma = models.ForeignKey(Norma, on_delete=models.CASCADE, related_name='caracteristicas')
@@ -121,3 +188,54 @@ class SubCaracteristica(models.Model):
     def __str__(self):
         return f"{self.caracteristica.nombre} - {self.nombre}"
 
+
+
+class VersionNorma(models.Model):
+    """
+    Versión inmutable de una norma aprobada: el árbol completo (características y
+    subcaracterísticas) serializado en una fila, con el hash de su contenido. Las
+    evaluaciones leen la estructura de aquí en lugar de recorrer las tres tablas.
+    """
+    norma = models.ForeignKey(Norma, on_delete=models.CASCADE, related_name='versiones')
+    numero = models.PositiveIntegerField(verbose_name="Número de versión")
+    contenido = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Árbol de la norma")
+    hash_contenido = models.CharField(max_length=64, db_index=True, verbose_name="SHA-256 del contenido")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    creado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
+    class Meta:
+        verbose_name = "Versión de norma"
+        verbose_name_plural = "Versiones de normas"
+        ordering = ['norma', '-numero']
+        unique_together = ['norma', 'numero']
+
+    def __str__(self):
+        return f"{self.norma_id} v{self.numero}"
+
+    @staticmethod
+    def calcular_hash(contenido):
+        """SHA-256 de la serialización canónica (claves ordenadas, sin espacios)"""
+        canonico = json.dumps(contenido, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonico.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Las versiones congeladas de una norma no se modifican.")
+        super().save(*args, **kwargs)
+
+    @property
+    def caracteristicas(self):
+        return self.contenido['caracteristicas']
+
+    def ids_estructura(self):
+        """{caracteristica_id: {subcaracteristica_id, ...}} de la versión"""
+        return {
+            caracteristica['id']: {sub['id'] for sub in caracteristica['subcaracteristicas']}
+            for caracteristica in self.caracteristicas
+        }
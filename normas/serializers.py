@@ -1,8 +1,53 @@
+from django.db import models
+from django.db.models import Count
 from rest_framework import serializers
-from .models import Norma, Caracteristica, SubCaracteristica
+from .arbol import CAMPOS_PLANTILLA, arbol_norma
+from .models import Norma, Caracteristica, SubCaracteristica, VersionNorma
+from API_C.campos import CamposDinamicosMixin
+
+
+def asignar_conteos(instancias, atributo, relacion):
+    """
+    Asigna a cada instancia `atributo` = número de objetos de `relacion`, sin consultas
+    si ya viene anotado o prefetcheado y con una sola consulta agrupada para el resto.
+    """
+    instancias = list(instancias)
+    pendientes = []
+    for instancia in instancias:
+        if hasattr(instancia, atributo):
+            continue
+        prefetch = getattr(instancia, '_prefetched_objects_cache', {})
+        if relacion in prefetch:
+            setattr(instancia, atributo, len(prefetch[relacion]))
+        else:
+            pendientes.append(instancia)
+    
+    if pendientes:
+        modelo = pendientes[0]._meta.model
+        conteos = dict(
+            modelo.objects.filter(pk__in=[instancia.pk for instancia in pendientes])
+            .annotate(total=Count(relacion))
+            .values_list('pk', 'total')
+        )
+        for instancia in pendientes:
+            setattr(instancia, atributo, conteos.get(instancia.pk, 0))
+    return instancias
+
+
+class ConteosListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer que calcula el conteo del hijo para todas las filas de una vez
+    (atributo `conteo` = (atributo, relacion) del hijo) en lugar de un COUNT por fila.
+    """
+    
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        atributo, relacion = self.child.conteo
+        return super().to_representation(asignar_conteos(data, atributo, relacion))
 
 # ✅ SERIALIZERS BÁSICOS (sin anidación)
-class SubCaracteristicaSimpleSerializer(serializers.ModelSerializer):
+class SubCaracteristicaSimpleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simple para subcaracterísticas (sin relaciones)"""
     class Meta:
         model = SubCaracteristica
@@ -11,9 +56,10 @@ class SubCaracteristicaSimpleSerializer(serializers.ModelSerializer):
             'orden', 'es_obligatoria'
         ]
 
-class CaracteristicaSimpleSerializer(serializers.ModelSerializer):
+class CaracteristicaSimpleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simple para características (sin relaciones)"""
-    numero_subcaracteristicas = serializers.ReadOnlyField(source='get_numero_subcaracteristicas')
+    numero_subcaracteristicas = serializers.SerializerMethodField()
+    conteo = ('numero_subcaracteristicas', 'subcaracteristicas')
     
     class Meta:
         model = Caracteristica
@@ -21,10 +67,19 @@ class CaracteristicaSimpleSerializer(serializers.ModelSerializer):
             'id', 'nombre', 'descripcion', 'porcentaje_peso', 
             'orden', 'es_obligatoria', 'numero_subcaracteristicas'
         ]
+        list_serializer_class = ConteosListSerializer
+        # El conteo viene anotado o lo calcula asignar_conteos(): no lee columnas
+        dependencias = {'numero_subcaracteristicas': []}
+    
+    def get_numero_subcaracteristicas(self, obj):
+        # Anotado en el queryset o asignado por ConteosListSerializer
+        asignar_conteos([obj], *self.conteo)
+        return obj.numero_subcaracteristicas
 
-class NormaSimpleSerializer(serializers.ModelSerializer):
+class NormaSimpleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simple para normas (sin relaciones)"""
     numero_caracteristicas = serializers.SerializerMethodField()
+    conteo = ('numero_caracteristicas', 'caracteristicas')
     
     class Meta:
         model = Norma
@@ -32,12 +87,16 @@ class NormaSimpleSerializer(serializers.ModelSerializer):
             'id', 'nombre', 'descripcion', 'version', 'estado',
             'fecha_creacion', 'fecha_actualizacion', 'numero_caracteristicas'
         ]
+        list_serializer_class = ConteosListSerializer
+        dependencias = {'numero_caracteristicas': []}
     
     def get_numero_caracteristicas(self, obj):
-        return obj.caracteristicas.count()
+        # Anotado en el queryset o asignado por ConteosListSerializer
+        asignar_conteos([obj], *self.conteo)
+        return obj.numero_caracteristicas
 
 # ✅ SERIALIZERS CON DATOS ANIDADOS (solo para casos específicos)
-class SubCaracteristicaDetailSerializer(serializers.ModelSerializer):
+class SubCaracteristicaDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer completo para subcaracterísticas"""
     caracteristica_nombre = serializers.CharField(source='caracteristica.nombre', read_only=True)
     
@@ -48,7 +107,7 @@ class SubCaracteristicaDetailSerializer(serializers.ModelSerializer):
             'descripcion', 'criterios_evaluacion', 'orden', 'es_obligatoria'
         ]
 
-class CaracteristicaDetailSerializer(serializers.ModelSerializer):
+class CaracteristicaDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer completo para características CON subcaracterísticas"""
     subcaracteristicas = SubCaracteristicaSimpleSerializer(many=True, read_only=True)
     norma_nombre = serializers.CharField(source='norma.nombre', read_only=True)
@@ -60,7 +119,7 @@ class CaracteristicaDetailSerializer(serializers.ModelSerializer):
             'porcentaje_peso', 'orden', 'es_obligatoria', 'subcaracteristicas'
         ]
 
-class NormaDetailSerializer(serializers.ModelSerializer):
+class NormaDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer completo para normas CON características y subcaracterísticas"""
     caracteristicas = CaracteristicaDetailSerializer(many=True, read_only=True)
     creado_por_nombre = serializers.CharField(source='creado_por.get_full_name', read_only=True)
@@ -73,13 +132,14 @@ class NormaDetailSerializer(serializers.ModelSerializer):
             'fecha_creacion', 'fecha_actualizacion', 'creado_por', 'creado_por_nombre',
             'caracteristicas', 'porcentajes_validos'
         ]
+        dependencias = {'porcentajes_validos': ['caracteristicas']}
     
     def get_porcentajes_validos(self, obj):
         """Verificar que los porcentajes sumen 100%"""
         return obj.validar_porcentajes()
 
 # ✅ SERIALIZERS PARA LISTAS (ultra-optimizados)
-class NormaListSerializer(serializers.ModelSerializer):
+class NormaListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer optimizado para listados de normas"""
     numero_caracteristicas = serializers.IntegerField(read_only=True)  # Anotado en queryset
     creado_por_nombre = serializers.CharField(source='creado_por.get_full_name', read_only=True)
@@ -91,7 +151,7 @@ class NormaListSerializer(serializers.ModelSerializer):
             'numero_caracteristicas', 'creado_por_nombre'
         ]
 
-class CaracteristicaListSerializer(serializers.ModelSerializer):
+class CaracteristicaListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer optimizado para listados de características"""
     norma_nombre = serializers.CharField(source='norma.nombre', read_only=True)
     numero_subcaracteristicas = serializers.IntegerField(read_only=True)  # Anotado en queryset
@@ -104,37 +164,27 @@ class CaracteristicaListSerializer(serializers.ModelSerializer):
         ]
 
 # ✅ SERIALIZERS PARA CASOS ESPECÍFICOS
-class NormaPlantillaSerializer(serializers.ModelSerializer):
+class NormaPlantillaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer específico para generar plantillas de evaluación"""
     caracteristicas_obligatorias = serializers.SerializerMethodField()
     
     class Meta:
         model = Norma
         fields = ['id', 'nombre', 'descripcion', 'version', 'caracteristicas_obligatorias']
+        dependencias = {'caracteristicas_obligatorias': ['caracteristicas']}
     
     def get_caracteristicas_obligatorias(self, obj):
         """Solo características obligatorias con sus subcaracterísticas obligatorias"""
-        caracteristicas = obj.caracteristicas.filter(es_obligatoria=True).order_by('orden')
-        resultado = []
-        
-        for car in caracteristicas:
-            subcaracteristicas = car.subcaracteristicas.filter(es_obligatoria=True).order_by('orden')
-            resultado.append({
-                'id': car.id,
-                'nombre': car.nombre,
-                'descripcion': car.descripcion,
-                'porcentaje_peso': car.porcentaje_peso,
-                'subcaracteristicas': [
-                    {
-                        'id': sub.id,
-                        'nombre': sub.nombre,
-                        'descripcion': sub.descripcion,
-                        'criterios_evaluacion': sub.criterios_evaluacion
-                    }
-                    for sub in subcaracteristicas
-                ]
-            })
-        return resultado
+        # Consume el prefetch de prefetch_arbol(solo_obligatorias=True) si la norma lo trae
+        return arbol_norma(obj, CAMPOS_PLANTILLA, solo_obligatorias=True)
+
+class VersionNormaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """Metadatos de una versión congelada de la norma (sin el árbol)"""
+    
+    class Meta:
+        model = VersionNorma
+        fields = ['id', 'norma', 'numero', 'hash_contenido', 'fecha_creacion', 'creado_por']
+        read_only_fields = fields
 
 # ✅ SERIALIZER PARA VALIDACIÓN DE PORCENTAJES
 class ValidarPorcentajesSerializer(serializers.Serializer):
@@ -0,0 +1,14 @@
+# normas/signals.py
+from .models import Caracteristica, Norma
+
+
+def editar_estructura_norma(sender, instance, raw=False, **kwargs):
+    """Editar la estructura actualiza la norma y, si estaba aprobada, la devuelve a borrador (ver Norma.registrar_edicion_estructura)"""
+    if raw:
+        return
+    if isinstance(instance, Caracteristica):
+        Norma.registrar_edicion_estructura(instance.norma_id)
+    else:
+        Norma.registrar_edicion_estructura(
+            Caracteristica.objects.filter(pk=instance.caracteristica_id).values('norma_id')[:1]
+        )
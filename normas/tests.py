@@ -1,3 +1,277 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from users.models import CustomUser
+
+from .models import Norma, Caracteristica, SubCaracteristica
+
+
+class ArbolNormaConsultasTests(TestCase):
+    """El árbol de la norma se arma con un número constante de consultas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create(
+            document='1', first_name='Ana', last_name='Pérez', email='ana@example.com', phone='1'
+        )
+        for indice in range(5):
+            cls.crear_norma(f'Norma {indice}')
+
+    @staticmethod
+    def crear_norma(nombre, caracteristicas=4, subcaracteristicas=3):
+        norma = Norma.objects.create(nombre=nombre, descripcion='d', version='1')
+        for orden in range(caracteristicas, 0, -1):
+            caracteristica = Caracteristica.objects.create(
+                norma=norma, nombre=f'C{orden}', descripcion='d', orden=orden,
+                es_obligatoria=orden != 2
+            )
+            for sub_orden in range(subcaracteristicas, 0, -1):
+                SubCaracteristica.objects.create(
+                    caracteristica=caracteristica, nombre=f'S{sub_orden}', descripcion='d',
+                    orden=sub_orden, es_obligatoria=sub_orden != 1
+                )
+        norma.estado = 'aprobada'
+        norma.save()
+        return norma
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_plantillas_consultas_constantes(self):
+        # Normas + características + subcaracterísticas, sin importar cuántas normas haya
+        with self.assertNumQueries(3):
+            respuesta = self.client.get('/api/normas/plantillas/')
+        self.crear_norma('Norma extra', caracteristicas=8)
+        with self.assertNumQueries(3):
+            respuesta = self.client.get('/api/normas/plantillas/')
+
+        plantillas = respuesta.json()['plantillas_disponibles']
+        self.assertEqual(len(plantillas), 6)
+        caracteristicas = plantillas[0]['caracteristicas_obligatorias']
+        # Solo obligatorias, en orden
+        self.assertEqual([c['nombre'] for c in caracteristicas], ['C1', 'C3', 'C4'])
+        self.assertEqual([s['nombre'] for s in caracteristicas[0]['subcaracteristicas']], ['S2', 'S3'])
+
+    def test_plantilla_evaluacion_consultas_constantes(self):
+        norma = self.crear_norma('Grande', caracteristicas=10, subcaracteristicas=10)
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(f'/api/normas/normas/{norma.pk}/plantilla/')
+        self.assertEqual(len(respuesta.json()['caracteristicas_obligatorias']), 9)
+
+    def test_estructura_para_evaluacion_desde_version(self):
+        norma = self.crear_norma('Grande', caracteristicas=10, subcaracteristicas=10)
+        # Una sola fila: la versión congelada
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(f'/api/evaluaciones/norma/{norma.pk}/estructura/')
+        caracteristicas = respuesta.json()['caracteristicas']
+        # Todas las características y subcaracterísticas, en orden
+        self.assertEqual([c['orden'] for c in caracteristicas], list(range(1, 11)))
+        self.assertEqual([s['orden'] for s in caracteristicas[0]['subcaracteristicas']], list(range(1, 11)))
+
+    def test_subcaracteristicas_por_cursor(self):
+        ids, url = [], '/api/normas/subcaracteristicas/?page_size=7&conteo=no'
+        while url:
+            datos = self.client.get(url).json()
+            self.assertNotIn('count', datos)
+            ids.extend(sub['id'] for sub in datos['results'])
+            url = datos['next']
+        # Todas, sin repetir, en el orden de siempre
+        esperado = list(SubCaracteristica.objects.order_by(
+            'caracteristica__orden', 'caracteristica_id', 'orden', 'id'
+        ).values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+        # Por ahora el cursor envía count si no se pide ?conteo=no
+        datos = self.client.get('/api/normas/subcaracteristicas/?page_size=7').json()
+        self.assertEqual((datos['count'], datos['count_estimado']), (60, False))
+        # El modo por páginas sigue disponible
+        self.assertEqual(self.client.get('/api/normas/subcaracteristicas/?page=2').json()['count'], 60)
+
+    def test_campos_a_demanda_reducen_la_consulta(self):
+        norma = Norma.objects.first()
+        # Sin características ni subcaracterísticas: ni prefetch ni columnas de más
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(f'/api/normas/normas/{norma.pk}/?fields=id,nombre')
+        self.assertEqual(respuesta.json(), {'id': norma.pk, 'nombre': norma.nombre})
+        respuesta = self.client.get(f'/api/normas/normas/{norma.pk}/?omit=caracteristicas,creado_por_nombre')
+        self.assertNotIn('caracteristicas', respuesta.json())
+        self.assertIn('porcentajes_validos', respuesta.json())
+
+    def test_consulta_condicional(self):
+        norma = Norma.objects.first()
+        url = f'/api/normas/normas/{norma.pk}/'
+        etag = self.client.get(url)['ETag']
+        # Sin cambios: 304 con solo la fecha de la norma, sin serializar
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        listado = self.client.get('/api/normas/normas/')['ETag']
+        self.assertEqual(self.client.get('/api/normas/normas/', HTTP_IF_NONE_MATCH=listado).status_code, 304)
+        # Cada representación tiene su ETag: no se responde 304 con el cuerpo de otra
+        parcial = self.client.get(f'{url}?fields=nombre')['ETag']
+        self.assertNotEqual(parcial, etag)
+        self.assertNotEqual(self.client.get(f'{url}?omit=caracteristicas')['ETag'], etag)
+        self.assertEqual(self.client.get(f'{url}?fields=nombre', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(f'{url}?fields=nombre', HTTP_IF_NONE_MATCH=parcial).status_code, 304)
+
+        # Editar la estructura cambia la norma
+        SubCaracteristica.objects.filter(caracteristica__norma=norma).first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/normas/normas/', HTTP_IF_NONE_MATCH=listado).status_code, 200)
+        # Escribir sobre una versión vieja: 412
+        self.client.force_authenticate(CustomUser.objects.create(
+            document='2', first_name='Admin', last_name='A', email='admin@example.com', phone='2',
+            is_staff=True
+        ))
+        respuesta = self.client.patch(url, {'descripcion': 'x'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 412)
+
+    def test_sin_prefetch_dos_consultas(self):
+        from .arbol import CAMPOS_EVALUACION, arboles_normas
+
+        normas = list(Norma.objects.all())
+        with self.assertNumQueries(2):
+            arboles = arboles_normas(normas, CAMPOS_EVALUACION)
+        self.assertEqual(sum(len(arbol) for arbol in arboles.values()), 20)
+
+
+class VersionNormaTests(TestCase):
+    """Las normas aprobadas se congelan en versiones inmutables"""
+
+    def setUp(self):
+        self.norma = ArbolNormaConsultasTests.crear_norma('ISO', caracteristicas=2, subcaracteristicas=2)
+
+    def test_aprobar_congela_una_version(self):
+        version = self.norma.version_vigente()
+        self.assertEqual(version.numero, 1)
+        self.assertEqual(len(version.caracteristicas), 2)
+        # Guardar sin cambios no crea otra versión
+        self.norma.save()
+        self.assertEqual(self.norma.versiones.count(), 1)
+        with self.assertRaises(ValueError):
+            version.save()
+
+    def test_guardar_aprobada_no_recalcula_el_arbol(self):
+        self.norma.descripcion = 'Otra descripción'
+        with CaptureQueriesContext(connection) as consultas:
+            self.norma.save()
+        self.assertFalse(any('normas_caracteristica' in q['sql'] for q in consultas.captured_queries))
+        self.assertEqual(self.norma.versiones.count(), 1)
+
+    def test_editar_estructura_crea_borrador_y_nueva_version(self):
+        caracteristica = self.norma.caracteristicas.first()
+        caracteristica.nombre = 'Cambiada'
+        caracteristica.save()
+
+        self.norma.refresh_from_db()
+        self.assertEqual(self.norma.estado, 'borrador')
+        # La versión aprobada no cambia
+        version = self.norma.version_vigente()
+        self.assertNotIn('Cambiada', [c['nombre'] for c in version.caracteristicas])
+
+        self.norma.estado = 'aprobada'
+        self.norma.save()
+        nueva = self.norma.version_vigente()
+        self.assertEqual(nueva.numero, 2)
+        self.assertNotEqual(nueva.hash_contenido, version.hash_contenido)
+        self.assertIn('Cambiada', [c['nombre'] for c in nueva.caracteristicas])
+
+
+class ImportacionNormasTests(TestCase):
+    """Importación de normas desde YAML/JSON: validación previa e idempotencia"""
+
+    DEFINICION = {
+        'nombre': 'ISO/IEC 25010',
+        'version': 2011,
+        'descripcion': 'Modelo de calidad',
+        'estado': 'aprobada',
+        'caracteristicas': [
+            {
+                'nombre': 'Adecuación funcional', 'descripcion': 'd', 'porcentaje_peso': 60.5,
+                'subcaracteristicas': [
+                    {'nombre': 'Completitud', 'descripcion': 'd', 'criterios_evaluacion': 'c'},
+                    {'nombre': 'Corrección', 'descripcion': 'd'},
+                ],
+            },
+            {
+                'nombre': 'Eficiencia', 'descripcion': 'd', 'porcentaje_peso': 39.5,
+                'subcaracteristicas': [{'nombre': 'Tiempo', 'descripcion': 'd'}],
+            },
+        ],
+    }
+
+    def test_importar_y_reimportar_sin_cambios(self):
+        from copy import deepcopy
+        from .importacion import importar_normas
+
+        reporte = importar_normas([deepcopy(self.DEFINICION)])
+        self.assertEqual(reporte['total_errores'], 0)
+        self.assertEqual(reporte['subcaracteristicas_creadas'], 3)
+        norma = Norma.objects.get(version='2011')
+        self.assertEqual(norma.versiones.count(), 1)
+
+        # Sin actualizar, una norma existente es un error; con actualizar no cambia nada
+        self.assertEqual(importar_normas([deepcopy(self.DEFINICION)])['total_errores'], 1)
+        reporte = importar_normas([deepcopy(self.DEFINICION)], actualizar=True)
+        self.assertEqual(reporte['normas_actualizadas'], 0)
+        self.assertEqual(norma.versiones.count(), 1)
+
+    def test_reimportar_norma_aprobada(self):
+        from copy import deepcopy
+        from .importacion import importar_normas
+
+        importar_normas([deepcopy(self.DEFINICION)])
+        norma = Norma.objects.get(version='2011')
+
+        # 'Eficiencia' no viene en el archivo y se conserva: el árbol resultante sumaría 139.5 %
+        definicion = deepcopy(self.DEFINICION)
+        definicion['caracteristicas'][1] = {
+            'nombre': 'Usabilidad', 'descripcion': 'd', 'porcentaje_peso': 39.5, 'subcaracteristicas': []
+        }
+        reporte = importar_normas([definicion], actualizar=True)
+        self.assertEqual(reporte['total_errores'], 1)
+        self.assertIn('Eficiencia', reporte['errores'][0]['caracteristicas'][0])
+        self.assertEqual(norma.caracteristicas.count(), 2)
+
+        definicion['caracteristicas'].append({
+            'nombre': 'Eficiencia', 'descripcion': 'd', 'porcentaje_peso': 0, 'subcaracteristicas': []
+        })
+        reporte = importar_normas([definicion], actualizar=True)
+        self.assertEqual(reporte['total_errores'], 0)
+        norma.refresh_from_db()
+        self.assertTrue(norma.validar_porcentajes())
+        self.assertEqual(norma.estado, 'aprobada')
+        version = norma.version_vigente()
+        self.assertEqual(version.numero, 2)
+        self.assertEqual(
+            sorted(c['nombre'] for c in version.caracteristicas),
+            ['Adecuación funcional', 'Eficiencia', 'Usabilidad']
+        )
+
+        # Sin estado en el archivo, un cambio deja la norma aprobada en borrador
+        del definicion['estado']
+        definicion['descripcion'] = 'Otra descripción'
+        importar_normas([definicion], actualizar=True)
+        norma.refresh_from_db()
+        self.assertEqual(norma.estado, 'borrador')
+        self.assertEqual(norma.versiones.count(), 2)
+
+    def test_errores_no_escriben_nada(self):
+        from copy import deepcopy
+        from .importacion import importar_normas
+
+        definicion = deepcopy(self.DEFINICION)
+        definicion['caracteristicas'][1]['porcentaje_peso'] = 30
+        otra = deepcopy(self.DEFINICION)
+        otra['version'] = '2023'
+        otra['caracteristicas'][0]['subcaracteristicas'][1]['nombre'] = 'Completitud'
+
+        reporte = importar_normas([definicion, otra])
+        self.assertEqual(reporte['total_errores'], 2)
+        self.assertIn('caracteristicas', reporte['errores'][0])
+        self.assertEqual(
+            reporte['errores'][1]['caracteristicas'][0]['subcaracteristicas'][1]['nombre'],
+            ['Nombre repetido.']
+        )
+        self.assertFalse(Norma.objects.exists())
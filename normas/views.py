@@ -1,7 +1,10 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Prefetch
+from django.db import transaction
+from django.db.models import Count, F, Prefetch
+from django.utils import timezone
+from .arbol import prefetch_arbol
 from .models import Norma, Caracteristica, SubCaracteristica
 from .serializers import (
     # Serializers simples
@@ -11,13 +14,18 @@ from .serializers import (
     # Serializers de lista
     NormaListSerializer, CaracteristicaListSerializer,
     # Serializers especiales
-    NormaPlantillaSerializer, ValidarPorcentajesSerializer
+    NormaPlantillaSerializer, ValidarPorcentajesSerializer, VersionNormaSerializer
 )
 from .permissions import IsAdminOrReadOnly, CanManageNorma
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-class NormaViewSet(viewsets.ModelViewSet):
+
+from API_C.campos import CamposDinamicosViewMixin
+from API_C.condicional import ConsultaCondicionalMixin
+from API_C.paginacion import PaginacionCursor
+class NormaViewSet(ConsultaCondicionalMixin, CamposDinamicosViewMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, CanManageNorma]
+    campo_modificacion = 'fecha_actualizacion'
     
     def get_queryset(self):
         """Queryset optimizado según la acción"""
@@ -45,19 +53,10 @@ class NormaViewSet(viewsets.ModelViewSet):
         
         elif self.action == 'plantilla_evaluacion':
             # Para plantillas: solo características y subcaracterísticas obligatorias
-            return base_queryset.prefetch_related(
-                Prefetch(
-                    'caracteristicas',
-                    queryset=Caracteristica.objects.filter(es_obligatoria=True).order_by('orden').prefetch_related(
-                        Prefetch(
-                            'subcaracteristicas',
-                            queryset=SubCaracteristica.objects.filter(es_obligatoria=True).order_by('orden')
-                        )
-                    )
-                )
-            )
+            return base_queryset.prefetch_related(prefetch_arbol(solo_obligatorias=True))
         
-        return base_queryset
+        # Resto de acciones (NormaSimpleSerializer): el conteo viene anotado
+        return base_queryset.annotate(numero_caracteristicas=Count('caracteristicas'))
     
     def get_serializer_class(self):
         """Serializer dinámico según la acción"""
@@ -76,6 +75,37 @@ class NormaViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(norma)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        """
+        Aprobar la norma: congela su estructura en una versión inmutable que usan
+        las evaluaciones. Si el contenido no cambió desde la última versión, se reutiliza.
+        """
+        norma = self.get_object()
+        if not norma.validar_porcentajes():
+            return Response(
+                {'error': 'Los porcentajes de las características deben sumar 100% para aprobar la norma.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            norma.estado = 'aprobada'
+            # save() sin congelar: la versión se crea aquí con el usuario que aprueba
+            Norma.objects.filter(pk=norma.pk).update(estado='aprobada', fecha_actualizacion=timezone.now())
+            version = norma.congelar(usuario=request.user)
+        
+        return Response({
+            'message': 'Norma aprobada',
+            'version': VersionNormaSerializer(version).data
+        })
+    
+    @action(detail=True, methods=['get'])
+    def versiones(self, request, pk=None):
+        """Versiones congeladas de la norma (sin el árbol), de la más reciente a la más antigua"""
+        norma = self.get_object()
+        versiones = norma.versiones.order_by('-numero').defer('contenido')
+        return Response(VersionNormaSerializer(versiones, many=True).data)
+    
     @action(detail=True, methods=['post'])
     def validar_porcentajes(self, request, pk=None):
         """Validar que los porcentajes sumen 100%"""
@@ -120,7 +150,7 @@ class NormaViewSet(viewsets.ModelViewSet):
         
         return Response(estadisticas)
 
-class CaracteristicaViewSet(viewsets.ModelViewSet):
+class CaracteristicaViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     
     def get_queryset(self):
@@ -133,7 +163,8 @@ class CaracteristicaViewSet(viewsets.ModelViewSet):
         elif self.action == 'retrieve':
             return base_queryset.prefetch_related('subcaracteristicas')
         
-        return base_queryset
+        # Resto de acciones (CaracteristicaSimpleSerializer): el conteo viene anotado
+        return base_queryset.annotate(numero_subcaracteristicas=Count('subcaracteristicas'))
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -154,13 +185,19 @@ class CaracteristicaViewSet(viewsets.ModelViewSet):
             'subcaracteristicas': serializer.data
         })
 
-class SubCaracteristicaViewSet(viewsets.ModelViewSet):
+class SubCaracteristicaViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = PaginacionCursor
+    # Mismo orden de siempre (orden de la característica, luego de la subcaracterística),
+    # con desempates únicos para el cursor
+    ordering_cursor = ['orden_caracteristica', 'caracteristica_id', 'orden', 'id']
     
     def get_queryset(self):
         return SubCaracteristica.objects.select_related(
             'caracteristica__norma'
-        ).order_by('caracteristica__orden', 'orden')
+        ).annotate(
+            orden_caracteristica=F('caracteristica__orden')
+        ).order_by('orden_caracteristica', 'caracteristica_id', 'orden')
     
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
@@ -169,7 +206,7 @@ class SubCaracteristicaViewSet(viewsets.ModelViewSet):
     
     def list(self, request, *args, **kwargs):
         """Listado optimizado con filtros"""
-        queryset = self.get_queryset()
+        queryset = self.filter_queryset(self.get_queryset())
         
         # Filtros opcionales
         caracteristica_id = request.query_params.get('caracteristica')
@@ -183,8 +220,9 @@ class SubCaracteristicaViewSet(viewsets.ModelViewSet):
         if solo_obligatorias:
             queryset = queryset.filter(es_obligatoria=True)
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        pagina = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(pagina, many=True)
+        return self.get_paginated_response(serializer.data)
 
 # ✅ VISTA ADICIONAL PARA CASOS ESPECÍFICOS
 class NormasPlantillasView(APIView):
@@ -195,17 +233,7 @@ class NormasPlantillasView(APIView):
         """Obtener plantillas de todas las normas aprobadas"""
         normas = Norma.objects.filter(
             estado='aprobada'
-        ).prefetch_related(
-            Prefetch(
-                'caracteristicas',
-                queryset=Caracteristica.objects.filter(es_obligatoria=True).order_by('orden').prefetch_related(
-                    Prefetch(
-                        'subcaracteristicas',
-                        queryset=SubCaracteristica.objects.filter(es_obligatoria=True).order_by('orden')
-                    )
-                )
-            )
-        )
+        ).prefetch_related(prefetch_arbol(solo_obligatorias=True))
         
         serializer = NormaPlantillaSerializer(normas, many=True)
         return Response({
@@ -1,7 +1,10 @@
 from rest_framework import serializers
+
+from API_C.campos import CamposDinamicosMixin
 from .models import Software
 
-class SoftwareSerializer(serializers.ModelSerializer):
+class SoftwareSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Software
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        expandibles = {'empresa': 'empresa.serializers.EmpresaSerializer'}
\ No newline at end of file
@@ -1,10 +1,14 @@
 from rest_framework import generics
+
+from API_C.campos import CamposDinamicosViewMixin
+from API_C.condicional import ConsultaCondicionalMixin
 from .models import Software
 from .serializers import SoftwareSerializer
 from .permissions import SoftwarePermission
 
-class SoftwareListCreateView(generics.ListCreateAPIView):
+class SoftwareListCreateView(ConsultaCondicionalMixin, CamposDinamicosViewMixin, generics.ListCreateAPIView):
     queryset = Software.objects.all()
+    campo_modificacion = 'fecha_actualizacion'
     serializer_class = SoftwareSerializer
     permission_classes = [SoftwarePermission]
     
@@ -16,7 +20,8 @@ class SoftwareListCreateView(generics.ListCreateAPIView):
             return queryset.filter(empresa=user.empresa)
         return queryset
 
-class SoftwareRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class SoftwareRetrieveUpdateDestroyView(ConsultaCondicionalMixin, CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Software.objects.all()
+    campo_modificacion = 'fecha_actualizacion'
     serializer_class = SoftwareSerializer
     permission_classes = [SoftwarePermission]
\ No newline at end of file